@@ -11,25 +11,44 @@ class Robot:
     maker_bus_base = Maker_Bus_Base(None)
     self.maker_bus_base = maker_bus_base
     self.project = Project(maker_bus_base)
+    self.motors = None
 
   def run(self):
     project = self.project
     motor3_left = project.motor3_left
     motor3_right = project.motor3_right
 
+    # The shadow and the "motors" group are only there when billbot.py
+    # is generated with "project_generate --transactions":
+    if motor3_left.transaction_accessors:
+      # Only send speeds that changed:
+      motor3_left.shadow_enable()
+      motor3_right.shadow_enable()
+
+      # Do not wait for each motor to answer its speed change:
+      motors = project.motors
+      motors.wait = False
+      self.motors = motors
+
     sleep(2.0)
-    motor3_left.speed_set(55)
-    motor3_right.speed_set(55)
+    self.speed_set(55)
     sleep(2.0)
 
     while True:
-      motor3_left.speed_set(55)
-      motor3_right.speed_set(55)
+      self.speed_set(55)
       sleep(1.0)
-      motor3_left.speed_set(0)
-      motor3_right.speed_set(0)
+      self.speed_set(0)
       sleep(1.0)
 
+  def speed_set(self, speed):
+    motors = self.motors
+    if motors != None:
+      motors.call("speed_set", speed)
+    else:
+      project = self.project
+      project.motor3_left.speed_set(speed)
+      project.motor3_right.speed_set(speed)
+
 
 robot = Robot()
 robot.run()
@@ -453,67 +453,27 @@ class Application(Frame):
                     # Get the *Maker_Bus_Module* to use:
                     maker_bus_module = self.maker_bus_module_get(module_use)
                         
-                    # First, start the command:
-                    maker_bus_module.request_begin(module_use.offset + \
-                      function_number)
-
-                    # Second, iterate over all the parameters:
-                    for index in range(parameters_length):
-                        number = number_arguments[index]
-                        parameter = parameters[index]
-                        type = parameter.type
-                        if type == "Byte":
-                            maker_bus_module.request_byte_put(number)
-                        elif type == "Character":
-                            maker_bus_module.request_character_put(chr(number))
-                        elif type == "Logical":
-                            maker_bus_module.request_logical_put(number)
-                        elif type == "Byte":
-                            maker_bus_module.request_byte_put(number)
-                        elif type == "Short":
-                            maker_bus_module.request_short_put(number)
-                        elif type == "Integer":
-                            maker_bus_module.request_integer_put(number)
-                        elif type == "UByte":
-                            maker_bus_module.request_ubyte_put(number)
-                        elif type == "UShort":
-                            maker_bus_module.request_ushort_put(number)
-                        elif type == "UInteger":
-                            maker_bus_module.request_uinteger_put(number)
-                        else:
-                            assert False, "Finish dispatch table"
-
-                    # Third, close of command request:
-                    maker_bus_module.request_end()
-
-                    # Forth: Grab the return values:
+                    # Send the arguments and grab the return values;
+                    # the parameter and result types are dispatched by
+                    # the precompiled codecs for *function*:
+                    try:
+                        results = maker_bus_module.function_call(function,
+                          number_arguments, module_use.offset)
+                    except Maker_Bus_Error as error:
+                        self.warn(str(error))
+                        results = []
+
+                    # A single result comes back on its own:
+                    if results == None:
+                        results = []
+                    elif not isinstance(results, tuple) and \
+                      not isinstance(results, list):
+                        results = [results]
                     prefix = " ;"
-                    results = function.results
                     for result in results:
-                        type = result.type
-                        if type == "Byte":
-                            number = maker_bus_module.response_byte_get()
-                        elif type == "Character":
-                            number = maker_bus_module.response_character_get()
-                        elif type == "Logical":
-                            number = maker_bus_module.response_logical_get()
-                        elif type == "Byte":
-                            number = maker_bus_module.response_byte_get()
-                        elif type == "Short":
-                            number = maker_bus_module.response_short_get()
-                        elif type == "Int":
-                            number = maker_bus_module.response_int_get()
-                        elif type == "UByte":
-                            number = maker_bus_module.response_ubyte_get()
-                        elif type == "UShort":
-                            number = maker_bus_module.response_ushort_get()
-                        elif type == "UInteger":
-                            number = maker_bus_module.response_uinteger_get()
-                        else:
-                            assert False, "Finish dispatch table"
-                        call_entry_text += prefix + str(number)
-
-                    # Fifth, put the final result back:
+                        call_entry_text += prefix + str(result)
+
+                    # Put the final result back:
                     call_entry.delete(0, END)
                     call_entry.insert(0, call_entry_text)
                 else:
@@ -698,31 +658,19 @@ class Application(Frame):
 
             register = self.register_or_function
             assert isinstance(register, Register)
-            type = register.type
-            number = register.number
 
             # Get the *Maker_Bus_Module* to use:
             maker_bus_module = self.maker_bus_module_get(module_use)
 
-            maker_bus_module.request_begin(module_use.offset + number)
-            maker_bus_module.request_end()
-            result = 0
-            if type == "Byte":
-                result = maker_bus_module.response_byte_get()
-            elif type == "Logical":
-                result = int(maker_bus_module.response_logical_get())
-            elif type == "Integer":
-                result = maker_bus_module.response_integer_get()
-            elif type == "Short":
-                result = maker_bus_module.response_short_get()
-            elif type == "UByte":
-                result = maker_bus_module.response_ubyte_get()
-            elif type == "UShort":
-                result = maker_bus_module.response_ushort_get()
-            elif type == "UInteger":
-                result = maker_bus_module.response_uinteger_get()
-            else:
-                assert False, "Type={0}".format(type)
+            try:
+                result = maker_bus_module.register_get(register,
+                  module_use.offset)
+            except Maker_Bus_Error as error:
+                self.warn(str(error))
+                return
+            if isinstance(result, str):
+                result = ord(result)
+            result = int(result)
             get_entry = self.get_entry
             get_entry.delete(0, END)
             get_entry.insert(0, "{0} (0x{0:x})".format(result))
@@ -1086,8 +1034,6 @@ class Application(Frame):
 
             register = self.register_or_function
             assert isinstance(register, Register)
-            type = register.type
-            number = register.number
 
             # Get the *Maker_Bus_Module* to use:
             maker_bus_module = self.maker_bus_module_get(module_use)
@@ -1099,25 +1045,10 @@ class Application(Frame):
 		    # Setting second argument to 0, allows *int* to parse
 		    # hexadecimal constants.  Weird.:
 		    value = int(set_entry_fields[0], 0)
-		    maker_bus_module.request_begin(
-		      module_use.offset + number + 1)
-		    if type == "Byte":
-			result = maker_bus_module.request_byte_put(value)
-		    elif type == "Integer":
-			result = maker_bus_module.request_integer_put(value)
-		    elif type == "Logical":
-			result = maker_bus_module.request_logical_put(value)
-		    elif type == "Short":
-			result = maker_bus_module.request_short_put(value)
-		    elif type == "UByte":
-			result = maker_bus_module.request_ubyte_put(value)
-		    elif type == "UShort":
- 			result = maker_bus_module.request_ushort_put(value)
-		    elif type == "UInteger":
-			result = maker_bus_module.request_uinteger_put(value)
-		    else:
-			assert False
-		    maker_bus_module.request_end()
+		    maker_bus_module.register_set(register, value,
+		      module_use.offset)
+                except Maker_Bus_Error as error:
+                    self.warn(str(error))
                 except ValueError:
 		    self.warn(
 		      "'{0}' is not a valid number".format(set_entry_text))
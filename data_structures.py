@@ -10,6 +10,7 @@
 # Due to the nature of Python, the code generation code currently
 # hangs off individual the individual class objects.
 
+import glob
 import os
 import sys
 import stat
@@ -764,12 +765,26 @@ class Function(Node):
     #  * PTi is the i'th Parameter Type
     #  * RNi is the i'th Result Name
     #  * RTi is the i'th Result Type
+    #
+    # When *transactions* is *True*, the whole call is a single
+    # *Maker_Bus_Module.transaction_call*() instead:
+    #
+    #        def FUNCTION(self, PN1, ..., PNn):
+    #            # BRIEF
+    #            return self.transaction_call(NUMBER, False,
+    #              self.FUNCTION_parameters_codec, (PN1, ..., PNn),
+    #              self.FUNCTION_results_codec)
+    #
+    # where the codecs are class attributes output by *python_codecs_write*.
+    # The call returns the results shaped by *Maker_Bus_Codec.result*()
+    # (or a *Maker_Bus_Future* inside of a *Maker_Bus_Module.batch*()).
 
-    def python_write(self, out_stream):
+    def python_write(self, out_stream, transactions = False):
 	""" *Function*: """
 
         # Check argument types:
         assert isinstance(out_stream, file)
+        assert isinstance(transactions, bool)
 
         # Grab some values from *self*:
         brief = self.brief
@@ -791,6 +806,11 @@ class Function(Node):
         # Output: "// BRIEF"
         out_stream.write("{0:i}# {1}\n\n".format(style, brief))
 
+        if transactions:
+            self.python_transaction_write(out_stream)
+            style.indent_adjust(-1)
+            return
+
         # Output: "self.request_begin(NUMBER)"
         out_stream.write("{0:i}self.request_begin({1})\n". \
           format(style, number))
@@ -823,6 +843,55 @@ class Function(Node):
         # Restore indentation:
         style.indent_adjust(-1)
 
+    ## @brief Output the codec class attributes for *self* to *out_stream*
+    #  @param self *Function* to output the codecs for
+    #  @param out_stream *file* to output Python code to
+    #
+    # This method outputs:
+    #
+    #        FUNCTION_parameters_codec = codec_get(("PT1", ..., "PTn"))
+    #        FUNCTION_results_codec = codec_get(("RT1", ..., "RTn"))
+
+    def python_codecs_write(self, out_stream):
+
+        # Check argument types:
+        assert isinstance(out_stream, file)
+
+        style = self.style
+        parameter_types = tuple([parameter.type
+          for parameter in self.parameters])
+        result_types = tuple([result.type for result in self.results])
+        out_stream.write("{0:i}{1:r}_parameters_codec = codec_get({2!r})\n". \
+          format(style, self, parameter_types))
+        out_stream.write("{0:i}{1:r}_results_codec = codec_get({2!r})\n". \
+          format(style, self, result_types))
+
+    ## @brief Output the single transaction body for *self* to *out_stream*
+    #  @param self *Function* to output the body for
+    #  @param out_stream *file* to output Python code to
+    #
+    # This is the *transactions* flavor of the *python_write* body.
+
+    def python_transaction_write(self, out_stream):
+
+        # Check argument types:
+        assert isinstance(out_stream, file)
+
+        style = self.style
+        arguments = [parameter.name for parameter in self.parameters]
+        arguments_text = "()"
+        if len(arguments) == 1:
+            arguments_text = "({0},)".format(arguments[0])
+        elif len(arguments) > 1:
+            arguments_text = "({0})".format(", ".join(arguments))
+        call = "self.transaction_call({1}, False,\n" \
+          "{0:i}  self.{2:r}_parameters_codec, {3},\n" \
+          "{0:i}  self.{2:r}_results_codec)". \
+          format(style, self.number, self, arguments_text)
+
+        # Output: "return CALL":
+        out_stream.write("{0:i}return {1}\n\n".format(style, call))
+
 ## @class Include
 #
 # One include file name for a module
@@ -1392,14 +1461,18 @@ class Module(Node):
     ## @brief Write out Python RPC access code for *self* to *file_name*
     #  @param self *Module* to write Python code for
     #  @param out_stream *file* to write Python code out to
+    #  @param transactions *bool* when each accessor is one transaction
     #
     # This method will write out Python access code for *self* out to
-    # the file named *file_name*.
+    # the file named *file_name*.  When *transactions* is *True*, the
+    # register and function codecs are output as class attributes and
+    # each accessor is a single *Maker_Bus_Module.transaction_call*().
 
-    def python_write(self, out_stream):
+    def python_write(self, out_stream, transactions = False):
 
         # Check argument types:
         assert isinstance(out_stream, file)
+        assert isinstance(transactions, bool)
 
         # Grab some values from *self*:
         functions = self.functions
@@ -1408,27 +1481,38 @@ class Module(Node):
         style = self.style
 
         # Output the class:
-        out_stream.write("class {0:t}(Bus_Module):\n\n".format(self))
+        out_stream.write("class {0:t}(Maker_Bus_Module):\n\n".format(self))
         style.indent_adjust(1)
 
+        # Note whether the accessors go through
+        # *Maker_Bus_Module.transaction_call*() and output the
+        # precompiled codecs that they use:
+        out_stream.write("{0:i}transaction_accessors = {1}\n". \
+          format(style, transactions))
+        if transactions:
+            for register in registers:
+                register.python_codecs_write(out_stream)
+            for function in functions:
+                function.python_codecs_write(out_stream)
+        out_stream.write("\n")
+
         # Output the initializer:
         out_stream.write( \
           "{0:i}def __init__(self, maker_bus, address, offset):\n". \
           format(style))
         style.indent_adjust(1)
-        out_stream.write( \
-          "{0:i}Bus_Module.__init__(self, maker_bus, address, offset)\n".
-          format(style))
+        out_stream.write("{0:i}Maker_Bus_Module.__init__(self, " \
+          "maker_bus, address, offset)\n".format(style))
         style.indent_adjust(-1)
         out_stream.write("\n")
 
         # Output all the register member functions:
         for register in registers:
-            register.python_write(out_stream)
+            register.python_write(out_stream, transactions)
 
         # Output all the function member functions:
         for function in functions:
-            function.python_write(out_stream)
+            function.python_write(out_stream, transactions)
 
         # All done:
         style.indent_adjust(-1)
@@ -1465,7 +1549,12 @@ class Module(Node):
 # One use of a Module
 #
 # This class represents one usage of a Module in a project.  A project
-# can contain multiple instances of the same kind of module.
+# can contain multiple instances of the same kind of module.  Module
+# uses with the same optional *Group* attribute (e.g. the two motors of
+# a robot) are also made available together as a *Maker_Bus_Group*
+# by Python code generated with *transactions* (see
+# *Project.python_write*), so that they can be updated in one pipelined
+# batch.
 
 class Module_Use(Node):
 
@@ -1498,6 +1587,7 @@ class Module_Use(Node):
             module_uses = []
         offset = 0
         address = ""
+        group = ""
         uid = ""
 
         # Initialize from *module_use_element* if it is not *None*:
@@ -1511,6 +1601,8 @@ class Module_Use(Node):
                 address = attributes["Address"]
             if "Offset" in attributes:
                 offset = int(attributes["Offset"])
+            if "Group" in attributes:
+                group = attributes["Group"]
             if "UID" in attributes:
                 uid = attributes["UID"]
 
@@ -1532,6 +1624,7 @@ class Module_Use(Node):
 
         # Load up *self*:
         self.address = address
+        self.group = group
         self.offset = offset
         self.maker_bus_module = None
         self.maker_bus_address = -1
@@ -1753,6 +1846,8 @@ class Module_Use(Node):
         out_stream.write(' Name="{0}"'.format(self.name))
         out_stream.write(' Address="{0}"'.format(self.address))
         out_stream.write(' Offset="{0}"'.format(self.offset))
+        if self.group != "":
+            out_stream.write(' Group="{0}"'.format(self.group))
         out_stream.write(' UID="{0}"\n'.format(self.uid))
         out_stream.write('{0} Vendor="{1}"'.format("  " * indent, self.vendor))
         out_stream.write(' Module="{0}"'.format(self.module_name))
@@ -2097,7 +2192,7 @@ class Parameter:
 # It corresponds to the following XML:
 #
 #        <Project Name="...">
-#          <Module_Use Name="..." Vendor="..." Module="...">
+#          <Module_Use Name="..." Vendor="..." Module="..." Group="...">
 #            ...
 #          </Module_Use>
 #        </Project>
@@ -2151,10 +2246,14 @@ class Project(Node):
     ## @brief Write out the Python code for *self*
     #  @param self *Project* to generate Python code for
     #  @param modules_table *dict* contains all modules keyed by vendor and name
+    #  @param transactions *bool* when each accessor is one transaction
     #
-    # This method will write out the Python code for *self*
+    # This method will write out the Python code for *self*.  When
+    # *transactions* is *True*, each register and function accessor is
+    # a single transaction with a precomputed command number and codec
+    # (see *Module.python_write*).
 
-    def python_write(self, modules_table):
+    def python_write(self, modules_table, transactions = False):
 	""" {Project}: Write out the python code for {self} out. """
 
 	trace = False
@@ -2203,7 +2302,7 @@ class Project(Node):
             #out_stream.write("# Vendor:{0}   Module:{1}\n". \
             #  format(accessible_modules_key[0], accessible_modules_key[1]))
             module = accessible_modules[accessible_modules_key]
-            module.python_write(out_stream)
+            module.python_write(out_stream, transactions)
 
         # Output the Project class:
         out_stream.write("class Project:\n\n")
@@ -2227,6 +2326,26 @@ class Project(Node):
 		print " Project.python_write: line='{0}'".format(line)
 	    out_stream.write(line)
 	    out_stream.write("\n")
+
+        # Generate one line per group of module uses.  A group needs
+        # accessors that can be batched, so groups only show up when
+        # *transactions* is *True*:
+        #
+        #        self.GROUP = Maker_Bus_Group(maker_bus,
+        #          [self.MODULE_USE1, self.MODULE_USE2, ...])
+        groups = {}
+        for accessible_module_uses_key in sorted(accessible_module_uses):
+            accessible_module_use = \
+              accessible_module_uses[accessible_module_uses_key]
+            group = accessible_module_use.group
+            if transactions and group != "":
+                groups.setdefault(group, []).append(
+                  "self.{0}".format(accessible_module_use.name.lower()))
+        for group in sorted(groups.keys()):
+            out_stream.write("{0}self.{1} = Maker_Bus_Group(maker_bus,\n". \
+              format(indent * 2, group.lower()))
+            out_stream.write("{0}  [{1}])\n". \
+              format(indent * 2, ", ".join(groups[group])))
         out_stream.write("\n")
 
         # Output the Application class:
@@ -2237,7 +2356,7 @@ class Project(Node):
            format(indent * 1))
         out_stream.write("\n")
 
-        out_stream.write("{0}maker_bus_base = Bus_Base(None)\n". \
+        out_stream.write("{0}maker_bus_base = Maker_Bus_Base(None)\n". \
           format(indent * 2))
         out_stream.write("{0}self.maker_bus_base = maker_bus_base\n". \
           format(indent * 2))
@@ -2505,11 +2624,18 @@ class Project(Node):
 # A register represents a single register that is accessible via
 # remote procedure call.  It corresponds as the following XML:
 #
-#        <Register Name="..." Type="..." Number="..." Brief="...">
+#        <Register Name="..." Type="..." Number="..." Brief="..."
+#         Volatile="...">
 #        <Description>
 #          *Description goes here*
 #        </Description>
 #        </Register>
+#
+# The optional *Volatile* attribute is "True" (the default) for a
+# register that the module can change on its own (e.g. a sensor or an
+# encoder) and "False" for one that only changes when it is set (e.g.
+# a motor speed).  Non-volatile registers can be served from a shadow
+# copy (see *Maker_Bus_Module.shadow_enable*()).
 
 class Register(Node):
 
@@ -2523,11 +2649,17 @@ class Register(Node):
         name = attributes["Name"]
         type = attributes["Type"]
 
+        # Deal with optional attributes:
+        volatile = True
+        if "Volatile" in attributes:
+            volatile = attributes["Volatile"] != "False"
+
         self.brief = attributes["Brief"]
         self.description = Description.extract(register_element, style)
         self.name = name
         self.number = int(attributes["Number"])
         self.type = type
+        self.volatile = volatile
 
         Node.__init__(self, "Register", name, None, None, style)
 
@@ -2742,10 +2874,21 @@ class Register(Node):
         stream.write("{0:i}break;\n".format(style))
         stream.write("{0:e}".format(style))
 
-    def python_write(self, out_stream):
+    def python_codecs_write(self, out_stream):
+        """ Register: Write the codec class attribute for *self* to
+            *out_stream*: "REGISTER_codec = codec_get(("TYPE",))". """
+
+        out_stream.write("{0:i}{1:r}_codec = codec_get({2!r})\n". \
+          format(self.style, self, (self.type,)))
+
+    def python_write(self, out_stream, transactions = False):
         """ Register: Write the python method functions for *self* to
             *out_stream*.  This is both a "get" and a "set" method
-            function. """
+            function.  When {transactions} is {True}, each one is a
+            single *Maker_Bus_Module.transaction_call*() using the codec
+            output by {python_codecs_write}(); for a non-volatile
+            register it goes through the shadow copy (see
+            *Maker_Bus_Module.register_shadow_get*()). """
 
         brief = self.brief
         name = self.name
@@ -2758,7 +2901,7 @@ class Register(Node):
         #        def REGISTER_get(self):
         #            // Get: BRIEF
         #
-        #            self.request_begin(NUMBER)
+        #            self.request_begin(NUMBER, True)
         #            self.request_end()
         #            return self.response_TYPE_get()
 
@@ -2771,14 +2914,28 @@ class Register(Node):
         # Output: "// Get: BRIEF"
         out_stream.write("{0:i}# Get: {1}\n\n".format(style, brief))
 
-        # Output: "self.request_begin(NUMBER)"
-        out_stream.write("{0:i}self.request_begin({1})\n".format(style, number))
+        if transactions and not self.volatile:
+            # Output: "return self.register_shadow_get(NUMBER,
+            #            self.REGISTER_codec)":
+            out_stream.write("{0:i}return self.register_shadow_get({1},\n"
+              "{0:i}  self.{2:r}_codec)\n\n".format(style, number, self))
+        elif transactions:
+            # Output: "return self.transaction_call(NUMBER, True,
+            #            empty_codec, (), self.REGISTER_codec)":
+            out_stream.write("{0:i}return self.transaction_call({1}, True,\n"
+              "{0:i}  empty_codec, (), self.{2:r}_codec)\n\n". \
+              format(style, number, self))
+        else:
+            # Output: "self.request_begin(NUMBER, True)"; a get can be
+            # safely retried:
+            out_stream.write("{0:i}self.request_begin({1}, True)\n". \
+              format(style, number))
 
-        # Output: "self.request_end()"
-        out_stream.write("{0:i}self.request_end()\n".format(style))
+            # Output: "self.request_end()"
+            out_stream.write("{0:i}self.request_end()\n".format(style))
 
-        # Output: "return self.response_TYPE_get()"
-        out_stream.write("{0:i}return self.response_{1}_get()\n\n". \
+            # Output: "return self.response_TYPE_get()"
+            out_stream.write("{0:i}return self.response_{1}_get()\n\n". \
               format(style, type.lower()))
 
         # Restore indentation:
@@ -2801,16 +2958,29 @@ class Register(Node):
         # Output: "// Set: BRIEF"
         out_stream.write("{0:i}# Set: {1}\n\n".format(style, brief))
 
-        # Output: "self.request_begin(NUMBER + 1)"
-        out_stream.write("{0:i}self.request_begin({1})\n". \
-          format(style, number + 1))
+        if transactions and not self.volatile:
+            # Output: "return self.register_shadow_set(NUMBER,
+            #            self.REGISTER_codec, REGISTER)":
+            out_stream.write("{0:i}return self.register_shadow_set({1},\n"
+              "{0:i}  self.{2:r}_codec, {2:n})\n\n". \
+              format(style, number, self))
+        elif transactions:
+            # Output: "return self.transaction_call(NUMBER + 1, True,
+            #            self.REGISTER_codec, (REGISTER,), empty_codec)":
+            out_stream.write("{0:i}return self.transaction_call({1}, True,\n"
+              "{0:i}  self.{2:r}_codec, ({2:n},), empty_codec)\n\n". \
+              format(style, number + 1, self))
+        else:
+            # Output: "self.request_begin(NUMBER + 1)"
+            out_stream.write("{0:i}self.request_begin({1})\n". \
+              format(style, number + 1))
 
-        # Output: "self.request_TYPE_put(REGISTER)"
-        out_stream.write("{0:i}self.request_{1}_put({2:n})\n". \
-          format(style, type.lower(), self))
+            # Output: "self.request_TYPE_put(REGISTER)"
+            out_stream.write("{0:i}self.request_{1}_put({2:n})\n". \
+              format(style, type.lower(), self))
 
-        # Output: "self.request_end()"
-        out_stream.write("{0:i}self.request_end()\n\n".format(style))
+            # Output: "self.request_end()"
+            out_stream.write("{0:i}self.request_end()\n\n".format(style))
 
         # Restore indentation:
         style.indent_adjust(-1)
@@ -3045,6 +3215,7 @@ class XML_Check:
         module_use.optional_attribute("Address")
         module_use.optional_attribute("Address_RE")
         module_use.optional_attribute("Offset")
+        module_use.optional_attribute("Group")
         module_use.optional_attribute("UID")
         module_use.child_tag("Module_Use")
 
@@ -3064,6 +3235,7 @@ class XML_Check:
         register.required_attribute("Type")
         register.required_attribute("Number")
         register.required_attribute("Brief")
+        register.optional_attribute("Volatile")
         register.child_tag("Description")
 
         result = XML_Check("Result", False, tags)
@@ -3228,6 +3400,32 @@ class XML:
 
 # End of classes:
 
+## @brief Read all of the module XML files that match *pattern*.
+#  @param pattern *str* glob pattern for the module XML files
+#  @param style *Style* object that specifies how to format generate code.
+#  @result *dict* of *Module* objects keyed by (vendor, module name)
+#
+# This routine reads in and checks every module XML file that matches
+# *pattern* and returns a table of the resulting *Module* objects.
+
+def modules_table_read(pattern, style):
+
+    # Check argument types:
+    assert isinstance(pattern, str)
+    assert isinstance(style, Style)
+
+    xml = XML(style)
+    tags = XML_Check.tags_initialize()
+    modules_table = {}
+    for module_file_name in sorted(glob.glob(pattern)):
+        style.file_name_set(module_file_name)
+        module_element = xml.read(module_file_name, "Module")
+        if module_element != None:
+            XML_Check.element_check(module_element, tags)
+            module = Module(module_element, module_file_name, style)
+            modules_table[(module.vendor, module.name)] = module
+    return modules_table
+
 def main():
     style = Style()
 
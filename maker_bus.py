@@ -6,9 +6,461 @@
 # MakerBus protocol packets.
 
 from serial import *
+import Queue
 import sys
 import glob
+import json
+import struct
+import threading
 import time
+from maker_bus_latency import *
+from maker_bus_trace import *
+
+## @brief Return the bytes that encode the 9-bit *frame* on the wire.
+#  @param frame *int* 9-bit frame to encode
+#
+# Frames above 0xff and frames that collide with the escape bytes
+# (0xc0 through 0xc5) are sent as two bytes, 0xc0 | (*frame* >> 7)
+# followed by the low 7 bits of *frame*.  Everything else is sent as
+# a single byte.
+
+def frame_encoding(frame):
+    """ Return the bytes that encode {frame}. """
+
+    if frame > 0xff or (0xc0 <= frame and frame <= 0xc5):
+        return bytearray((0xc0 | ((frame >> 7) & 3), frame & 0x7f))
+    return bytearray((frame,))
+
+# Precomputed encodings for all 512 9-bit frames:
+frame_encodings = [frame_encoding(frame) for frame in range(0x200)]
+
+## @brief Append the wire encoding of *frames* to *buffer*.
+#  @param frames *list* of 9-bit frames
+#  @param buffer *bytearray* to append the encoded bytes to
+#
+# This routine lets a whole request be encoded into one buffer so that
+# it can be sent with a single serial write.
+
+def frames_encode(frames, buffer):
+    """ Append the encoding of {frames} to {buffer} and return {buffer}. """
+
+    encodings = frame_encodings
+    for frame in frames:
+        buffer += encodings[frame]
+    return buffer
+
+# Precompiled big-endian encoders/decoders for the MakerBus types:
+byte_struct = struct.Struct(">b")
+integer_struct = struct.Struct(">i")
+short_struct = struct.Struct(">h")
+ubyte_struct = struct.Struct(">B")
+uinteger_struct = struct.Struct(">I")
+ushort_struct = struct.Struct(">H")
+
+# The *struct.Struct* used for each MakerBus type name:
+type_structs = {
+  "Byte": byte_struct,
+  "Character": ubyte_struct,
+  "Int": integer_struct,
+  "Integer": integer_struct,
+  "Logical": ubyte_struct,
+  "Short": short_struct,
+  "UByte": ubyte_struct,
+  "UInteger": uinteger_struct,
+  "UShort": ushort_struct,
+}
+
+## @class Maker_Bus_Codec
+#
+# Compiled wire format for a sequence of MakerBus types.
+#
+# *Maker_Bus_Codec* compiles a list of MakerBus type names (a register
+# type, or the parameters or results of a function) into a fixed wire
+# *size* and one precompiled *struct.Struct* for each direction, so
+# that packing or unpacking all of the values is a single *struct*
+# operation.  "Character" values travel as *str* and "Logical" values
+# as *bool*.  Use *codec_get*() rather than creating codecs directly so
+# that each signature is only compiled once.
+
+class Maker_Bus_Codec:
+
+    def __init__(self, types):
+        """ {Maker_Bus_Codec}: Initialize {self} to encode and decode
+            values of the MakerBus {types} in order. """
+
+        characters = []
+        codes = []
+        logicals = []
+        masks = []
+        for index in range(len(types)):
+            type = types[index]
+            assert type in type_structs, \
+              "Unknown MakerBus type '{0}'".format(type)
+            type_struct = type_structs[type]
+            codes.append(type_struct.format[1:])
+            masks.append((1 << (8 * type_struct.size)) - 1)
+            if type == "Character":
+                characters.append(index)
+            elif type == "Logical":
+                logicals.append(index)
+
+        # Values are masked down to their low order bytes and packed
+        # unsigned, just like the request_*_put() routines do:
+        self.characters = characters
+        self.logicals = logicals
+        self.masks = masks
+        self.packer = struct.Struct(">" + "".join(codes).upper())
+        self.size = self.packer.size
+        self.types = tuple(types)
+        self.unpacker = struct.Struct(">" + "".join(codes))
+
+    def pack(self, values):
+        """ {Maker_Bus_Codec}: Return {values} packed into a *str*. """
+
+        assert len(values) == len(self.masks), \
+          "{0} values for {1}".format(len(values), self.types)
+
+        if len(self.characters) != 0:
+            values = list(values)
+            for index in self.characters:
+                if isinstance(values[index], str):
+                    values[index] = ord(values[index])
+        return self.packer.pack(*[int(value) & mask
+          for value, mask in zip(values, self.masks)])
+
+    def result(self, data, index = 0):
+        """ {Maker_Bus_Codec}: Return the values decoded from {data}
+            starting at {index} shaped like a Python function result:
+            {None} for no values, the value itself for one value and a
+            *tuple* for more. """
+
+        values = self.unpack(data, index)
+        count = len(values)
+        if count == 1:
+            return values[0]
+        elif count == 0:
+            return None
+        return tuple(values)
+
+    def unpack(self, data, index = 0):
+        """ {Maker_Bus_Codec}: Return the list of values decoded from
+            {data} starting at {index}. """
+
+        values = list(self.unpacker.unpack_from(data, index))
+        for index in self.logicals:
+            values[index] = values[index] != 0
+        for index in self.characters:
+            values[index] = chr(values[index])
+        return values
+
+# The *Maker_Bus_Codec* for each tuple of type names compiled so far:
+codecs = {}
+
+## @brief Return the *Maker_Bus_Codec* for the MakerBus *types*.
+#  @param types *list* or *tuple* of MakerBus type names
+#
+# This is the central type registry: every *Register* type and every
+# *Function* signature is compiled once and the codec is reused.
+
+def codec_get(types):
+    """ Return the {Maker_Bus_Codec} for {types}. """
+
+    key = tuple(types)
+    codec = codecs.get(key)
+    if codec == None:
+        codec = Maker_Bus_Codec(key)
+        codecs[key] = codec
+    return codec
+
+# The codec for "no values at all":
+empty_codec = codec_get(())
+
+## @brief Return the *Maker_Bus_Codec*s for the parameters and results
+#  of *function*.
+#  @param function *Function* to return the codecs for
+
+def function_codecs(function):
+    """ Return the (parameters codec, results codec) for {function}. """
+
+    return (codec_get([parameter.type for parameter in function.parameters]),
+      codec_get([result.type for result in function.results]))
+
+## @brief Return the *Maker_Bus_Codec* for *register*.
+#  @param register *Register* to return the codec for
+
+def register_codec(register):
+    """ Return the {Maker_Bus_Codec} for {register}. """
+
+    return codec_get((register.type,))
+
+## @brief Return the 4-bit MakerBus checksum of *ubytes*.
+#  @param ubytes *list* of unsigned bytes to checksum
+#
+# This is the checksum that goes into the low nibble of both request
+# and response headers.
+
+def checksum_compute(ubytes):
+    """ Return the 4-bit checksum of {ubytes}. """
+
+    checksum = 0
+    for ubyte in ubytes:
+        checksum += ubyte
+    return (checksum + (checksum >> 4)) & 0xf
+
+## @brief Return the bus inventory cached in *file_name*.
+#  @param file_name *str* name of the inventory cache file
+#
+# The inventory is a *dict* that maps each module address to the
+# identifier it reported during discovery.  (Identifiers need not be
+# unique; two motor controllers report the same one.)  *None* is
+# returned if *file_name* does not exist or can not be read.
+
+def inventory_load(file_name):
+    """ Return the inventory in {file_name} or {None}. """
+
+    try:
+        in_stream = open(file_name, "r")
+        try:
+            cache = json.load(in_stream)
+        finally:
+            in_stream.close()
+    except (IOError, ValueError):
+        return None
+    if not isinstance(cache, dict) or \
+      cache.get("version") != inventory_version:
+        return None
+
+    inventory = {}
+    for address, identifier in cache["modules"]:
+        inventory[int(address)] = str(identifier)
+    return inventory
+
+## @brief Write *inventory* out to the cache file *file_name*.
+#  @param inventory *dict* that maps addresses to identifiers
+#  @param file_name *str* name of the inventory cache file
+
+def inventory_save(inventory, file_name):
+    """ Write {inventory} out to {file_name}. """
+
+    assert isinstance(inventory, dict)
+
+    out_stream = open(file_name, "w")
+    json.dump({"version": inventory_version, "time": time.time(),
+      "modules": [[address, inventory[address]]
+      for address in sorted(inventory.keys())]},
+      out_stream, indent = 2, sort_keys = True)
+    out_stream.write("\n")
+    out_stream.close()
+
+inventory_version = 1
+
+## @brief Return the names of the serial ports that might be a MakerBus.
+#
+# Any "/dev/tty*" names on the command line come first, followed by the
+# USB serial adapters (Linux, then MacOS) and the Raspberry Pi serial
+# port, each sorted by name.
+
+def serial_names_find():
+    """ Return the list of serial port names to try. """
+
+    # Search command line arguments for pattern "/dev/tty*":
+    argv_serials = []
+    for arg in sys.argv:
+        if arg.find("/dev/tty") == 0:
+            # Found one:
+            argv_serials.append(arg)
+    unix_serials = glob.glob("/dev/ttyUSB*")
+    macos_serials = glob.glob("/dev/tty.usbserial-*")
+    pi_serials = glob.glob("/dev/ttyAMA*")
+
+    # Sort everything that we found and concatente them together:
+    argv_serials.sort()
+    pi_serials.sort()
+    unix_serials.sort()
+    macos_serials.sort()
+    return argv_serials + unix_serials + macos_serials + pi_serials
+
+## @brief Return *transactions* grouped by address.
+#  @param transactions *list* of *Maker_Bus_Transaction* objects
+#
+# The transactions for each address stay in their original order and
+# the addresses appear in the order that they were first used, so that
+# each module only needs to be selected once.
+
+def transactions_group(transactions):
+    """ Return {transactions} reordered so that the transactions for each
+        address are next to one another. """
+
+    groups = {}
+    addresses = []
+    for transaction in transactions:
+        address = transaction.address
+        if address not in groups:
+            groups[address] = []
+            addresses.append(address)
+        groups[address].append(transaction)
+
+    grouped = []
+    for address in addresses:
+        grouped.extend(groups[address])
+    return grouped
+
+## @class Maker_Bus_Transaction
+#
+# One request/response exchange with one MakerBus module.
+#
+# A *Maker_Bus_Transaction* holds a complete request (a command
+# followed by its parameter bytes) for one MakerBus address along with
+# the response that came back for it.  Transactions are what
+# *Maker_Bus_Base.pipeline_flush*() keeps in flight.  After the flush,
+# *status* is one of:
+#
+#  * "ok" the response arrived with a good checksum
+#  * "timeout" the select acknowledge or the response timed out, or
+#    an earlier transaction in the pipeline timed out and this one
+#    is not idempotent, so it may or may not have been carried out
+#  * "checksum" the response arrived with a bad checksum
+#
+# *status* is "pending" until the transaction has completed.  It is
+# "posted" while a transaction sent by *Maker_Bus_Base.transactions_post*
+# is waiting for *Maker_Bus_Base.posted_drain* to read its response.
+# Transactions marked *idempotent* are sent again after a timeout or
+# a bad checksum, up to *Maker_Bus_Base.retries_maximum* more times.
+# *select* is cleared by *Maker_Bus_Base.pipeline_flush* when the
+# module is already selected, so no select frame (and no acknowledge)
+# is needed.
+
+class Maker_Bus_Transaction:
+
+    def __init__(self, address, request):
+        """ {Maker_Bus_Transaction}: Initialize {self} to send {request}
+            to {address}. """
+
+        assert isinstance(address, int)
+        assert isinstance(request, list)
+        assert 0 < len(request) < 16, \
+          "Request is {0} bytes".format(len(request))
+
+        self.address = address
+        self.attempts = 0
+        self.idempotent = False
+        self.request = request
+        self.response = bytearray()
+        self.select = True
+        self.sent_time = 0.0
+        self.status = "pending"
+
+    def frames_encode(self, buffer):
+        """ {Maker_Bus_Transaction}: Append the select frame (if needed),
+            request header and request for {self} to {buffer}. """
+
+        request = self.request
+        request_header = (len(request) << 4) | checksum_compute(request)
+        if self.select:
+            frames_encode((self.address | 0x100, request_header), buffer)
+        else:
+            frames_encode((request_header,), buffer)
+        frames_encode(request, buffer)
+        return buffer
+
+    def record(self, recorder):
+        """ {Maker_Bus_Transaction}: Record the frames that {frames_encode}()
+            sends for {self} into the {Maker_Bus_Trace} {recorder}. """
+
+        address = self.address
+        request = self.request
+        if self.select:
+            recorder.record(TRACE_SELECT, address, address | 0x100)
+        recorder.record(TRACE_WRITE, address,
+          (len(request) << 4) | checksum_compute(request))
+        recorder.records_put(TRACE_WRITE, address, request)
+
+## @class Maker_Bus_Error
+#
+# MakerBus transaction failure.
+#
+# *Maker_Bus_Error* is raised when a caller tries to use a response
+# that did not arrive intact.  *status* is "timeout" or "checksum"
+# (or "length" for a short response, "aborted" for a batch that was
+# abandoned and "bandwidth" for work refused by admission control).
+
+class Maker_Bus_Error(Exception):
+
+    def __init__(self, address, status):
+        """ {Maker_Bus_Error}: Initialize {self} for a failed transaction
+            with the module at {address}. """
+
+        Exception.__init__(self,
+          "MakerBus address 0x{0:x}: {1}".format(address & 0xff, status))
+        self.address = address
+        self.status = status
+
+## @class Maker_Bus_Future
+#
+# A result that will be available later.
+#
+# A *Maker_Bus_Future* is handed out for a value that is not known
+# until some bus traffic completes.  Whoever completes it calls
+# *result_set*(), which runs any callbacks that were registered with
+# *callback_add*().  A future that is completed by another thread can
+# be waited for with *result*().
+
+class Maker_Bus_Future:
+
+    def __init__(self):
+        """ {Maker_Bus_Future}: Initialize {self} to be not done. """
+
+        self.callbacks = []
+        self.done = False
+        self.error = None
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.value = None
+
+    def callback_add(self, callback):
+        """ {Maker_Bus_Future}: Arrange for {callback}({self}) to be called
+            when {self} is done.  If {self} is already done, {callback}
+            is called immediately. """
+
+        with self.lock:
+            done = self.done
+            if not done:
+                self.callbacks.append(callback)
+        if done:
+            callback(self)
+
+    def error_set(self, error):
+        """ {Maker_Bus_Future}: Mark {self} done with the exception {error},
+            which {result}() will raise. """
+
+        self.error = error
+        self.result_set(None)
+
+    def result(self, timeout = None):
+        """ {Maker_Bus_Future}: Return the value of {self}.  When {self}
+            is being completed by another thread, wait up to {timeout}
+            seconds ({None} for ever) for it to be done. """
+
+        if not self.done:
+            self.event.wait(timeout)
+        assert self.done, "Future is not done yet"
+        if self.error != None:
+            raise self.error
+        return self.value
+
+    def result_set(self, value):
+        """ {Maker_Bus_Future}: Mark {self} done with {value} and run the
+            callbacks. """
+
+        with self.lock:
+            assert not self.done, "Future is already done"
+            self.value = value
+            self.done = True
+            callbacks = self.callbacks
+            self.callbacks = []
+        self.event.set()
+        for callback in callbacks:
+            callback(self)
 
 ## @class Maker_Bus_Base
 #
@@ -23,24 +475,15 @@ class Maker_Bus_Base:
     def __init__(self, serial_name):
         """ {Maker_Bus_Base}: Initialize a Maker_Bus object. """
 
-	serial_name = None
-	if not isinstance(serial_name, str):
-	    # Search command line arguments for pattern "/dev/tty*":
-	    argv_serials = []
-	    for arg in sys.argv:
-		if arg.find("/dev/tty") == 0:
-		    # Found one:
-		    argv_serials.append(arg)
-	    unix_serials = glob.glob("/dev/ttyUSB*")
-	    macos_serials = glob.glob("/dev/tty.usbserial-*")
-	    pi_serials = glob.glob("/dev/ttyAMA*")
-
-	    # Sort everything that we found and concatente them together:
-	    argv_serials.sort()
-	    pi_serials.sort()
-	    unix_serials.sort()
-	    macos_serials.sort()
-	    serials = argv_serials + unix_serials + macos_serials + pi_serials
+        # {serial_name} is either a device name to open, an object that
+        # is already open and behaves like a *Serial* object, or *None*
+        # to search for a serial port:
+        serial = None
+        if serial_name != None and not isinstance(serial_name, str):
+            serial = serial_name
+            serial_name = None
+        elif not isinstance(serial_name, str):
+	    serials = serial_names_find()
 	    print("serials={0}".format(serials))
 
 	    # Squirt out an error message
@@ -52,7 +495,6 @@ class Maker_Bus_Base:
 		serial_name = serials[0]
 
 	# Try to open a serial connection:
-	serial = None
 	if serial_name != None:
 	    try:
 		serial = Serial(serial_name, 115200)
@@ -62,20 +504,41 @@ class Maker_Bus_Base:
 	    print "Unable to open serial port '{0}'".format(serial_name)
 
         self.address = -1
+        self.admission = None
         self.auto_flush = True
+        self.batches = {}
+        self.io_thread = None
+        self.latencies = Maker_Bus_Latencies()
+        self.posted = []
         self.request = []
+        self.request_address = -1
+        self.request_idempotent = False
         self.request_safe = 0
-        self.response = []
+        self.response = bytearray()
+        self.response_index = 0
+        self.response_status = "ok"
+        self.retries_maximum = 2
+        self.retry_backoff = 0.001
+        self.rtts = {}
 	self.same_address_requests = 0
+        self.recorder = Maker_Bus_Trace()
+        self.select_refresh = 0
         self.serial = serial
-        self.trace = True
+        self.serial_timeout = None
+        self.statistics = {"selects": 0, "selects_avoided": 0,
+          "select_round_trips": 0, "select_round_trips_avoided": 0,
+          "posted": 0, "posted_failures": 0}
+        self.timeout_initial = 0.004
+        self.timeout_maximum = 0.100
+        self.timeout_minimum = 0.002
+        self.trace = False
         self.trace_pad = ""
 
 	#FIXME: Only open serial if it is not already open:
         #serial.open()
 	if serial != None:
             serial.flushInput()
-            serial.setTimeout(0.004)
+            self.timeout_set(self.timeout_initial)
         
     def auto_flush_set(self, flush_mode):
         """ {Maker_Bus_Base}: This routine will set the auto flush mode for
@@ -102,6 +565,24 @@ class Maker_Bus_Base:
             print("{0}<=Maker_Bus.auto_flush({1})".
               format(trace_pad, flush_mode))
 
+    def batch(self, depth = 4, wait = True):
+        """ {Maker_Bus_Base}: Return a {Maker_Bus_Batch} to use in a
+            "with" statement.  Inside of the block, the accessors of
+            every *Maker_Bus_Module* on {self} return futures and the
+            commands are sent with up to {depth} transactions in flight
+            when the block ends.  When {wait} is {False}, commands that
+            return nothing to modules at addresses with 0x80 set are
+            posted without waiting for their responses (see
+            {transactions_post}()). """
+
+        return Maker_Bus_Batch(self, depth, wait)
+
+    def batch_get(self):
+        """ {Maker_Bus_Base}: Return the {Maker_Bus_Batch} that the
+            current thread is collecting commands in or {None}. """
+
+        return self.batches.get(threading.current_thread())
+
     def bus_test(self):
         """ {Maker_Buse_Base} """
 
@@ -122,6 +603,8 @@ class Maker_Bus_Base:
         # Do not do anything unless we have something to send:
         request = self.request
         request_length = len(request)
+        if request_length != 0 and len(self.posted) != 0:
+            self.posted_drain()
         while request_length != 0:
             # Make sure that the correct module is selected:
             if request_length >= 16:
@@ -130,69 +613,75 @@ class Maker_Bus_Base:
               "Request is {0} bytes >= 16".format(request_length)
 
             # Compute checksum:
-            checksum = 0
-            for index in range(0, request_length):
-                checksum += request[index]
-            checksum = (checksum + (checksum >> 4)) & 0xf
+            checksum = checksum_compute(request[0: request_length])
 
-            # Compute request header and send it out:
+            # Encode the request header and the rest of the request
+            # into one buffer and send it out with a single write:
             request_header = (request_length << 4) | checksum
+            chunk = request[0: request_length]
+            buffer = bytearray()
+            frames_encode((request_header,), buffer)
+            frames_encode(chunk, buffer)
             serial = self.serial
-            self.frame_put(request_header)
-        
-            # Send out the rest of the request:
-            for index in range(0, request_length):
-                ubyte = request[index]
-                self.frame_put(ubyte)
+            sent_time = time.time()
+            serial.write(bytes(buffer))
+            recorder = self.recorder
+            if recorder != None:
+                # The request belongs to {request_address} even when the
+                # select was not acknowledged and {address} is -1:
+                address = self.request_address
+                recorder.record(TRACE_WRITE, address, request_header)
+                recorder.records_put(TRACE_WRITE, address,
+                  request[0: request_length])
+            if trace:
+                print("{0}write({1})".format(trace_pad,
+                  " ".join(["0x{0:x}".format(byte) for byte in buffer])))
+
             del request[0: request_length]
             request_length = len(request)
             self.request_safe -= request_length
 
-	    # Flush the serial output buffer:
+            # Flush the serial output buffer:
             if trace:
                 print("{0}Maker_Bus.flush:serial.flush()".format(trace_pad))
             serial.flush()
 
-            # Now get a response:
+            # Now get a response, sending idempotent requests again
+            # (with a fresh select) after a timeout or a bad checksum:
+            address = self.request_address
             response = self.response
-            response_header = self.frame_get()
-            if response_header < 0:
-                # We had a time-out:
-                print("Response header timeout")
-            else:
-                response_length = response_header >> 4
-                response_checksum = response_header & 0xf
-        
-                # Get the rest of the response:
+            del response[:]
+            self.response_index = 0
+            status = self.response_read(address, response, sent_time,
+              chunk[0])
+            attempts = 0
+            while status != "ok" and self.request_idempotent and \
+              attempts < self.retries_maximum:
+                time.sleep(self.retry_backoff * (1 << attempts))
+                attempts += 1
+                serial.flushInput()
+
+                # The module may have dropped its select, so select it
+                # again:
+                self.address = -1
+                transaction = Maker_Bus_Transaction(address, chunk)
+                self.pipeline_flush([transaction], 1, False)
+                status = transaction.status
+                response[:] = transaction.response
+            if status != "ok":
+                # The module may have lost track of the select as well:
                 del response[:]
-                while response_length != 0:
-                    response_frame = self.frame_get()
-                    if response_frame < 0:
-                        # We have a timeout:
-                        print("Response byte timeout")
-                        break
-                    response.append(response_frame)
-                    response_length -= 1
-
-                # Compute checksum:
-                checksum = 0
-                for ubyte in response:
-                    checksum += ubyte
-                checksum = (checksum + (checksum >>4)) & 0xf
+                self.address = -1
+            self.response_status = status
 
-                if trace:
-                    print("{0}response={1}, checksum=0x{2:x}". \
-                      format(trace_pad, response, checksum))
-
-                if checksum != response_checksum:
-                    print("Got checksum of 0x{0:x} instead of 0x{1:x}". \
-                      format(checksum, response_checksum))
-                    del response[:]
+            if trace:
+                print("{0}response={1}, status={2}". \
+                  format(trace_pad, list(response), status))
 
         if trace:
             self.trace_pad = trace_pad
             print("{0}<=Maker_Bus.flush() response={1}". \
-              format(trace_pad, self.response))
+              format(trace_pad, list(self.response)))
 
     def bus_reset(self):
 	""" {Maker_Bus_Base}: Reset the bus. """
@@ -201,7 +690,11 @@ class Maker_Bus_Base:
 	if trace:
 	    print("=>bus_reset()")
 
-	# Shove a 0xc5 out there to force a bus reset:
+	# Shove a 0xc5 out there to force a bus reset; this deselects
+	# every module:
+	if len(self.posted) != 0:
+	    self.posted_drain()
+	self.address = -1
 	serial = self.serial
 	serial.write(chr(0xc5))
 	serial.flush()
@@ -219,36 +712,51 @@ class Maker_Bus_Base:
 	if trace:
 	    print("<=bus_reset()")
 
-    def discovery_mode(self):
-        """ {Maker_Bus_Base}: Perform discovery mode """
+    def discovery_mode(self, deadline = 1.0):
+        """ {Maker_Bus_Base}: Perform discovery mode and return the list
+            of identification lines that the modules sent back.  Input
+            is read in bulk and parsed as it arrives; discovery gives up
+            after {deadline} seconds even if the final "!" line has not
+            shown up. """
 
         trace = self.trace
         if trace:
             trace_pad = self.trace_pad
             self.trace_pad = trace_pad + " "
+            print("{0}=>Maker_Bus.discovery_mode()".format(trace_pad))
 
-
+        # Discovery deselects every module:
+        if len(self.posted) != 0:
+            self.posted_drain()
+        self.address = -1
         serial = self.serial
         serial.write(chr(0xc4))
+        serial.flush()
         if trace:
             print("{0}write(0xc4)".format(trace_pad))
 
-        serial.flush()
-        line = []
+        # Each line starts with a marker character.  A "!" marker ends
+        # discovery:
+        end_time = time.time() + deadline
+        pending = ""
         ids = []
         done = False
-        while not done:
-            byte = serial.read(1)
-
-            if trace:
-                print("{0}read() => 0x{1:x}".format(trace_pad, ord(byte)))
-
-            if byte == '\n':
-                ids.append("".join(line[1:]))
-                done = len(line) != 0 and line[0] == '!'
-                del line[:]
-            else:
-                line.append(byte)
+        while not done and time.time() < end_time:
+            data = serial.read(max(1, serial.inWaiting()))
+            if trace and len(data) != 0:
+                print("{0}read() => {1}".format(trace_pad, repr(data)))
+            pending += data
+            lines = pending.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if line[0: 1] == "!":
+                    done = True
+                    break
+                ids.append(line[1:])
+
+        if not done:
+            print("Discovery did not finish within {0} seconds".
+              format(deadline))
 
         if trace:
             self.trace_pad = trace_pad
@@ -270,11 +778,17 @@ class Maker_Bus_Base:
         frame = -10;
         serial = self.serial
         result = serial.read(1)
+        recorder = self.recorder
         if len(result) != 0:
             frame = ord(result[0])
+            if recorder != None:
+                recorder.record(TRACE_READ, self.address, frame)
         else:
-            print("Timeout1")
+            if trace:
+                print("{0}Maker_Bus.frame_get: timeout".format(trace_pad))
             frame = -1
+            if recorder != None:
+                recorder.record(TRACE_TIMEOUT, self.address, frame)
             self.address = -1
 
         if trace:
@@ -292,31 +806,227 @@ class Maker_Bus_Base:
             self.trace_pad = trace_pad + " "
             print("{0}=>Maker_Bus.frame_put(0x{1:x})".format(trace_pad, frame))
 
-        serial = self.serial
-        if (frame > 0xff or (0xc1 <= frame and frame <= 0xc5)):
-            # Send {frame} as two bytes:
-            byte1 = 0xc0 | ((frame >> 7) & 3)
-            byte2 = frame & 0x7f
-            serial.write(chr(byte1))
-            serial.write(chr(byte2))
+        # Send {frame} as one or two bytes with a single write:
+        encoding = frame_encodings[frame]
+        self.serial.write(bytes(encoding))
+        recorder = self.recorder
+        if recorder != None:
+            if frame > 0xff:
+                recorder.record(TRACE_SELECT, frame & 0xff, frame)
+            else:
+                recorder.record(TRACE_WRITE, self.request_address, frame)
 
-            if trace:
-                print("{0}write(0x{1:x});write(0x{2:x})". \
-                  format(trace_pad, byte1, byte2))
-        else:
-            # Send {frame} as one byte:
-            serial.write(chr(frame))
+        if trace:
+            print("{0}write({1})".format(trace_pad,
+              " ".join(["0x{0:x}".format(byte) for byte in encoding])))
 
-            if trace:
-                print("{0}write(0x{1:x})".format(trace_pad, frame))
-            
         if trace:
             self.trace_pad = trace_pad
             print("{0}<=Maker_Bus.frame_put(0x{1:x})".format(trace_pad, frame))
 
 
-    def request_begin(self, address, command):
-        """ {Maker_Bus_Base}: Append {command} to self.request. """
+    def inventory_discover(self, deadline = 1.0):
+        """ {Maker_Bus_Base}: Run discovery (see {discovery_mode}()) and
+            return the bus inventory as a *dict* that maps each module
+            address to its identifier. """
+
+        inventory = {}
+        for line in self.discovery_mode(deadline):
+            fields = line.split(None, 1)
+            if len(fields) == 2:
+                try:
+                    inventory[int(fields[0])] = fields[1]
+                except ValueError:
+                    print("Bad discovery line '{0}'".format(line))
+        return inventory
+
+    def inventory_get(self, file_name, deadline = 1.0):
+        """ {Maker_Bus_Base}: Return the bus inventory.  The inventory
+            cached in {file_name} is used if every module in it still
+            answers; otherwise the whole bus is discovered (giving up
+            after {deadline} seconds) and the cache is rewritten. """
+
+        inventory = inventory_load(file_name)
+        if inventory == None or not self.inventory_verify(inventory):
+            inventory = self.inventory_discover(deadline)
+            inventory_save(inventory, file_name)
+        return inventory
+
+    def inventory_verify(self, inventory):
+        """ {Maker_Bus_Base}: Return {True} if each module in {inventory}
+            acknowledges being selected.  Modules that never acknowledge
+            (address bit 0x80 set) can not be checked and are assumed
+            to still be there. """
+
+        for address in sorted(inventory.keys()):
+            if (address & 0x80) == 0:
+                self.frame_put(address | 0x100)
+                self.serial.flush()
+                self.timeout_set(self.timeout_get(address))
+                if self.frame_get() < 0:
+                    self.address = -1
+                    return False
+                self.address = address
+        return True
+
+    def io_start(self, depth = 4):
+        """ {Maker_Bus_Base}: Start a {Maker_Bus_Io_Thread} that owns the
+            serial port of {self} and return it.  From then on the
+            transactions of every *Maker_Bus_Module* on {self} are sent
+            by that thread with up to {depth} in flight, so several
+            threads can share {self}. """
+
+        assert self.io_thread == None, "The I/O thread is already running"
+
+        self.io_thread = Maker_Bus_Io_Thread(self, depth)
+        return self.io_thread
+
+    def pipeline_flush(self, transactions, depth = 4, flush = True,
+      reorder = False):
+        """ {Maker_Bus_Base}: Send each {Maker_Bus_Transaction} in
+            {transactions} keeping up to {depth} of them in flight at
+            once.  Responses are matched back to their transactions in
+            FIFO order and the status of each transaction is filled in.
+            Unless {flush} is {False}, anything queued up by the
+            request_*() routines is flushed first.  When {reorder} is
+            {True}, the transactions are grouped by address (see
+            {transactions_group}()) so that fewer select frames are
+            needed.  {transactions} is returned. """
+
+        assert isinstance(transactions, list)
+        assert isinstance(depth, int) and depth >= 1
+
+        trace = self.trace
+        if trace:
+            trace_pad = self.trace_pad
+            self.trace_pad = trace_pad + " "
+            print("{0}=>Maker_Bus.pipeline_flush({1} transactions, {2})". \
+              format(trace_pad, len(transactions), depth))
+
+        # Get anything queued up by the request_*() routines out first:
+        if flush:
+            self.flush()
+        if len(self.posted) != 0:
+            self.posted_drain()
+
+        serial = self.serial
+        recorder = self.recorder
+        pending = list(transactions)
+        if reorder:
+            pending = transactions_group(pending)
+        in_flight = []
+        selected = self.address
+        while len(pending) != 0 or len(in_flight) != 0:
+            # Top up the window with a single write:
+            if len(in_flight) < depth and len(pending) != 0:
+                buffer = bytearray()
+                while len(in_flight) < depth and len(pending) != 0:
+                    transaction = pending.pop(0)
+                    address = transaction.address
+                    transaction.select = self.select_check(address, selected)
+                    selected = address
+                    transaction.frames_encode(buffer)
+                    transaction.attempts += 1
+                    in_flight.append(transaction)
+                    if recorder != None:
+                        transaction.record(recorder)
+                sent_time = time.time()
+                for transaction in in_flight:
+                    if transaction.sent_time < sent_time:
+                        transaction.sent_time = sent_time
+                serial.write(bytes(buffer))
+                serial.flush()
+                if trace:
+                    print("{0}write({1})".format(trace_pad,
+                      " ".join(["0x{0:x}".format(byte) for byte in buffer])))
+
+            # Retire the oldest transaction.  The round trip for it is
+            # measured from when it was sent or from when the previous
+            # transaction was retired, whichever is later:
+            transaction = in_flight.pop(0)
+            self.transaction_response_get(transaction)
+            retired_time = time.time()
+            for next_transaction in in_flight:
+                next_transaction.sent_time = retired_time
+            if trace:
+                print("{0}address=0x{1:x} status={2} response={3}". \
+                  format(trace_pad, transaction.address,
+                  transaction.status, list(transaction.response)))
+
+            # Idempotent transactions get another try after a backoff.
+            # After any failure the next transaction selects again:
+            status = transaction.status
+            retry = []
+            if status != "ok":
+                selected = -1
+                self.address = -1
+            if status != "ok" and transaction.idempotent and \
+              transaction.attempts <= self.retries_maximum:
+                time.sleep(self.retry_backoff *
+                  (1 << (transaction.attempts - 1)))
+                transaction.sent_time = 0.0
+                retry = [transaction]
+            if status == "timeout":
+                # Anything still in flight may have been lost or may
+                # arrive out of step, so throw away whatever is sitting
+                # in the input buffer.  The idempotent transactions still
+                # in flight are sent over again; the others may already
+                # have been carried out by the module, so they fail and
+                # the caller decides what to do:
+                serial.flushInput()
+                for next_transaction in in_flight:
+                    if next_transaction.idempotent:
+                        next_transaction.sent_time = 0.0
+                        retry.append(next_transaction)
+                    else:
+                        next_transaction.status = "timeout"
+                pending[0:0] = retry
+                del in_flight[:]
+            else:
+                pending[0:0] = retry
+
+        # The last transaction sent left its module selected:
+        self.address = selected
+
+        if trace:
+            self.trace_pad = trace_pad
+            print("{0}<=Maker_Bus.pipeline_flush()".format(trace_pad))
+
+        return transactions
+
+    def posted_drain(self):
+        """ {Maker_Bus_Base}: Read the responses to the transactions sent
+            by {transactions_post}() and fill in their statuses.  This
+            is done before anything else is read from the bus.  Failed
+            transactions are counted in {statistics}["posted_failures"];
+            after a timeout the remaining responses are thrown away. """
+
+        posted = self.posted
+        statistics = self.statistics
+        while len(posted) != 0:
+            transaction = posted.pop(0)
+            transaction.status = self.response_read(transaction.address,
+              transaction.response, transaction.sent_time,
+              transaction.request[0])
+            if transaction.status == "ok":
+                continue
+
+            # Select again next time; after a timeout the rest of the
+            # responses may be lost or out of step:
+            statistics["posted_failures"] += 1
+            self.address = -1
+            if transaction.status == "timeout":
+                for next_transaction in posted:
+                    next_transaction.status = "timeout"
+                    statistics["posted_failures"] += 1
+                del posted[:]
+                self.serial.flushInput()
+
+    def request_begin(self, address, command, idempotent = False):
+        """ {Maker_Bus_Base}: Append {command} to self.request.  Set
+            {idempotent} to {True} when {command} can safely be sent
+            more than once (e.g. a register get), so that it is retried
+            after a timeout or a bad checksum. """
 
         trace = self.trace
         if trace:
@@ -330,20 +1040,29 @@ class Maker_Bus_Base:
         self.request_safe = request_length
         if self.auto_flush and request_length != 0:
             self.flush()
+        if len(request) == 0:
+            self.request_idempotent = idempotent
+        else:
+            self.request_idempotent = self.request_idempotent and idempotent
+        self.request_address = address
 
-        if address == self.address:
-	    if self.same_address_requests >= 8:
-		self.address = -1
-	    else:
-		self.same_address_requests += 1
-
-	if address != self.address:
-	    self.same_address_requests = 0
+        if len(self.posted) != 0:
+            self.posted_drain()
+        if self.select_check(address, self.address):
+            select_time = time.time()
             self.frame_put(address | 0x100)
             self.address = address
             if (address & 0x80) == 0:
 		self.serial.flush()
-                self.frame_get()
+                self.timeout_set(self.timeout_get(address))
+                latencies = self.latencies
+                if self.frame_get() < 0:
+                    self.timeout_expired(address)
+                    if latencies != None:
+                        latencies.latency_get(address, command).timeouts += 1
+                elif latencies != None:
+                    latencies.latency_get(address, command).select.record(
+                      int((time.time() - select_time) * 1000000.0))
 
         request.append(command)
 
@@ -361,6 +1080,17 @@ class Maker_Bus_Base:
 	    ubyte = 0xff + byte + 1
 	self.request_ubyte_put(self, ubyte);
 
+    def request_bytes_put(self, data):
+        """ {Maker_Bus_Base}: Append the bytes in {data} (e.g. from
+            {Maker_Bus_Codec.pack}()) to current request in {self}. """
+
+        request = self.request
+        request.extend(bytearray(data))
+
+        if self.trace:
+            print("{0}Maker_Bus.request_bytes_put() request={1}". \
+              format(self.trace_pad, request))
+
     def request_end(self):
         """ {Maker_Bus_Base}: Indicate that current command is complete. """
 
@@ -381,7 +1111,7 @@ class Maker_Bus_Base:
         if trace:
             self.trace_pad = trace_pad
             print("{0}<=Maker_Bus.request_end() response={1}". \
-              format(trace_pad, self.response))
+              format(trace_pad, list(self.response)))
 
     def request_integer_put(self, integer):
         """ {Maker_Bus_Base}: Append {int32} to current request in {self}. """
@@ -471,7 +1201,7 @@ class Maker_Bus_Base:
             trace_pad = self.trace_pad
             self.trace_pad = trace_pad + " "
             print("{0}=>Maker_Bus.response_begin() response={1}". \
-              format(trace_pad, self.response))
+              format(trace_pad, list(self.response)))
 
         self.flush()
 
@@ -480,13 +1210,30 @@ class Maker_Bus_Base:
             self.trace_pad = trace_pad
 
     def response_byte_get(self):
-        """ {Maker_Bus_Base}: Return next unsigned byte from response
-	     in {self}. """
+        """ {Maker_Bus_Base}: Return next signed byte from response
+            in {self}. """
+
+        return self.response_unpack(byte_struct)
 
-	ubyte = self.response_ubyte_get()
-	if ubyte & 0x80 != 0:
-	    ubyte |= 0xffffff00
-	return ubyte
+    def response_codec_get(self, codec):
+        """ {Maker_Bus_Base}: Return the list of values decoded from the
+            response in {self} by the {Maker_Bus_Codec} {codec} and
+            advance the response cursor past them. """
+
+        if self.response_status != "ok":
+            raise Maker_Bus_Error(self.request_address, self.response_status)
+
+        index = self.response_index
+        assert index + codec.size <= len(self.response), \
+          "Response is too short for {0}".format(codec.types)
+        values = codec.unpack(self.response, index)
+        self.response_index = index + codec.size
+
+        if self.trace:
+            print("{0}Maker_Bus.response_codec_get({1})=>{2}". \
+              format(self.trace_pad, codec.types, values))
+
+        return values
 
     def response_end(self):
         """ {Maker_Bus_Base}: End a response sequence. """
@@ -496,122 +1243,595 @@ class Maker_Bus_Base:
             trace_pad = self.trace_pad
             self.trace_pad = trace_pad + " "
             print("{0}=>Maker_Bus.response_end() response={1}". \
-              format(trace_pad, self.response))
+              format(trace_pad, list(self.response)))
 
-        response = self.response
-        response_length = len(response)
-        assert len(response) == 0, \
+        response_length = len(self.response) - self.response_index
+        assert response_length == 0, \
           "{0} bytes left over from response".format(response_length)
 
         if trace:
             print("{0}<=Maker_Bus.response_end()".format(trace_pad))
             self.trace_pad = trace_pad
 
-
     def response_integer_get(self):
-        """ {Maker_Bus_Base}: Return next unsigned byte from response
-	    in {self}. """
-
-	# Python 3.0 has infinte precesion *int*'s, so we have to
-	# carefully convert to negative numbers:
-	uinteger = self.response_uinteger_get()
-	if (uinteger & 0x8000000) == 0:
-	    integer = uinteger
-	else:
-	    integer = -((uinteger & 0x7fffffff) ^ 0x7fffffff) - 1
-	return integer
-
-    def response_byte_get(self):
-        """ {Maker_Bus_Base}: Return next unsigned byte from response
-	    in {self}. """
-
-	# Python 3.0 has infinte precesion *int*'s, so we have to
-	# carefully convert to negative numbers:
-	ubyte = self.response_ubyte_get()
-	if ubyte & 0x80 == 0:
-	    byte = ubyte
-	else:
-	    byte = -((ubyte & 0x7f) ^ 0x7f) - 1
-        return byte
+        """ {Maker_Bus_Base}: Return next signed integer from response
+            in {self}. """
+
+        return self.response_unpack(integer_struct)
+
+    def response_read(self, address, response, start_time, command = -1):
+        """ {Maker_Bus_Base}: Read a response header and payload from
+            the module at {address} into {response} and return "ok",
+            "timeout" or "checksum".  {start_time} is when the request
+            went out and is used to update the round trip estimate for
+            {address}.  The latencies are recorded under {command}
+            (the first command of the request). """
+
+        latency = None
+        if self.latencies != None:
+            latency = self.latencies.latency_get(address, command)
+        self.timeout_set(self.timeout_get(address))
+        response_header = self.frame_get()
+        if response_header < 0:
+            self.timeout_expired(address)
+            if latency != None:
+                latency.timeouts += 1
+            return "timeout"
+        if latency != None:
+            latency.header.record(int((time.time() - start_time) * 1000000.0))
+
+        # Get the rest of the response:
+        response_length = response_header >> 4
+        while response_length != 0:
+            response_frame = self.frame_get()
+            if response_frame < 0:
+                self.timeout_expired(address)
+                if latency != None:
+                    latency.timeouts += 1
+                return "timeout"
+            response.append(response_frame)
+            response_length -= 1
+        rtt = time.time() - start_time
+        self.rtt_sample(address, rtt)
+
+        checksum = checksum_compute(response)
+        if checksum != response_header & 0xf:
+            if self.trace:
+                print("{0}Checksum mismatch: computed=0x{1:x} header=0x{2:x}".
+                  format(self.trace_pad, checksum, response_header & 0xf))
+            recorder = self.recorder
+            if recorder != None:
+                recorder.record(TRACE_CHECKSUM, address, checksum)
+            if latency != None:
+                latency.checksums += 1
+            return "checksum"
+        if latency != None:
+            latency.total.record(int(rtt * 1000000.0))
+        return "ok"
 
     def response_short_get(self):
-        """ {Maker_Bus_Base}: Return next unsigned byte from response
-	    in {self}. """
+        """ {Maker_Bus_Base}: Return next signed short from response
+            in {self}. """
 
-	# Python 3.0 has infinte precesion *int*'s, so we have to
-	# carefully convert to negative numbers:
-	ushort= self.response_ushort_get()
-	if ushort & 0x8000 == 0:
-	    short = ushort
-	else:
-	    short = -((ushort & 0x7fff) ^ 0x7fff) - 1
-        return short
+        return self.response_unpack(short_struct)
 
     def response_ubyte_get(self):
         """ {Maker_Bus_Base}: Return next unsigned byte from response
-	    in {self}. """
+            in {self}. """
 
-        response = self.response
-
-        trace = self.trace
-        if trace:
-            trace_pad = self.trace_pad
-            self.trace_pad = trace_pad + " "
-            print("{0}=>Maker_Bus.response_ubyte_get() response={1}". \
-              format(trace_pad, response))
+        return self.response_unpack(ubyte_struct)
 
-        ubyte = response[0]
-        del response[0]
+    def response_uinteger_get(self):
+        """ {Maker_Bus_Base}: Return next unsigned integer from response in
+            {self}. """
 
-        if trace:
-            print("{0}<=Maker_Bus.response_ubyte_get()=>{1}". \
-              format(trace_pad, ubyte))
-            self.trace_pad = trace_pad
+        return self.response_unpack(uinteger_struct)
 
-        return ubyte
+    def response_unpack(self, unpacker):
+        """ {Maker_Bus_Base}: Decode the next value from the response in
+            {self} using the precompiled *struct.Struct* {unpacker} and
+            advance the response cursor past it. """
 
-    def response_uinteger_get(self):
-        """ {Maker_Bus_Base}: Return next unsigned integer from response in
-	    {self}. """
+        if self.response_status != "ok":
+            raise Maker_Bus_Error(self.request_address, self.response_status)
 
-	byte0 = self.response_ubyte_get()
-	byte1 = self.response_ubyte_get()
-	byte2 = self.response_ubyte_get()
-	byte3 = self.response_ubyte_get()
-	result = (byte0 << 24) | (byte1 << 16) | (byte2 << 8) | byte3
+        index = self.response_index
+        value = unpacker.unpack_from(self.response, index)[0]
+        self.response_index = index + unpacker.size
 
-        trace = self.trace
-        if trace:
-            trace_pad = self.trace_pad
-            self.trace_pad = trace_pad + " "
-            print("{0}=>Maker_Bus.response_uinteger_get() result={1}". \
-              format(trace_pad, result))
+        if self.trace:
+            print("{0}Maker_Bus.response_unpack('{1}')=>{2}". \
+              format(self.trace_pad, unpacker.format, value))
 
-	return result
+        return value
 
     def response_ushort_get(self):
         """ {Maker_Bus_Base}: Return next unsigned short from response
-	    in {self}. """
+            in {self}. """
 
-        response = self.response
+        return self.response_unpack(ushort_struct)
 
-        trace = self.trace
-        if trace:
-            trace_pad = self.trace_pad
-            self.trace_pad = trace_pad + " "
-            print("{0}=>Maker_Bus.response_ushort_get() response={1}". \
-              format(trace_pad, response))
+    def rtt_sample(self, address, rtt):
+        """ {Maker_Bus_Base}: Fold the measured round trip time {rtt}
+            (in seconds) for the module at {address} into its smoothed
+            estimate and recompute the response timeout for {address}. """
 
-        high_ubyte = self.response_ubyte_get()
-        low_ubyte = self.response_ubyte_get()
-        ushort = (high_ubyte << 8) | low_ubyte
+        rtts = self.rtts
+        if address in rtts:
+            srtt, rttvar, timeout = rtts[address]
+            rttvar += (abs(srtt - rtt) - rttvar) / 4.0
+            srtt += (rtt - srtt) / 8.0
+        else:
+            srtt = rtt
+            rttvar = rtt / 2.0
+        timeout = min(self.timeout_maximum,
+          max(self.timeout_minimum, srtt + 4.0 * rttvar))
+        rtts[address] = [srtt, rttvar, timeout]
+
+    def select_check(self, address, selected):
+        """ {Maker_Bus_Base}: Return {True} if a select frame must be sent
+            to talk to the module at {address} when the module at
+            {selected} (-1 for none) is currently selected.  The select
+            statistics are updated as well.  When {select_refresh} is
+            non-zero, the module is selected again after that many
+            requests in a row even if it is still selected. """
+
+        statistics = self.statistics
+        acknowledged = (address & 0x80) == 0
+        select_refresh = self.select_refresh
+        if address == selected and (select_refresh == 0 or
+          self.same_address_requests < select_refresh):
+            self.same_address_requests += 1
+            statistics["selects_avoided"] += 1
+            if acknowledged:
+                statistics["select_round_trips_avoided"] += 1
+            return False
+
+        self.same_address_requests = 0
+        statistics["selects"] += 1
+        if acknowledged:
+            statistics["select_round_trips"] += 1
+        return True
+
+    def timeout_expired(self, address):
+        """ {Maker_Bus_Base}: Back off the response timeout for the module
+            at {address} after a read from it timed out. """
+
+        timeout = self.timeout_get(address)
+        rtts = self.rtts
+        if address not in rtts:
+            rtts[address] = [timeout, timeout / 2.0, timeout]
+        rtts[address][2] = min(self.timeout_maximum, timeout * 2.0)
+
+    def timeout_get(self, address):
+        """ {Maker_Bus_Base}: Return the response timeout for the module
+            at {address}. """
+
+        rtts = self.rtts
+        if address in rtts:
+            return rtts[address][2]
+        return self.timeout_initial
+
+    def timeout_set(self, timeout):
+        """ {Maker_Bus_Base}: Set the serial read timeout to {timeout}
+            seconds. """
+
+        if timeout != self.serial_timeout:
+            self.serial.timeout = timeout
+            self.serial_timeout = timeout
+
+    def transactions_post(self, transactions):
+        """ {Maker_Bus_Base}: Send {transactions}, which must all be for
+            modules at addresses with 0x80 set (which do not acknowledge
+            their select), in one write and return without waiting for
+            their responses.  Each transaction has a status of "posted"
+            until {posted_drain}() reads its response, which happens
+            before the bus is next used.  Posted transactions are not
+            retried, so only post work whose failure can be found out
+            later from {statistics}.  {transactions} is returned. """
+
+        io_thread = self.io_thread
+        if io_thread != None and \
+          io_thread.thread is not threading.current_thread():
+            return io_thread.call(self.transactions_post,
+              transactions).result()
+
+        if len(self.request) != 0:
+            self.flush()
+        buffer = bytearray()
+        recorder = self.recorder
+        selected = self.address
+        for transaction in transactions:
+            address = transaction.address
+            assert (address & 0x80) != 0, \
+              "Address 0x{0:x} acknowledges selects".format(address)
+            transaction.select = self.select_check(address, selected)
+            selected = address
+            transaction.frames_encode(buffer)
+            transaction.attempts += 1
+            transaction.status = "posted"
+            if recorder != None:
+                transaction.record(recorder)
+        sent_time = time.time()
+        for transaction in transactions:
+            transaction.sent_time = sent_time
+        serial = self.serial
+        serial.write(bytes(buffer))
+        serial.flush()
+        self.address = selected
+        self.posted.extend(transactions)
+        self.statistics["posted"] += len(transactions)
+        return transactions
+
+    def transactions_send(self, transactions, depth = 1):
+        """ {Maker_Bus_Base}: Send {transactions} with up to {depth} in
+            flight and wait for them to complete.  When {io_start}() has
+            been called, the transactions are handed to the I/O thread
+            and the calling thread waits for them; otherwise they are
+            sent directly.  {transactions} is returned. """
+
+        io_thread = self.io_thread
+        if io_thread != None and \
+          io_thread.thread is not threading.current_thread():
+            return io_thread.submit(transactions).result()
+        if len(transactions) == 1:
+            self.transaction_execute(transactions[0])
+        elif len(transactions) != 0:
+            self.pipeline_flush(transactions, depth)
+        return transactions
+
+    def transaction_execute(self, transaction):
+        """ {Maker_Bus_Base}: Send {transaction}, wait for its response
+            and fill in its status.  This is {pipeline_flush}() for a
+            single transaction without the window bookkeeping.
+            {transaction} is returned. """
+
+        # Get anything queued up by the request_*() routines out first:
+        if len(self.request) != 0:
+            self.flush()
+        if len(self.posted) != 0:
+            self.posted_drain()
 
-        if trace:
-            print("{0}<=Maker_Bus.response_ushort_get()=>{1}". \
-              format(trace_pad, ushort))
-            self.trace_pad = trace_pad
+        address = transaction.address
+        recorder = self.recorder
+        serial = self.serial
+        while True:
+            transaction.select = self.select_check(address, self.address)
+            buffer = transaction.frames_encode(bytearray())
+            transaction.attempts += 1
+            if recorder != None:
+                transaction.record(recorder)
+            transaction.sent_time = time.time()
+            serial.write(bytes(buffer))
+            serial.flush()
+            self.transaction_response_get(transaction)
 
-        return ushort
+            status = transaction.status
+            if status == "ok":
+                return transaction
+
+            # Select again next time and retry idempotent transactions
+            # after a backoff:
+            self.address = -1
+            if not transaction.idempotent or \
+              transaction.attempts > self.retries_maximum:
+                return transaction
+            time.sleep(self.retry_backoff * (1 << (transaction.attempts - 1)))
+            if status == "timeout":
+                serial.flushInput()
+
+    def transaction_response_get(self, transaction):
+        """ {Maker_Bus_Base}: Read the select acknowledge (if any) and
+            the response for {transaction} and fill in its status. """
+
+        # Modules with the 0x80 address bit set do not acknowledge
+        # the select frame:
+        address = transaction.address
+        command = transaction.request[0]
+        latencies = self.latencies
+        self.address = address
+        del transaction.response[:]
+        if transaction.select and (address & 0x80) == 0:
+            self.timeout_set(self.timeout_get(address))
+            if self.frame_get() < 0:
+                self.timeout_expired(address)
+                if latencies != None:
+                    latencies.latency_get(address, command).timeouts += 1
+                transaction.status = "timeout"
+                return transaction
+            if latencies != None:
+                latencies.latency_get(address, command).select.record(
+                  int((time.time() - transaction.sent_time) * 1000000.0))
+
+        transaction.status = self.response_read(address,
+          transaction.response, transaction.sent_time, command)
+        return transaction
+
+## @class Maker_Bus_Batch
+#
+# Commands collected by a "with" block and sent together.
+#
+# *Maker_Bus_Batch* is returned by *Maker_Bus_Base.batch*() and
+# *Maker_Bus_Module.batch*():
+#
+#        with motor3.batch():
+#            speed = motor3.speed_get()
+#            encoder = motor3.encoder_get()
+#            motor3.direction_invert_set(True)
+#        print(speed.result(), encoder.result())
+#
+# Inside of the block each accessor that goes through
+# *Maker_Bus_Module.transaction_call*() returns a *Maker_Bus_Future*.
+# The batch belongs to the thread that opened it; other threads that
+# share the *Maker_Bus_Base* are not affected by it, and the
+# *request_\**() routines are not batched.  When the block ends, the
+# commands for each address are packed into as few transactions as
+# possible, sent in one pipeline and the futures are resolved; a
+# future for a failed command raises *Maker_Bus_Error* from
+# *result*().  A batch opened with *wait* set to *False* posts the
+# transactions that return nothing to addresses with 0x80 set (see
+# *Maker_Bus_Base.transactions_post*()); their futures are resolved
+# to *None* right away and their failures only show up in the
+# "posted_failures" statistic of the *Maker_Bus_Base*.
+
+class Maker_Bus_Batch:
+
+    def __init__(self, maker_bus_base, depth, wait = True):
+        """ {Maker_Bus_Batch}: Initialize {self} to collect commands for
+            {maker_bus_base}. """
+
+        assert isinstance(maker_bus_base, Maker_Bus_Base)
+        assert isinstance(depth, int) and depth >= 1
+        assert isinstance(wait, bool)
+
+        self.commands = []
+        self.depth = depth
+        self.maker_bus_base = maker_bus_base
+        self.wait = wait
+
+    def __enter__(self):
+        """ {Maker_Bus_Batch}: Start collecting commands. """
+
+        maker_bus_base = self.maker_bus_base
+        thread = threading.current_thread()
+        assert thread not in maker_bus_base.batches, "Batches do not nest"
+        maker_bus_base.batches[thread] = self
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        """ {Maker_Bus_Batch}: Stop collecting commands and send them,
+            unless the block raised {exception}. """
+
+        maker_bus_base = self.maker_bus_base
+        del maker_bus_base.batches[threading.current_thread()]
+        if exception_type == None:
+            self.flush()
+        else:
+            for module, request, idempotent, codec, future in self.commands:
+                future.error_set(Maker_Bus_Error(module.address, "aborted"))
+            del self.commands[:]
+        return False
+
+    def command_add(self, module, request, idempotent, response_codec):
+        """ {Maker_Bus_Batch}: Queue up {request} (a command followed by
+            its packed arguments) for {module} and return a future for
+            its response decoded by {response_codec}. """
+
+        future = Maker_Bus_Future()
+        self.commands.append(
+          (module, request, idempotent, response_codec, future))
+        return future
+
+    def flush(self):
+        """ {Maker_Bus_Batch}: Send the queued commands and resolve their
+            futures.  When the bus has an admission controller (see
+            *Maker_Bus_Base.admission*) that refuses the transactions,
+            the futures fail with "bandwidth" instead. """
+
+        commands = self.commands
+        batches = self.transactions_build()
+        admission = self.maker_bus_base.admission
+        if admission != None and not admission.transactions_admit(
+          [(transaction, sum([commands[index][3].size
+          for index in command_indices]))
+          for transaction, command_indices in batches]):
+            for module, request, idempotent, codec, future in commands:
+                future.error_set(Maker_Bus_Error(module.address, "bandwidth"))
+            del commands[:]
+            return
+        self.transactions_send(batches)
+
+        # Hand each command its slice of the response:
+        for transaction, command_indices in batches:
+            if transaction.status == "posted":
+                for index in command_indices:
+                    commands[index][4].result_set(None)
+                continue
+            response = transaction.response
+            status = transaction.status
+            offset = 0
+            for index in command_indices:
+                module, request, idempotent, codec, future = commands[index]
+                if status == "ok" and offset + codec.size > len(response):
+                    status = "length"
+                if status == "ok":
+                    future.result_set(codec.result(response, offset))
+                else:
+                    future.error_set(Maker_Bus_Error(module.address, status))
+                offset += codec.size
+        del commands[:]
+
+    def transactions_send(self, batches):
+        """ {Maker_Bus_Batch}: Send the transactions of {batches} (see
+            {transactions_build}()) in order.  Unless {wait} is set, runs
+            of transactions that return nothing to addresses with 0x80
+            set are posted instead of waited for. """
+
+        maker_bus_base = self.maker_bus_base
+        commands = self.commands
+        run = []
+        run_posted = False
+        for transaction, command_indices in batches + [(None, [])]:
+            posted = transaction != None and not self.wait and \
+              (transaction.address & 0x80) != 0 and \
+              sum([commands[index][3].size for index in command_indices]) == 0
+            if len(run) != 0 and (transaction == None or posted != run_posted):
+                if run_posted:
+                    maker_bus_base.transactions_post(run)
+                else:
+                    maker_bus_base.transactions_send(run, self.depth)
+                run = []
+            run.append(transaction)
+            run_posted = posted
+
+    def transactions_build(self):
+        """ {Maker_Bus_Batch}: Return the (transaction, command indices)
+            pairs that carry the queued commands of {self}. """
+
+        # Group the commands by address keeping their order:
+        commands = self.commands
+        addresses = []
+        groups = {}
+        for index in range(len(commands)):
+            module = commands[index][0]
+            address = module.address
+            if address not in groups:
+                addresses.append(address)
+                groups[address] = (module, [])
+            groups[address][1].append(index)
+
+        # Pack the commands for each address into transactions; only
+        # transactions made up of idempotent commands are retried:
+        batches = []
+        for address in addresses:
+            module, indices = groups[address]
+            for transaction, command_indices in module.transactions_pack(
+              [(commands[index][1], commands[index][3].size)
+              for index in indices]):
+                command_indices = \
+                  [indices[command_index] for command_index in command_indices]
+                transaction.idempotent = True
+                for index in command_indices:
+                    transaction.idempotent &= commands[index][2]
+                batches.append((transaction, command_indices))
+        return batches
+
+## @class Maker_Bus_Io_Thread
+#
+# The thread that owns the serial port of a *Maker_Bus_Base*.
+#
+# *Maker_Bus_Io_Thread* is started by *Maker_Bus_Base.io_start*().  Any
+# thread can *submit*() a list of *Maker_Bus_Transaction* objects and
+# gets back a *Maker_Bus_Future* that is done once they have completed.
+# Whatever has been submitted while the thread was busy goes out in the
+# next pipeline, so concurrent users (say the configurator and a robot
+# script) interleave at transaction granularity.  *call*() runs any
+# other function (e.g. code that uses the *request_\**() routines,
+# which are not thread safe) on the I/O thread between pipelines.
+
+class Maker_Bus_Io_Thread:
+
+    def __init__(self, maker_bus_base, depth = 4):
+        """ {Maker_Bus_Io_Thread}: Initialize {self} to send the
+            transactions for {maker_bus_base} with up to {depth} in
+            flight and start the thread. """
+
+        assert isinstance(maker_bus_base, Maker_Bus_Base)
+        assert isinstance(depth, int) and depth >= 1
+
+        self.depth = depth
+        self.jobs = Queue.Queue()
+        self.maker_bus_base = maker_bus_base
+        self.thread = threading.Thread(target = self.run,
+          name = "Maker_Bus_Io_Thread")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def call(self, function, *arguments):
+        """ {Maker_Bus_Io_Thread}: Queue up a call of
+            {function}({arguments}) on {self} and return a
+            *Maker_Bus_Future* for its result. """
+
+        future = Maker_Bus_Future()
+        self.jobs.put((function, arguments, future))
+        return future
+
+    def close(self):
+        """ {Maker_Bus_Io_Thread}: Finish the queued jobs and stop
+            {self}.  Transactions are sent directly again afterwards. """
+
+        self.jobs.put(None)
+        self.thread.join()
+        self.maker_bus_base.io_thread = None
+
+    def run(self):
+        """ {Maker_Bus_Io_Thread}: Run queued jobs until {close}() is
+            called.  This is the body of the thread. """
+
+        jobs = self.jobs
+        maker_bus_base = self.maker_bus_base
+        running = True
+        while running:
+            # Wait for a job and then take everything else that is queued:
+            pending = [jobs.get()]
+            while True:
+                try:
+                    pending.append(jobs.get_nowait())
+                except Queue.Empty:
+                    break
+
+            # Consecutive submissions share one pipeline; calls run
+            # between pipelines:
+            submissions = []
+            for job in pending:
+                if job != None and job[0] == None:
+                    submissions.append(job)
+                    continue
+                if len(submissions) != 0:
+                    self.submissions_send(submissions)
+                    submissions = []
+                if job == None:
+                    # {close}() has been called:
+                    running = False
+                    continue
+                function, arguments, future = job
+                try:
+                    value = function(*arguments)
+                except Exception as error:
+                    future.error_set(error)
+                else:
+                    future.result_set(value)
+            if len(submissions) != 0:
+                self.submissions_send(submissions)
+
+    def submissions_send(self, submissions):
+        """ {Maker_Bus_Io_Thread}: Send the transactions of each
+            (*None*, transactions, future) job in {submissions} in one
+            pipeline and complete the futures. """
+
+        transactions = []
+        for function, job_transactions, future in submissions:
+            transactions.extend(job_transactions)
+        try:
+            self.maker_bus_base.transactions_send(transactions, self.depth)
+        except Exception as error:
+            for function, job_transactions, future in submissions:
+                future.error_set(error)
+        else:
+            for function, job_transactions, future in submissions:
+                future.result_set(job_transactions)
+
+    def submit(self, transactions):
+        """ {Maker_Bus_Io_Thread}: Queue up {transactions} to be sent by
+            {self} and return a *Maker_Bus_Future* that is done with
+            {transactions} once they have all completed. """
+
+        for transaction in transactions:
+            assert isinstance(transaction, Maker_Bus_Transaction)
+
+        future = Maker_Bus_Future()
+        self.jobs.put((None, transactions, future))
+        return future
 
 ## @class Maker_Bus_Module
 #
@@ -625,6 +1845,12 @@ class Maker_Bus_Base:
 class Maker_Bus_Module:
     """ {Maker_Bus_Module}: This represents a single module on the bus: """
 
+    # *True* when the accessors go through {transaction_call}(), which is
+    # what batches, the shadow and groups rely on; sub-classes generated
+    # without *transactions* (see *Project.python_write*) set it to
+    # *False*:
+    transaction_accessors = True
+
     def __init__(self, maker_bus_base, address, offset):
         """ {Maker_Bus_Module}: Initialize {self} to contain {maker_bus_base}
             and {address}."""
@@ -636,6 +1862,10 @@ class Maker_Bus_Module:
         self.maker_bus_base = maker_bus_base
         self.address = address
         self.offset = offset
+        self.shadow = None
+        self.shadow_statistics = {"hits": 0, "misses": 0}
+        self.stream_statistics = {"commands": 0, "transactions": 0,
+          "bytes": 0, "seconds": 0.0}
 
     def auto_flush_set(self, flush_mode):
         """ {Maker_Bus_Module}:  This routine will set the auto flush mode for
@@ -647,16 +1877,46 @@ class Maker_Bus_Module:
 
         self.maker_bus_base.auto_flush_set(flush_mode)
 
+    def batch(self, depth = 4, wait = True):
+        """ {Maker_Bus_Module}: Return a {Maker_Bus_Batch} for the bus
+            that {self} is on (see {Maker_Bus_Base.batch}()). """
+
+        return self.maker_bus_base.batch(depth, wait)
+
     def flush(self):
         """ {Maker_Bus_Module}: This routine will cause any queued commands
             to be flushed.  """
 
         self.maker_bus_base.flush()
 
-    def request_begin(self, command):
+    def function_call(self, function, arguments, offset = 0):
+        """ {Maker_Bus_Module}: Call the *Function* {function} with
+            {arguments} and return its results (see
+            {Maker_Bus_Codec.result}()).  {offset} is added to the
+            command number for modules that share a slave (see
+            *Module_Use.offset*). """
+
+        parameters_codec, results_codec = function_codecs(function)
+        return self.transaction_call(offset + function.number, False,
+          parameters_codec, arguments, results_codec)
+
+    def function_stream(self, function, arguments_list, offset = 0,
+      depth = 4):
+        """ {Maker_Bus_Module}: Call the *Function* {function} once for
+            each argument tuple in {arguments_list} (e.g. each character
+            of a string for an LCD "character send" function) using
+            {stream}() and return the list of results.  {offset} is
+            added to the command number as in {function_call}(). """
+
+        parameters_codec, results_codec = function_codecs(function)
+        return self.stream(offset + function.number, parameters_codec,
+          arguments_list, results_codec, depth)
+
+    def request_begin(self, command, idempotent = False):
 	""" {Maker_Bus_Module}: """
 
-        self.maker_bus_base.request_begin(self.address, self.offset + command)
+        self.maker_bus_base.request_begin(self.address,
+          self.offset + command, idempotent)
 
     def request_byte_put(self, byte):
 	""" {Maker_Bus_Module}: """
@@ -762,3 +2022,422 @@ class Maker_Bus_Module:
 	""" {Maker_Bus_Module}: """
 
         self.maker_bus_base.response_end()
+
+    def register_get(self, register, offset = 0):
+        """ {Maker_Bus_Module}: Return the value of the *Register*
+            {register}.  {offset} is added to the register number for
+            modules that share a slave (see *Module_Use.offset*).  A
+            non-volatile register is read through the shadow copy (see
+            {register_shadow_get}()). """
+
+        if not register.volatile:
+            return self.register_shadow_get(offset + register.number,
+              register_codec(register))
+        return self.transaction_call(offset + register.number, True,
+          empty_codec, (), register_codec(register))
+
+    def register_set(self, register, value, offset = 0):
+        """ {Maker_Bus_Module}: Set the *Register* {register} to {value}.
+            {offset} is added to the register number for modules that
+            share a slave (see *Module_Use.offset*).  *Maker_Bus_Error*
+            is raised if the module did not answer.  A non-volatile
+            register is written through the shadow copy (see
+            {register_shadow_set}()). """
+
+        if not register.volatile:
+            return self.register_shadow_set(offset + register.number,
+              register_codec(register), value)
+        return self.transaction_call(offset + register.number + 1, True,
+          register_codec(register), (value,), empty_codec)
+
+    def register_shadow_get(self, command, codec):
+        """ {Maker_Bus_Module}: Return the value of the register that is
+            read by {command} and decoded by the {Maker_Bus_Codec}
+            {codec}.  When the shadow is enabled (see {shadow_enable}())
+            and holds the register, the value comes from the shadow and
+            nothing is sent; otherwise the register is read and the
+            value is remembered.  Inside of a {batch}() block a
+            *Maker_Bus_Future* is returned as for {transaction_call}(). """
+
+        shadow = self.shadow
+        if shadow != None and command in shadow:
+            self.shadow_statistics["hits"] += 1
+            return self.shadow_result(shadow[command])
+
+        result = self.transaction_call(command, True, empty_codec, (), codec)
+        if shadow != None:
+            self.shadow_statistics["misses"] += 1
+            if isinstance(result, Maker_Bus_Future):
+                def remember(future):
+                    if future.error == None and self.shadow != None:
+                        self.shadow[command] = future.value
+                result.callback_add(remember)
+            else:
+                shadow[command] = result
+        return result
+
+    def register_shadow_set(self, command, codec, value):
+        """ {Maker_Bus_Module}: Set the register that is read by {command}
+            (and set by {command} + 1) to {value} packed by the
+            {Maker_Bus_Codec} {codec}.  When the shadow is enabled (see
+            {shadow_enable}()) and already holds {value}, nothing is
+            sent.  Otherwise the register is written and, once the
+            write succeeds, the shadow holds {value} as the module will
+            hold it (e.g. 251 for a Byte is -5); until then the
+            register is unknown.  Inside of a {batch}() block a
+            *Maker_Bus_Future* is returned as for {transaction_call}(). """
+
+        shadow = self.shadow
+        if shadow != None:
+            # Compare and remember the value that the register will
+            # actually hold:
+            value = codec.unpack(codec.pack((value,)))[0]
+            if command in shadow and shadow[command] == value:
+                self.shadow_statistics["hits"] += 1
+                return self.shadow_result(None)
+            self.shadow_statistics["misses"] += 1
+            shadow.pop(command, None)
+
+        result = self.transaction_call(command + 1, True, codec, (value,),
+          empty_codec)
+        if shadow != None:
+            if isinstance(result, Maker_Bus_Future):
+                def remember(future):
+                    if future.error == None and self.shadow != None:
+                        self.shadow[command] = value
+                result.callback_add(remember)
+            else:
+                shadow[command] = value
+        return result
+
+    def registers_get(self, registers):
+        """ {Maker_Bus_Module}: Read each *Register* in {registers} using as
+            few bus transactions as possible and return a *dict* of the
+            values keyed by register name.  Registers whose transaction
+            failed have a value of *None*. """
+
+        batches = self.registers_get_batches(registers)
+        self.maker_bus_base.transactions_send(
+          [transaction for transaction, indices in batches])
+        return self.registers_get_values(registers, batches)
+
+    def registers_get_batches(self, registers):
+        """ {Maker_Bus_Module}: Return the (transaction, command indices)
+            pairs that read each *Register* in {registers}.  The
+            transactions still need to be sent (e.g. by
+            {Maker_Bus_Base.pipeline_flush}()) and the values decoded
+            by {registers_get_values}(). """
+
+        commands = []
+        for register in registers:
+            commands.append(([(self.offset + register.number) & 0xff],
+              register_codec(register).size))
+        batches = self.transactions_pack(commands)
+        for transaction, indices in batches:
+            transaction.idempotent = True
+        return batches
+
+    def registers_get_values(self, registers, batches):
+        """ {Maker_Bus_Module}: Return a *dict* keyed by register name of
+            the values of {registers} decoded from the completed
+            {batches} returned by {registers_get_batches}(). """
+
+        values = {}
+        for transaction, indices in batches:
+            response = transaction.response
+            index = 0
+            for command_index in indices:
+                register = registers[command_index]
+                codec = register_codec(register)
+                value = None
+                if transaction.status == "ok" and \
+                  index + codec.size <= len(response):
+                    value = codec.unpack(response, index)[0]
+                index += codec.size
+                values[register.name] = value
+        return values
+
+    def registers_set(self, register_values):
+        """ {Maker_Bus_Module}: Write each (*Register*, value) pair in
+            {register_values} using as few bus transactions as possible.
+            *True* is returned if every transaction succeeded. """
+
+        commands = []
+        for register, value in register_values:
+            commands.append(([(self.offset + register.number + 1) & 0xff] +
+              list(bytearray(register_codec(register).pack((value,)))), 0))
+        batches = self.transactions_pack(commands)
+        for transaction, indices in batches:
+            transaction.idempotent = True
+        self.maker_bus_base.transactions_send(
+          [transaction for transaction, indices in batches])
+
+        for transaction, indices in batches:
+            if transaction.status != "ok":
+                return False
+        return True
+
+    def shadow_clear(self):
+        """ {Maker_Bus_Module}: Forget every register value in the shadow
+            of {self} (e.g. after the module has been reset), so that
+            the next access to each register goes to the module. """
+
+        if self.shadow != None:
+            self.shadow = {}
+
+    def shadow_enable(self, enable = True):
+        """ {Maker_Bus_Module}: Turn the register shadow of {self} on or
+            off.  The shadow is a copy of the values of the non-volatile
+            *Register*s (see *Register.volatile*) that is kept up to date
+            as they are written: reads are served from it and writes of
+            the value that the register already holds are dropped.  It
+            starts out empty and {shadow_statistics} counts the accesses
+            that it did ("hits") and did not ("misses") answer.  It is
+            off unless enabled.  The accessors of {self} must go through
+            {transaction_call}() (see {transaction_accessors}). """
+
+        assert not enable or self.transaction_accessors, \
+          "Module 0x{0:x} needs accessors generated with --transactions " \
+          "for a shadow".format(self.address)
+        if not enable:
+            self.shadow = None
+        elif self.shadow == None:
+            self.shadow = {}
+
+    def shadow_result(self, value):
+        """ {Maker_Bus_Module}: Return {value} for an access that was
+            answered by the shadow; inside of a {batch}() block it is
+            wrapped in a done *Maker_Bus_Future*. """
+
+        if self.maker_bus_base.batch_get() == None:
+            return value
+        future = Maker_Bus_Future()
+        future.result_set(value)
+        return future
+
+    def transaction_create(self, command, ubytes):
+        """ {Maker_Bus_Module}: Return a {Maker_Bus_Transaction} that sends
+            {command} followed by {ubytes} to {self}.  The transaction
+            is sent by {Maker_Bus_Base.pipeline_flush}(). """
+
+        return Maker_Bus_Transaction(self.address,
+          [(self.offset + command) & 0xff] +
+          [ubyte & 0xff for ubyte in ubytes])
+
+    def stream(self, command, request_codec, arguments_list,
+      response_codec, depth = 4, idempotent = False):
+        """ {Maker_Bus_Module}: Send {command} to {self} once for each
+            argument tuple in {arguments_list} (packed by
+            {request_codec}) and return the list of responses decoded
+            by {response_codec} (see {Maker_Bus_Codec.result}()).  The
+            commands are packed into as few requests as the 16 byte
+            limit allows and up to {depth} requests are kept in flight.
+            *Maker_Bus_Error* is raised if any request fails; the
+            counters in {stream_statistics} are updated either way. """
+
+        start_time = time.time()
+        command = (self.offset + command) & 0xff
+        response_size = response_codec.size
+        commands = []
+        for arguments in arguments_list:
+            commands.append(([command] +
+              list(bytearray(request_codec.pack(arguments))), response_size))
+        batches = self.transactions_pack(commands)
+        transactions = [transaction for transaction, indices in batches]
+        for transaction in transactions:
+            transaction.idempotent = idempotent
+        self.maker_bus_base.transactions_send(transactions, depth)
+
+        # Reassemble the responses:
+        results = []
+        status = "ok"
+        payload_bytes = 0
+        for transaction, indices in batches:
+            response = transaction.response
+            payload_bytes += len(transaction.request) + len(response)
+            if status == "ok":
+                status = transaction.status
+            if status == "ok" and \
+              len(response) != len(indices) * response_size:
+                status = "length"
+            if status == "ok":
+                for index in range(len(indices)):
+                    results.append(
+                      response_codec.result(response, index * response_size))
+
+        statistics = self.stream_statistics
+        statistics["commands"] += len(commands)
+        statistics["transactions"] += len(transactions)
+        statistics["bytes"] += payload_bytes
+        statistics["seconds"] += time.time() - start_time
+        if status != "ok":
+            raise Maker_Bus_Error(self.address, status)
+        return results
+
+    def stream_throughput(self):
+        """ {Maker_Bus_Module}: Return the average number of payload
+            bytes (commands, arguments and results) per second moved
+            by {stream}() so far. """
+
+        statistics = self.stream_statistics
+        if statistics["seconds"] == 0.0:
+            return 0.0
+        return statistics["bytes"] / statistics["seconds"]
+
+    def transaction_call(self, command, idempotent, request_codec,
+      arguments, response_codec):
+        """ {Maker_Bus_Module}: Send {command} followed by {arguments}
+            packed by the {Maker_Bus_Codec} {request_codec} to {self} as
+            one transaction and return the response decoded by
+            {response_codec} (see {Maker_Bus_Codec.result}()).
+            {idempotent} transactions are retried after failures.
+            *Maker_Bus_Error* is raised if the transaction fails.  This
+            is what the accessors generated by
+            *Project.python_write*(..., {True}) call.  Inside of a
+            {batch}() block, the command is queued up instead and a
+            *Maker_Bus_Future* for the response is returned. """
+
+        request = bytearray(request_codec.pack(arguments))
+        request.insert(0, (self.offset + command) & 0xff)
+        batch = self.maker_bus_base.batch_get()
+        if batch != None:
+            return batch.command_add(self, list(request), idempotent,
+              response_codec)
+        transaction = Maker_Bus_Transaction(self.address, list(request))
+        transaction.idempotent = idempotent
+        self.maker_bus_base.transactions_send([transaction])
+
+        status = transaction.status
+        response = transaction.response
+        if status == "ok" and len(response) != response_codec.size:
+            status = "length"
+        if status != "ok":
+            raise Maker_Bus_Error(self.address, status)
+        return response_codec.result(response)
+
+    def transactions_pack(self, commands):
+        """ {Maker_Bus_Module}: Pack {commands}, a list of (request bytes,
+            response size) pairs, into as few transactions to {self} as
+            possible.  Like {Maker_Bus_Base.flush}(), requests are only
+            split between commands and both the request and the response
+            of each transaction stay under 16 bytes.  A list of
+            (transaction, command indices) pairs is returned. """
+
+        batches = []
+        request = []
+        response_size = 0
+        indices = []
+        for index in range(len(commands)):
+            command_request, command_response_size = commands[index]
+            assert len(command_request) < 16 and command_response_size < 16
+            if len(request) + len(command_request) >= 16 or \
+              response_size + command_response_size >= 16:
+                batches.append(
+                  (Maker_Bus_Transaction(self.address, request), indices))
+                request = []
+                response_size = 0
+                indices = []
+            request.extend(command_request)
+            response_size += command_response_size
+            indices.append(index)
+        if len(request) != 0:
+            batches.append(
+              (Maker_Bus_Transaction(self.address, request), indices))
+        return batches
+
+## @class Maker_Bus_Group
+#
+# Several modules that are updated together.
+#
+# *Maker_Bus_Group* sends the same operation to each of its
+# *Maker_Bus_Module*s as one pipelined *Maker_Bus_Batch*: every request
+# goes out in a single write and then the response of each module is
+# read and checked, so a group update costs about one round trip
+# instead of one per module.  When *wait* is *False*, register sets
+# and other operations that return nothing to modules at addresses
+# with 0x80 set (e.g. the motors of a robot) are posted in one burst
+# and return right away; their responses are drained before the bus is
+# next used (see *Maker_Bus_Base.transactions_post*()).  Operations
+# that return values always wait.
+# Groups are declared with the *Group* attribute of a *Module_Use* in the
+# project XML and show up as attributes of the *Project* generated with
+# *transactions*:
+#
+#        project.motors.call("speed_set", 55)
+
+class Maker_Bus_Group:
+
+    def __init__(self, maker_bus_base, maker_bus_modules, wait = True):
+        """ {Maker_Bus_Group}: Initialize {self} to update each
+            *Maker_Bus_Module* in {maker_bus_modules} on {maker_bus_base}
+            together, waiting for each response unless {wait} is
+            {False}. """
+
+        assert isinstance(maker_bus_base, Maker_Bus_Base)
+        assert isinstance(maker_bus_modules, list)
+        assert isinstance(wait, bool)
+        for maker_bus_module in maker_bus_modules:
+            assert isinstance(maker_bus_module, Maker_Bus_Module)
+            assert maker_bus_module.maker_bus_base is maker_bus_base
+            assert maker_bus_module.transaction_accessors, \
+              "Module 0x{0:x} needs accessors generated with " \
+              "--transactions to be in a group". \
+              format(maker_bus_module.address)
+
+        self.maker_bus_base = maker_bus_base
+        self.maker_bus_modules = maker_bus_modules
+        self.wait = wait
+
+    def call(self, method_name, *arguments):
+        """ {Maker_Bus_Group}: Call the method named {method_name} (e.g.
+            "speed_set") of each module with {arguments} in one
+            pipelined batch (see {modules_apply}()). """
+
+        return self.modules_apply(
+          lambda maker_bus_module:
+          getattr(maker_bus_module, method_name)(*arguments))
+
+    def function_call(self, function, arguments, offset = 0):
+        """ {Maker_Bus_Group}: Call the *Function* {function} with
+            {arguments} on each module in one pipelined batch (see
+            *Maker_Bus_Module.function_call*()). """
+
+        return self.modules_apply(
+          lambda maker_bus_module:
+          maker_bus_module.function_call(function, arguments, offset))
+
+    def modules_apply(self, operation):
+        """ {Maker_Bus_Group}: Call {operation}(*maker_bus_module*) for
+            each module of {self} inside of one *Maker_Bus_Batch* so that
+            the requests go out in one write, and return the list of
+            results once every response has been read ({None} for each
+            posted operation when {wait} is {False}).
+            *Maker_Bus_Error* is raised for the first module that
+            failed (after every module has been tried).  Inside of a
+            {Maker_Bus_Base.batch}() block the operations are just
+            queued up and the list of *Maker_Bus_Future*s is returned. """
+
+        maker_bus_base = self.maker_bus_base
+        maker_bus_modules = self.maker_bus_modules
+        if maker_bus_base.batch_get() != None:
+            return [operation(maker_bus_module)
+              for maker_bus_module in maker_bus_modules]
+
+        with maker_bus_base.batch(max(1, len(maker_bus_modules)), self.wait):
+            results = [operation(maker_bus_module)
+              for maker_bus_module in maker_bus_modules]
+        values = []
+        for result in results:
+            if isinstance(result, Maker_Bus_Future):
+                result = result.result()
+            values.append(result)
+        return values
+
+    def register_set(self, register, value, offset = 0):
+        """ {Maker_Bus_Group}: Set the *Register* {register} of each
+            module to {value} in one pipelined batch (see
+            *Maker_Bus_Module.register_set*()). """
+
+        self.modules_apply(
+          lambda maker_bus_module:
+          maker_bus_module.register_set(register, value, offset))
@@ -0,0 +1,464 @@
+## @package maker_bus_async
+#
+# Event loop driven MakerBus client
+#
+# This package provides a MakerBus client that never blocks in a
+# serial read.  The serial port file descriptor is put into
+# non-blocking mode and a *select*() based loop reads whatever bytes
+# are available, matching them to the transaction that is in flight.
+#
+# Python 2 does not have *asyncio*, so tasks are written as generator
+# functions that yield *Maker_Bus_Future* objects.  The loop resumes
+# a task with the future's value once it is done:
+#
+#        def encoder_poll(motor3):
+#            while True:
+#                yield motor3.request_begin(6)
+#                status = yield motor3.request_end()
+#                encoder = yield motor3.response_integer_get()
+#                yield motor3.response_end()
+#                yield base.sleep(0.01)
+#
+#        base = Maker_Bus_Async_Base(serial)
+#        motor3 = Maker_Bus_Async_Module(base, 0x85, 0)
+#        base.run([encoder_poll(motor3), ...])
+#
+# Any number of tasks can share one *Maker_Bus_Async_Base*; their
+# transactions go out one at a time in the order they were submitted.
+# Each task should use its own *Maker_Bus_Async_Module* since the
+# request being built and the response being decoded live there.
+#
+# The file descriptor can be anything that behaves like a tty,
+# including the master side of an *os.openpty*() pair with a stand-in
+# slave on the other side.
+
+import errno
+import fcntl
+import heapq
+import os
+import select
+import time
+from maker_bus import *
+
+## @brief Return a *Maker_Bus_Future* that is already done with *value*.
+#  @param value The value of the returned future
+#
+# This is used by the operations that never wait for the bus so
+# that every operation can be yielded the same way.
+
+def future_resolved(value):
+    """ Return a done {Maker_Bus_Future} with {value}. """
+
+    future = Maker_Bus_Future()
+    future.result_set(value)
+    return future
+
+## @class Maker_Bus_Async_Base
+#
+# Non-blocking shared interface to the MakerBus.
+#
+# *Maker_Bus_Async_Base* owns the serial file descriptor.  It sends one
+# *Maker_Bus_Transaction* at a time and completes the future for each
+# transaction when its response arrives, its checksum fails, or it
+# times out.  It also runs the generator tasks that use it.
+
+class Maker_Bus_Async_Base:
+
+    def __init__(self, serial, timeout = 0.004):
+        """ {Maker_Bus_Async_Base}: Initialize {self} to talk to the
+            MakerBus over {serial}, which is either an open *Serial*
+            object or a file descriptor.  {timeout} is the number of
+            seconds to wait for each response byte. """
+
+        assert isinstance(timeout, float)
+
+        if isinstance(serial, int):
+            fd = serial
+        else:
+            fd = serial.fileno()
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self.deadline = None
+        self.fd = fd
+        self.futures = []
+        self.input = bytearray()
+        self.output = bytearray()
+        self.recorder = Maker_Bus_Trace()
+        self.serial = serial
+        self.tasks_active = 0
+        self.tasks_ready = []
+        self.timeout = timeout
+        self.timers = []
+        self.trace = False
+        self.transaction = None
+        self.transaction_future = None
+        self.transactions = []
+
+    def input_process(self):
+        """ {Maker_Bus_Async_Base}: Complete the transaction in flight if
+            all of its response bytes have arrived. """
+
+        transaction = self.transaction
+        input = self.input
+        if transaction == None:
+            # Nobody is expecting these bytes:
+            del input[:]
+            return
+
+        # Modules with the 0x80 address bit set do not acknowledge
+        # the select frame:
+        acknowledge_length = 0
+        if (transaction.address & 0x80) == 0:
+            acknowledge_length = 1
+        if len(input) <= acknowledge_length:
+            return
+        response_header = input[acknowledge_length]
+        response_end = acknowledge_length + 1 + (response_header >> 4)
+        if len(input) < response_end:
+            return
+
+        response = input[acknowledge_length + 1: response_end]
+        recorder = self.recorder
+        if recorder != None:
+            recorder.records_put(TRACE_READ, transaction.address,
+              input[0: response_end])
+        del input[:]
+        transaction.response = response
+        checksum = checksum_compute(response)
+        if checksum == response_header & 0xf:
+            transaction.status = "ok"
+        else:
+            transaction.status = "checksum"
+            if recorder != None:
+                recorder.record(TRACE_CHECKSUM, transaction.address, checksum)
+        self.transaction_complete()
+
+    def readable(self):
+        """ {Maker_Bus_Async_Base}: Read everything that is available on
+            the file descriptor of {self}. """
+
+        while True:
+            try:
+                data = os.read(self.fd, 256)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if len(data) == 0:
+                break
+            self.input += bytearray(data)
+            if self.trace:
+                print("read({0})".format(" ".join(
+                  ["0x{0:x}".format(byte) for byte in bytearray(data)])))
+
+        # Each byte that shows up restarts the per-byte timeout:
+        if self.transaction != None:
+            self.deadline = time.time() + self.timeout
+        self.input_process()
+
+    def run(self, tasks):
+        """ {Maker_Bus_Async_Base}: Run each generator in {tasks} until
+            all of them have finished. """
+
+        assert isinstance(tasks, list)
+
+        for task in tasks:
+            self.task_start(task)
+
+        tasks_ready = self.tasks_ready
+        timers = self.timers
+        fd = self.fd
+        while self.tasks_active != 0:
+            # Run everything that is ready to run:
+            while len(tasks_ready) != 0:
+                task, value = tasks_ready.pop(0)
+                self.task_step(task, value)
+            if self.tasks_active == 0:
+                break
+
+            # Figure out how long we can wait for the file descriptor:
+            now = time.time()
+            wake_time = None
+            if self.deadline != None:
+                wake_time = self.deadline
+            if len(timers) != 0 and \
+              (wake_time == None or timers[0][0] < wake_time):
+                wake_time = timers[0][0]
+            wait = None
+            if wake_time != None:
+                wait = max(0.0, wake_time - now)
+
+            writers = []
+            if len(self.output) != 0:
+                writers = [fd]
+            readers, writers, errors = select.select([fd], writers, [], wait)
+            if len(writers) != 0:
+                self.writable()
+            if len(readers) != 0:
+                self.readable()
+
+            # Deal with timeouts and expired timers:
+            now = time.time()
+            if self.deadline != None and now >= self.deadline:
+                del self.input[:]
+                if self.recorder != None:
+                    self.recorder.record(TRACE_TIMEOUT,
+                      self.transaction.address, -1)
+                self.transaction.status = "timeout"
+                self.transaction_complete()
+            while len(timers) != 0 and timers[0][0] <= now:
+                wake_time, sequence, future = heapq.heappop(timers)
+                future.result_set(None)
+
+    def sleep(self, seconds):
+        """ {Maker_Bus_Async_Base}: Return a future that is done after
+            {seconds} have elapsed. """
+
+        future = Maker_Bus_Future()
+        heapq.heappush(self.timers,
+          (time.time() + seconds, id(future), future))
+        return future
+
+    def task_start(self, task):
+        """ {Maker_Bus_Async_Base}: Schedule generator {task} to run. """
+
+        self.tasks_active += 1
+        self.tasks_ready.append((task, None))
+
+    def task_step(self, task, value):
+        """ {Maker_Bus_Async_Base}: Resume {task} with {value} and arrange
+            for it to be resumed again when the future it yields is
+            done. """
+
+        try:
+            future = task.send(value)
+        except StopIteration:
+            self.tasks_active -= 1
+            return
+
+        assert isinstance(future, Maker_Bus_Future), \
+          "Tasks must yield Maker_Bus_Future objects"
+        tasks_ready = self.tasks_ready
+        future.callback_add(
+          lambda future: tasks_ready.append((task, future.value)))
+
+    def transaction_complete(self):
+        """ {Maker_Bus_Async_Base}: Complete the transaction in flight and
+            send the next one. """
+
+        transaction = self.transaction
+        future = self.transaction_future
+        self.deadline = None
+        self.transaction = None
+        self.transaction_future = None
+        future.result_set(transaction)
+        self.transaction_next()
+
+    def transaction_next(self):
+        """ {Maker_Bus_Async_Base}: Start sending the next queued
+            transaction if nothing is in flight. """
+
+        if self.transaction == None and len(self.transactions) != 0:
+            self.transaction = self.transactions.pop(0)
+            self.transaction_future = self.futures.pop(0)
+            self.transaction.frames_encode(self.output)
+            if self.recorder != None:
+                self.transaction.record(self.recorder)
+            self.deadline = time.time() + self.timeout
+            self.writable()
+
+    def transaction_submit(self, transaction):
+        """ {Maker_Bus_Async_Base}: Queue {transaction} to be sent and
+            return a future whose value is {transaction} once it has
+            completed. """
+
+        assert isinstance(transaction, Maker_Bus_Transaction)
+
+        future = Maker_Bus_Future()
+        self.transactions.append(transaction)
+        self.futures.append(future)
+        self.transaction_next()
+        return future
+
+    def writable(self):
+        """ {Maker_Bus_Async_Base}: Write as much pending output as the
+            file descriptor of {self} will take. """
+
+        output = self.output
+        try:
+            count = os.write(self.fd, bytes(output))
+        except OSError as error:
+            if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        if self.trace:
+            print("write({0})".format(" ".join(
+              ["0x{0:x}".format(byte) for byte in output[0: count]])))
+        del output[0: count]
+
+## @class Maker_Bus_Async_Module
+#
+# Per module interface for *Maker_Bus_Async_Base*.
+#
+# *Maker_Bus_Async_Module* has the same request/response routines as
+# *Maker_Bus_Module*, except that each one returns a *Maker_Bus_Future*
+# to be yielded.  Only *request_end*() actually waits for the bus; its
+# value is the transaction status ("ok", "timeout" or "checksum").
+
+class Maker_Bus_Async_Module:
+
+    def __init__(self, maker_bus_async_base, address, offset):
+        """ {Maker_Bus_Async_Module}: Initialize {self} to contain
+            {maker_bus_async_base}, {address} and {offset}. """
+
+        assert isinstance(maker_bus_async_base, Maker_Bus_Async_Base)
+        assert isinstance(address, int)
+        assert isinstance(offset, int)
+
+        self.address = address
+        self.maker_bus_async_base = maker_bus_async_base
+        self.offset = offset
+        self.request = []
+        self.response = bytearray()
+        self.response_index = 0
+
+    def request_begin(self, command):
+        """ {Maker_Bus_Async_Module}: Start a request for {command}. """
+
+        assert len(self.request) == 0, "Previous request was not ended"
+        self.request.append((self.offset + command) & 0xff)
+        return future_resolved(None)
+
+    def request_byte_put(self, byte):
+        """ {Maker_Bus_Async_Module}: Append {byte} to the request. """
+
+        return self.request_ubyte_put(byte)
+
+    def request_character_put(self, character):
+        """ {Maker_Bus_Async_Module}: Append {character} to the request. """
+
+        return self.request_ubyte_put(ord(character))
+
+    def request_end(self):
+        """ {Maker_Bus_Async_Module}: Send the request and return a future
+            for the transaction status. """
+
+        transaction = Maker_Bus_Transaction(self.address, self.request)
+        self.request = []
+
+        future = Maker_Bus_Future()
+        def response_store(transaction_future):
+            transaction = transaction_future.value
+            self.response = transaction.response
+            self.response_index = 0
+            future.result_set(transaction.status)
+        self.maker_bus_async_base.transaction_submit(transaction). \
+          callback_add(response_store)
+        return future
+
+    def request_integer_put(self, integer):
+        """ {Maker_Bus_Async_Module}: Append {integer} to the request. """
+
+        return self.request_uinteger_put(integer)
+
+    def request_logical_put(self, logical):
+        """ {Maker_Bus_Async_Module}: Append {logical} to the request. """
+
+        return self.request_ubyte_put(int(bool(logical)))
+
+    def request_short_put(self, short):
+        """ {Maker_Bus_Async_Module}: Append {short} to the request. """
+
+        return self.request_ushort_put(short)
+
+    def request_ubyte_put(self, ubyte):
+        """ {Maker_Bus_Async_Module}: Append {ubyte} to the request. """
+
+        self.request.append(ubyte & 0xff)
+        return future_resolved(None)
+
+    def request_uinteger_put(self, uinteger):
+        """ {Maker_Bus_Async_Module}: Append {uinteger} to the request,
+            high byte first. """
+
+        self.request.extend(bytearray(
+          uinteger_struct.pack(uinteger & 0xffffffff)))
+        return future_resolved(None)
+
+    def request_ushort_put(self, ushort):
+        """ {Maker_Bus_Async_Module}: Append {ushort} to the request,
+            high byte first. """
+
+        self.request.extend(bytearray(ushort_struct.pack(ushort & 0xffff)))
+        return future_resolved(None)
+
+    def response_begin(self):
+        """ {Maker_Bus_Async_Module}: Begin a response sequence. """
+
+        return future_resolved(None)
+
+    def response_byte_get(self):
+        """ {Maker_Bus_Async_Module}: Return next signed byte from the
+            response. """
+
+        return future_resolved(self.response_unpack(byte_struct))
+
+    def response_character_get(self):
+        """ {Maker_Bus_Async_Module}: Return next character from the
+            response. """
+
+        return future_resolved(chr(self.response_unpack(ubyte_struct)))
+
+    def response_end(self):
+        """ {Maker_Bus_Async_Module}: End a response sequence. """
+
+        left_over = len(self.response) - self.response_index
+        assert left_over == 0, \
+          "{0} bytes left over from response".format(left_over)
+        return future_resolved(None)
+
+    def response_integer_get(self):
+        """ {Maker_Bus_Async_Module}: Return next signed integer from the
+            response. """
+
+        return future_resolved(self.response_unpack(integer_struct))
+
+    def response_logical_get(self):
+        """ {Maker_Bus_Async_Module}: Return next logical from the
+            response. """
+
+        return future_resolved(self.response_unpack(ubyte_struct) != 0)
+
+    def response_short_get(self):
+        """ {Maker_Bus_Async_Module}: Return next signed short from the
+            response. """
+
+        return future_resolved(self.response_unpack(short_struct))
+
+    def response_ubyte_get(self):
+        """ {Maker_Bus_Async_Module}: Return next unsigned byte from the
+            response. """
+
+        return future_resolved(self.response_unpack(ubyte_struct))
+
+    def response_uinteger_get(self):
+        """ {Maker_Bus_Async_Module}: Return next unsigned integer from the
+            response. """
+
+        return future_resolved(self.response_unpack(uinteger_struct))
+
+    def response_unpack(self, unpacker):
+        """ {Maker_Bus_Async_Module}: Decode the next response value using
+            the precompiled *struct.Struct* {unpacker}. """
+
+        index = self.response_index
+        value = unpacker.unpack_from(self.response, index)[0]
+        self.response_index = index + unpacker.size
+        return value
+
+    def response_ushort_get(self):
+        """ {Maker_Bus_Async_Module}: Return next unsigned short from the
+            response. """
+
+        return future_resolved(self.response_unpack(ushort_struct))
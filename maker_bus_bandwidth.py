@@ -0,0 +1,193 @@
+## @package maker_bus_bandwidth
+#
+# MakerBus bandwidth model and admission control
+#
+# This package works out what MakerBus traffic really costs on the
+# wire and keeps the bus from being overcommitted.  For example:
+#
+#        model = Maker_Bus_Wire_Model(115200)
+#        print(model.register_get_time(motor3, encoder_register))
+#        maker_bus_base.admission = Maker_Bus_Admission(model, 0.7)
+#        scheduler = Maker_Bus_Scheduler(maker_bus_base, model = model,
+#          utilization = 0.5)
+#
+# The cost of a transaction counts every byte that crosses the wire:
+# the two byte select frame (when the module has to be selected), the
+# escapes that *frames_encode*() adds for 9-bit and reserved frames,
+# the request header, the select acknowledge and the response header
+# and payload whose length comes from the *Register* type or the
+# *Function* results.
+
+import time
+from maker_bus import *
+
+## @class Maker_Bus_Wire_Model
+#
+# The wire cost of MakerBus traffic at a given baud rate.
+#
+# *Maker_Bus_Wire_Model* turns transactions, register accesses and
+# function calls into a number of bytes on the wire and, at *baud_rate*
+# with *bits_per_byte* bits per byte (10 for 8N1), into seconds.
+# Unless told otherwise, the module is assumed to need a select, so
+# the costs are upper bounds.
+
+class Maker_Bus_Wire_Model:
+
+    def __init__(self, baud_rate = 115200, bits_per_byte = 10):
+        """ {Maker_Bus_Wire_Model}: Initialize {self} for a bus running
+            at {baud_rate} bits per second with {bits_per_byte} bits
+            per byte. """
+
+        assert baud_rate > 0 and bits_per_byte > 0
+
+        self.baud_rate = baud_rate
+        self.bits_per_byte = bits_per_byte
+        self.bytes_per_second = float(baud_rate) / bits_per_byte
+
+    def function_call_bytes(self, module, function, arguments = None,
+      select = True):
+        """ {Maker_Bus_Wire_Model}: Return the number of wire bytes used
+            to call {function} on {module} with {arguments}.  When
+            {arguments} is {None}, every argument byte is assumed to
+            need an escape. """
+
+        parameters_codec, results_codec = function_codecs(function)
+        return self.request_bytes(module, function.number, parameters_codec,
+          arguments, results_codec.size, select)
+
+    def register_get_bytes(self, module, register, select = True):
+        """ {Maker_Bus_Wire_Model}: Return the number of wire bytes used
+            to read {register} from {module}. """
+
+        return self.request_bytes(module, register.number, empty_codec, (),
+          register_codec(register).size, select)
+
+    def register_get_time(self, module, register, select = True):
+        """ {Maker_Bus_Wire_Model}: Return the number of seconds that
+            reading {register} from {module} keeps the wire busy. """
+
+        return self.register_get_bytes(module, register, select) / \
+          self.bytes_per_second
+
+    def register_set_bytes(self, module, register, value = None,
+      select = True):
+        """ {Maker_Bus_Wire_Model}: Return the number of wire bytes used
+            to set {register} on {module} to {value}.  When {value} is
+            {None}, every data byte is assumed to need an escape. """
+
+        arguments = None
+        if value != None:
+            arguments = (value,)
+        return self.request_bytes(module, register.number + 1,
+          register_codec(register), arguments, 0, select)
+
+    def request_bytes(self, module, command, request_codec, arguments,
+      response_size, select = True):
+        """ {Maker_Bus_Wire_Model}: Return the number of wire bytes used
+            to send {command} followed by {arguments} packed by
+            {request_codec} to {module} and get {response_size} bytes
+            back.  When {arguments} is {None}, every argument byte is
+            assumed to need an escape. """
+
+        if arguments == None:
+            # 0xc0 is always escaped:
+            data = [0xc0] * request_codec.size
+        else:
+            data = list(bytearray(request_codec.pack(arguments)))
+        request = [(module.offset + command) & 0xff] + data
+        transaction = Maker_Bus_Transaction(module.address, request)
+        transaction.select = select
+        return self.transaction_bytes(transaction, response_size)
+
+    def transaction_bytes(self, transaction, response_size):
+        """ {Maker_Bus_Wire_Model}: Return the number of wire bytes used
+            by {transaction} when its response is {response_size} bytes
+            long. """
+
+        # Master to slave: the encoded frames, escapes and all:
+        count = len(transaction.frames_encode(bytearray()))
+
+        # Slave to master: select acknowledge, header and payload:
+        if transaction.select and (transaction.address & 0x80) == 0:
+            count += 1
+        return count + 1 + response_size
+
+    def transaction_time(self, transaction, response_size):
+        """ {Maker_Bus_Wire_Model}: Return the number of seconds that
+            {transaction} keeps the wire busy when its response is
+            {response_size} bytes long. """
+
+        return self.transaction_bytes(transaction, response_size) / \
+          self.bytes_per_second
+
+## @class Maker_Bus_Admission
+#
+# Admission control for a MakerBus.
+#
+# *Maker_Bus_Admission* keeps a token bucket that fills at *utilization*
+# times the wire rate of its *Maker_Bus_Wire_Model*.  Work that would
+# take more bytes than there are tokens is held back for up to *wait*
+# seconds (degraded) and then refused.  Install it as the *admission*
+# attribute of a *Maker_Bus_Base* to have *Maker_Bus_Batch* submissions
+# checked; refused batches fail with a "bandwidth" *Maker_Bus_Error*.
+# *statistics* counts the admitted, delayed and refused submissions.
+
+class Maker_Bus_Admission:
+
+    def __init__(self, model, utilization = 0.7, wait = 0.0,
+      burst = 0.01):
+        """ {Maker_Bus_Admission}: Initialize {self} to admit up to
+            {utilization} of the wire rate of {model}, waiting up to
+            {wait} seconds for room.  The bucket holds {burst} seconds
+            worth of bytes (but at least 64). """
+
+        assert isinstance(model, Maker_Bus_Wire_Model)
+        assert 0.0 < utilization <= 1.0 and wait >= 0.0
+
+        self.model = model
+        self.rate = model.bytes_per_second * utilization
+        self.burst = max(64.0, self.rate * burst)
+        self.statistics = {"admitted": 0, "delayed": 0, "refused": 0}
+        self.tokens = self.burst
+        self.tokens_time = time.time()
+        self.utilization = utilization
+        self.wait = wait
+
+    def bytes_admit(self, count):
+        """ {Maker_Bus_Admission}: Return {True} if {count} wire bytes
+            can go out now (or within {wait} seconds, after sleeping
+            until they can), taking them out of the bucket. """
+
+        statistics = self.statistics
+        now = time.time()
+        tokens = min(self.burst,
+          self.tokens + (now - self.tokens_time) * self.rate)
+        self.tokens_time = now
+
+        # Work bigger than the bucket goes once the bucket is full and
+        # leaves it in debt:
+        needed = min(count, self.burst)
+        if tokens < needed:
+            delay = (needed - tokens) / self.rate
+            if delay > self.wait:
+                self.tokens = tokens
+                statistics["refused"] += 1
+                return False
+            time.sleep(delay)
+            statistics["delayed"] += 1
+            tokens += delay * self.rate
+            self.tokens_time = time.time()
+        self.tokens = tokens - count
+        statistics["admitted"] += 1
+        return True
+
+    def transactions_admit(self, transaction_sizes):
+        """ {Maker_Bus_Admission}: Return {True} if the transactions in
+            {transaction_sizes}, a list of (transaction, response size)
+            pairs, are admitted (see {bytes_admit}()). """
+
+        transaction_bytes = self.model.transaction_bytes
+        count = 0
+        for transaction, response_size in transaction_sizes:
+            count += transaction_bytes(transaction, response_size)
+        return self.bytes_admit(count)
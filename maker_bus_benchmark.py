@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+## @package maker_bus_benchmark
+#
+# MakerBus transport benchmarks
+#
+# This program measures how fast *Maker_Bus_Base* and *Maker_Bus_Module*
+# can drive a loopback bus made out of a *Maker_Bus_Simulator*.  Since
+# the simulator answers instantly, the numbers measure the Python
+# overhead of the transport (*flush*, *frame_put*, *request_begin*,
+# ...) rather than the wire.  Usage:
+#
+#        maker_bus_benchmark.py [--baseline=*baseline*.json]
+#          [--threshold=*percent*] [*results*.json [*count*]]
+#
+# The results (rates, p50/p99 latencies, and bytes on the wire per
+# useful payload byte) are written to *results*.json (default
+# "maker_bus_benchmark.json") so that runs can be compared.  With
+# --baseline, the results are compared against an earlier results file
+# and the program exits with a status of 1 if any benchmark got more
+# than *percent* (default 10) percent slower (rate or p50 latency) or
+# uses more bytes on the wire.
+
+import json
+import sys
+import time
+from maker_bus_simulator import *
+
+## @class Maker_Bus_Benchmark
+#
+# One benchmark run against a loopback bus.
+#
+# *Maker_Bus_Benchmark* builds a simulated Motor3 style slave, hooks a
+# *Maker_Bus_Base* up to it, times each individual operation, and
+# collects the results into *results*.
+
+class Maker_Bus_Benchmark:
+
+    def __init__(self, count, modules_pattern = "Vendors/*/*/*/*.xml"):
+        """ {Maker_Bus_Benchmark}: Initialize {self} to run each benchmark
+            {count} times. """
+
+        assert isinstance(count, int) and count > 0
+
+        style = Style(None)
+        modules_table = modules_table_read(modules_pattern, style)
+        simulator = Maker_Bus_Simulator()
+        motor3 = modules_table[("makerbus.com", "Motor3")]
+        bridge = modules_table[("makerbus.com", "Bus_Bridge_Encoders_Sonar")]
+        simulator.module_add(0x85, "motor3", motor3, 0)
+        simulator.module_add(0x21, "bridge", bridge, 0)
+
+        self.count = count
+        self.modules_table = modules_table
+        self.results = {}
+        self.simulator = simulator
+
+    def base_create(self):
+        """ {Maker_Bus_Benchmark}: Return a fresh *Maker_Bus_Base* that
+            talks to the loopback bus. """
+
+        maker_bus_base = \
+          Maker_Bus_Base(Maker_Bus_Simulated_Serial(self.simulator))
+        maker_bus_base.recorder = None
+        return maker_bus_base
+
+    def measure(self, name, operation, payload_bytes):
+        """ {Maker_Bus_Benchmark}: Call {operation}() {count} times and
+            store the rate, latency percentiles and wire efficiency under
+            {name} in the results.  {payload_bytes} is the number of
+            useful bytes (command plus data) moved by one operation. """
+
+        simulator = self.simulator
+        statistics = simulator.statistics
+        bytes_before = statistics["bytes_in"] + statistics["bytes_out"]
+        count = self.count
+        latencies = []
+        timer = time.time
+        start = timer()
+        for index in range(count):
+            before = timer()
+            operation()
+            latencies.append(timer() - before)
+        elapsed = timer() - start
+        wire_bytes = \
+          statistics["bytes_in"] + statistics["bytes_out"] - bytes_before
+
+        wire_efficiency = None
+        if wire_bytes != 0:
+            wire_efficiency = payload_bytes * count / float(wire_bytes)
+
+        latencies.sort()
+        p99_index = min(count - 1, (count * 99) // 100)
+        result = {
+          "count": count,
+          "rate": count / elapsed,
+          "p50_us": latencies[count // 2] * 1000000.0,
+          "p99_us": latencies[p99_index] * 1000000.0,
+          "wire_bytes_per_operation": float(wire_bytes) / count,
+          "wire_efficiency": wire_efficiency}
+        self.results[name] = result
+        return result
+
+    def run(self):
+        """ {Maker_Bus_Benchmark}: Run all of the benchmarks and return
+            the results dictionary. """
+
+        # Registers on the Motor3: speed (Byte, 0), encoder (Int, 6):
+        maker_bus_base = self.base_create()
+        motor3 = Maker_Bus_Module(maker_bus_base, 0x85, 0)
+
+        def register_get():
+            motor3.request_begin(6)
+            motor3.request_end()
+            motor3.response_integer_get()
+            motor3.response_end()
+        self.measure("register_get", register_get, 1 + 4)
+
+        # The same register read the way generated transaction mode
+        # accessors do it:
+        encoder_codec = codec_get(("Integer",))
+        def register_get_transaction():
+            motor3.transaction_call(6, True, empty_codec, (), encoder_codec)
+        self.measure("register_get_transaction", register_get_transaction,
+          1 + 4)
+
+        def register_set():
+            motor3.request_begin(1)
+            motor3.request_byte_put(55)
+            motor3.request_end()
+        self.measure("register_set", register_set, 1 + 1)
+
+        # The bridge acknowledges select frames; call a function on it:
+        maker_bus_base = self.base_create()
+        bridge = Maker_Bus_Module(maker_bus_base, 0x21, 0)
+        function = None
+        for candidate in self.simulator.slave_find(0x21).modules[0]. \
+          module.functions:
+            if function == None and candidate.number >= 0:
+                function = candidate
+        if function != None:
+            parameters_codec, results_codec = function_codecs(function)
+            command_bytes = 1 + parameters_codec.size
+            result_bytes = results_codec.size
+
+            def function_call():
+                bridge.request_begin(function.number)
+                for parameter in function.parameters:
+                    getattr(bridge, "request_{0}_put".
+                      format(parameter.type.lower()))(0)
+                bridge.request_end()
+                for result in function.results:
+                    getattr(bridge, "response_{0}_get".
+                      format(result.type.lower()))()
+                bridge.response_end()
+            self.measure("function_call", function_call,
+              command_bytes + result_bytes)
+
+        # The raw encoder on its own:
+        frames = [0x185, 0x51, 0x07, 0xc3, 0x00, 0x12]
+        self.measure("frames_encode",
+          lambda: frames_encode(frames, bytearray()), 0)
+
+        return self.results
+
+## @brief Return the regressions of *results* against *baseline*.
+#  @param baseline *dict* of results from an earlier run
+#  @param results *dict* of results from this run
+#  @param threshold *float* percentage that counts as a regression
+#
+# A benchmark regressed when its rate dropped or its p50 latency grew
+# by more than *threshold* percent, or when it uses more bytes on the
+# wire per operation (which does not depend on the machine) beyond a
+# 0.05 byte allowance for one time costs.  A list of
+# messages, one per regression, is returned.
+
+def results_compare(baseline, results, threshold):
+    """ Return the regressions of {results} against {baseline}. """
+
+    limit = threshold / 100.0
+    regressions = []
+    for name in sorted(results.keys()):
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        new = results[name]
+        if new["rate"] < old["rate"] * (1.0 - limit):
+            regressions.append("{0}: rate {1:.0f}/s < {2:.0f}/s".format(
+              name, new["rate"], old["rate"]))
+        if new["p50_us"] > old["p50_us"] * (1.0 + limit):
+            regressions.append("{0}: p50 {1:.1f}us > {2:.1f}us".format(
+              name, new["p50_us"], old["p50_us"]))
+        # One time costs (e.g. the first select) are spread over the
+        # operation count, so allow a little slop for different counts:
+        if new["wire_bytes_per_operation"] > \
+          old["wire_bytes_per_operation"] + 0.05:
+            regressions.append("{0}: wire {1:.1f}B/op > {2:.1f}B/op". \
+              format(name, new["wire_bytes_per_operation"],
+              old["wire_bytes_per_operation"]))
+    return regressions
+
+def main():
+    # Pull out the --baseline= and --threshold= options:
+    arguments = []
+    baseline_file_name = None
+    threshold = 10.0
+    for argument in sys.argv[1:]:
+        if argument.startswith("--baseline="):
+            baseline_file_name = argument[len("--baseline="):]
+        elif argument.startswith("--threshold="):
+            try:
+                threshold = float(argument[len("--threshold="):])
+            except ValueError:
+                usage("Bad threshold '{0}'".format(argument))
+            if threshold < 0.0:
+                usage("Negative threshold '{0}'".format(argument))
+        elif argument.startswith("-"):
+            usage("Unknown option '{0}'".format(argument))
+        else:
+            arguments.append(argument)
+    if len(arguments) > 2:
+        usage("Too many arguments")
+
+    results_file_name = "maker_bus_benchmark.json"
+    if len(arguments) > 0:
+        results_file_name = arguments[0]
+    count = 10000
+    if len(arguments) > 1:
+        try:
+            count = int(arguments[1])
+        except ValueError:
+            count = 0
+        if count <= 0:
+            usage("Count '{0}' is not a positive integer".format(arguments[1]))
+
+    # Read the baseline before the results file (which may be the same
+    # file) is written:
+    baseline = None
+    if baseline_file_name != None:
+        in_stream = open(baseline_file_name, "r")
+        baseline = json.load(in_stream)["results"]
+        in_stream.close()
+
+    benchmark = Maker_Bus_Benchmark(count)
+    results = benchmark.run()
+    for name in sorted(results.keys()):
+        result = results[name]
+        print("{0:<16} {1:10.0f}/s p50={2:8.1f}us p99={3:8.1f}us " \
+          "wire={4:5.1f}B/op".format(name, result["rate"], result["p50_us"],
+          result["p99_us"], result["wire_bytes_per_operation"]))
+
+    out_stream = open(results_file_name, "w")
+    json.dump({"time": time.time(), "count": count, "results": results},
+      out_stream, indent = 2, sort_keys = True)
+    out_stream.write("\n")
+    out_stream.close()
+
+    if baseline != None:
+        regressions = results_compare(baseline, results, threshold)
+        for regression in regressions:
+            print("Regression: {0}".format(regression))
+        if len(regressions) != 0:
+            sys.exit(1)
+        print("No regressions against '{0}' (threshold {1}%)".format(
+          baseline_file_name, threshold))
+
+def usage(message):
+    """ Print {message} and how to run this program, then exit with a
+        status of 1. """
+
+    print(message)
+    print("Usage: maker_bus_benchmark.py [--baseline=baseline.json] " \
+      "[--threshold=percent] [results.json [count]]")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+## @package maker_bus_display
+#
+# MakerBus display framebuffers
+#
+# This package keeps a client side copy of what a display module shows
+# so that redrawing a mostly unchanged screen only sends what changed.
+# For example:
+#
+#        lcd = Maker_Bus_Text_Display(lcd_module, lcd1602, 16, 2)
+#        while True:
+#            lcd.text_put(0, 0, "Speed {0:5d}".format(speed))
+#            lcd.text_put(0, 1, "Encoder {0:8d}".format(encoder))
+#            lcd.commit()
+#
+# Each framebuffer has the cells that the caller draws into and a
+# shadow of the cells that the device is known to show.  *commit*()
+# works out the changed runs of cells in each row, sends just those in
+# as few requests as possible and updates the shadow.  A shadow cell
+# of *None* is unknown (e.g. after a failed commit or *invalidate*())
+# and is always sent.
+
+from maker_bus import *
+
+## @class Maker_Bus_Framebuffer
+#
+# Rows of cells with a shadow of what the device shows.
+#
+# *Maker_Bus_Framebuffer* holds *rows* lists of *columns* cells in
+# *cells* and the matching *shadow*.  *dirty_runs*() returns the
+# (row, start column, end column) runs that differ, joining runs that
+# are separated by *gap* or fewer unchanged cells, since it is often
+# cheaper to resend a cell than to reposition.  Display classes supply
+# *runs_send*() and get *commit*() for free.  *statistics* counts the
+# commits, the cells sent and the cells that did not need sending.
+
+class Maker_Bus_Framebuffer:
+
+    def __init__(self, columns, rows, blank, gap = 0):
+        """ {Maker_Bus_Framebuffer}: Initialize {self} to be {columns} by
+            {rows} cells filled with {blank}, with unchanged gaps of up to
+            {gap} cells resent rather than skipped. """
+
+        assert isinstance(columns, int) and columns > 0
+        assert isinstance(rows, int) and rows > 0
+
+        self.blank = blank
+        self.cells = [[blank] * columns for row in range(rows)]
+        self.columns = columns
+        self.gap = gap
+        self.rows = rows
+        self.shadow = [[None] * columns for row in range(rows)]
+        self.statistics = {"commits": 0, "cells_sent": 0, "cells_skipped": 0}
+
+    def clear(self):
+        """ {Maker_Bus_Framebuffer}: Fill the cells of {self} with
+            blanks.  Nothing is sent until {commit}(). """
+
+        blank = self.blank
+        for row in self.cells:
+            for column in range(len(row)):
+                row[column] = blank
+
+    def commit(self):
+        """ {Maker_Bus_Framebuffer}: Send the cells that differ from the
+            shadow to the device and return the number of cells sent.
+            If the device does not take them, the cells of the runs are
+            marked unknown and *Maker_Bus_Error* is raised. """
+
+        runs = self.dirty_runs()
+        cells = self.cells
+        shadow = self.shadow
+        statistics = self.statistics
+        statistics["commits"] += 1
+        count = 0
+        for row, start, end in runs:
+            count += end - start
+        statistics["cells_sent"] += count
+        statistics["cells_skipped"] += self.columns * self.rows - count
+        if len(runs) == 0:
+            return 0
+
+        try:
+            self.runs_send(runs)
+        except Maker_Bus_Error:
+            for row, start, end in runs:
+                shadow[row][start: end] = [None] * (end - start)
+            raise
+        for row, start, end in runs:
+            shadow[row][start: end] = cells[row][start: end]
+        return count
+
+    def dirty_runs(self):
+        """ {Maker_Bus_Framebuffer}: Return the list of (row, start, end)
+            runs of cells that differ from the shadow; each run covers
+            columns start through end - 1. """
+
+        gap = self.gap
+        runs = []
+        for row in range(self.rows):
+            cells_row = self.cells[row]
+            shadow_row = self.shadow[row]
+            start = -1
+            end = -1
+            for column in range(self.columns):
+                if cells_row[column] == shadow_row[column]:
+                    continue
+                if start >= 0 and column - end <= gap:
+                    end = column + 1
+                else:
+                    if start >= 0:
+                        runs.append((row, start, end))
+                    start = column
+                    end = column + 1
+            if start >= 0:
+                runs.append((row, start, end))
+        return runs
+
+    def invalidate(self):
+        """ {Maker_Bus_Framebuffer}: Forget what the device shows, so that
+            the next {commit}() sends every cell. """
+
+        for row in self.shadow:
+            for column in range(len(row)):
+                row[column] = None
+
+    def put(self, column, row, cell):
+        """ {Maker_Bus_Framebuffer}: Set the cell at ({column}, {row})
+            to {cell}.  Cells off of the display are ignored. """
+
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            self.cells[row][column] = cell
+
+## @class Maker_Bus_Text_Display
+#
+# A character display such as the *LCD1602*.
+#
+# *Maker_Bus_Text_Display* drives a display module that has a
+# "cursor_move" (column, row) *Function* and a "character send"
+# *Function* that writes one character and advances the cursor.  Each
+# run of changed characters is a cursor move followed by the
+# characters, and all of the runs of a commit go out together.
+
+class Maker_Bus_Text_Display(Maker_Bus_Framebuffer):
+
+    def __init__(self, maker_bus_module, module, columns, rows,
+      offset = 0, depth = 4):
+        """ {Maker_Bus_Text_Display}: Initialize {self} to drive the
+            *Maker_Bus_Module* {maker_bus_module}, described by the
+            *Module* {module}, as a {columns} by {rows} display.
+            {offset} is added to the command numbers (see
+            *Module_Use.offset*) and up to {depth} requests are kept in
+            flight. """
+
+        assert isinstance(maker_bus_module, Maker_Bus_Module)
+
+        functions = {}
+        for function in module.functions:
+            functions[function.name] = function
+        assert "cursor_move" in functions and "character send" in functions, \
+          "Module '{0}' is not a text display".format(module.name)
+        cursor_function = functions["cursor_move"]
+        character_function = functions["character send"]
+
+        self.character_codec = function_codecs(character_function)[0]
+        self.character_command = \
+          (maker_bus_module.offset + offset + character_function.number) & 0xff
+        self.cursor_codec = function_codecs(cursor_function)[0]
+        self.cursor_command = \
+          (maker_bus_module.offset + offset + cursor_function.number) & 0xff
+        self.depth = depth
+        self.maker_bus_module = maker_bus_module
+
+        # Resending a character is cheaper than moving the cursor when
+        # the gap is small:
+        gap = (1 + self.cursor_codec.size) // (1 + self.character_codec.size)
+        Maker_Bus_Framebuffer.__init__(self, columns, rows, " ", gap)
+
+    def runs_send(self, runs):
+        """ {Maker_Bus_Text_Display}: Send the characters of {runs}. """
+
+        cells = self.cells
+        character_command = self.character_command
+        character_pack = self.character_codec.pack
+        cursor_command = self.cursor_command
+        cursor_pack = self.cursor_codec.pack
+        commands = []
+        for row, start, end in runs:
+            commands.append(([cursor_command] +
+              list(bytearray(cursor_pack((start, row)))), 0))
+            for column in range(start, end):
+                commands.append(([character_command] +
+                  list(bytearray(character_pack((cells[row][column],)))), 0))
+
+        maker_bus_module = self.maker_bus_module
+        transactions = [transaction for transaction, indices
+          in maker_bus_module.transactions_pack(commands)]
+        maker_bus_module.maker_bus_base.transactions_send(transactions,
+          self.depth)
+        for transaction in transactions:
+            if transaction.status != "ok":
+                raise Maker_Bus_Error(transaction.address, transaction.status)
+
+    def text_put(self, column, row, text):
+        """ {Maker_Bus_Text_Display}: Put {text} into {self} starting at
+            ({column}, {row}).  Text that runs off of the row is
+            dropped.  Nothing is sent until {commit}(). """
+
+        for index in range(len(text)):
+            self.put(column + index, row, text[index])
+
+## @class Maker_Bus_Bits_Display
+#
+# A display whose state is one register of bits (e.g. the *Gadgeteer 7
+# LED*).
+#
+# *Maker_Bus_Bits_Display* is a one cell framebuffer: *bits* holds the
+# value to show and *commit*() only writes the *Register* when it
+# differs from what the device was last sent.
+
+class Maker_Bus_Bits_Display(Maker_Bus_Framebuffer):
+
+    def __init__(self, maker_bus_module, register, offset = 0):
+        """ {Maker_Bus_Bits_Display}: Initialize {self} to show bits on
+            {register} of the *Maker_Bus_Module* {maker_bus_module}.
+            {offset} is added to the register number (see
+            *Module_Use.offset*). """
+
+        assert isinstance(maker_bus_module, Maker_Bus_Module)
+
+        Maker_Bus_Framebuffer.__init__(self, 1, 1, 0)
+        self.maker_bus_module = maker_bus_module
+        self.offset = offset
+        self.register = register
+
+    def bit_set(self, index, on):
+        """ {Maker_Bus_Bits_Display}: Turn bit {index} on or off.
+            Nothing is sent until {commit}(). """
+
+        bits = self.cells[0][0]
+        if on:
+            bits |= 1 << index
+        else:
+            bits &= ~(1 << index)
+        self.cells[0][0] = bits
+
+    def bits_set(self, bits):
+        """ {Maker_Bus_Bits_Display}: Show {bits} (sent by {commit}()). """
+
+        self.cells[0][0] = bits
+
+    def runs_send(self, runs):
+        """ {Maker_Bus_Bits_Display}: Write the register. """
+
+        self.maker_bus_module.register_set(self.register, self.cells[0][0],
+          self.offset)
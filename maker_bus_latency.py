@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+
+## @package maker_bus_latency
+#
+# MakerBus latency histograms
+#
+# This package keeps HDR style latency histograms for each (MakerBus
+# address, command number) pair: the time to the select acknowledge,
+# the time to the response header and the total time for the
+# response, along with counts of timeouts and bad checksums.  A
+# *Maker_Bus_Base* records into its *latencies* attribute; the table
+# can be snapshotted, reset, printed and saved to a file that can be
+# printed later with:
+#
+#        maker_bus_latency.py *latency_file* ...
+
+import json
+import math
+import sys
+
+# The latency kinds that are histogrammed:
+latency_kinds = ["select", "header", "total"]
+
+# Histogram file layout version:
+latency_file_version = 1
+
+## @class Maker_Bus_Histogram
+#
+# HDR style histogram of latencies.
+#
+# *Maker_Bus_Histogram* counts values (in microseconds) in log-linear
+# buckets: values below 2 * 2^*precision_bits* each get their own
+# bucket and every power of two above that is split into
+# 2^*precision_bits* buckets, so any recorded value is known to within
+# 1 part in 2^*precision_bits*.  Recording a value is a little integer
+# arithmetic and one list store.
+
+class Maker_Bus_Histogram:
+
+    def __init__(self, precision_bits = 5):
+        """ {Maker_Bus_Histogram}: Initialize {self} to be empty with
+            buckets 1/2^{precision_bits} wide. """
+
+        assert isinstance(precision_bits, int) and precision_bits > 0
+
+        self.count = 0
+        self.counts = []
+        self.maximum = 0
+        self.minimum = 0
+        self.precision_bits = precision_bits
+        self.sub_count = 1 << precision_bits
+        self.total = 0
+
+    def copy(self):
+        """ {Maker_Bus_Histogram}: Return a copy of {self}. """
+
+        histogram = Maker_Bus_Histogram(self.precision_bits)
+        histogram.count = self.count
+        histogram.counts = list(self.counts)
+        histogram.maximum = self.maximum
+        histogram.minimum = self.minimum
+        histogram.total = self.total
+        return histogram
+
+    def index_value(self, index):
+        """ {Maker_Bus_Histogram}: Return the smallest value that goes
+            into bucket {index}. """
+
+        sub_count = self.sub_count
+        if index < 2 * sub_count:
+            return index
+        shift = index // sub_count - 1
+        return (index % sub_count + sub_count) << shift
+
+    def mean(self):
+        """ {Maker_Bus_Histogram}: Return the mean of the values in
+            {self} (0.0 if there are none). """
+
+        if self.count == 0:
+            return 0.0
+        return float(self.total) / self.count
+
+    def percentile(self, percent):
+        """ {Maker_Bus_Histogram}: Return the value that {percent}
+            percent of the values in {self} are at or below (to the
+            precision of the buckets). """
+
+        count = self.count
+        if count == 0:
+            return 0
+        rank = max(1, int(count * percent / 100.0 + 0.5))
+        seen = 0
+        counts = self.counts
+        for index in range(len(counts)):
+            seen += counts[index]
+            if seen >= rank:
+                return min(self.maximum, self.index_value(index + 1) - 1)
+        return self.maximum
+
+    def record(self, value):
+        """ {Maker_Bus_Histogram}: Count the integer {value} (e.g.
+            microseconds) in {self}.  Negative values (the clock was
+            stepped backwards) are counted as 0 and a {value} that is
+            not finite raises *ValueError*. """
+
+        if isinstance(value, float):
+            if math.isinf(value) or math.isnan(value):
+                raise ValueError(
+                  "Latency {0} is not a finite number".format(value))
+            value = int(value)
+        if value < 0:
+            value = 0
+
+        sub_count = self.sub_count
+        if value < 2 * sub_count:
+            index = value
+        else:
+            shift = value.bit_length() - self.precision_bits - 1
+            index = (shift + 1) * sub_count + (value >> shift) - sub_count
+
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+
+        if self.count == 0 or value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.count += 1
+        self.total += value
+
+## @class Maker_Bus_Latency
+#
+# The latencies for one (address, command) pair.
+#
+# *Maker_Bus_Latency* has a *Maker_Bus_Histogram* attribute for each
+# kind in *latency_kinds* (*select*, *header* and *total*) and counts
+# the *timeouts* and *checksums* (bad checksums) seen for the pair.
+
+class Maker_Bus_Latency:
+
+    def __init__(self):
+        """ {Maker_Bus_Latency}: Initialize {self} to be empty. """
+
+        self.checksums = 0
+        self.header = Maker_Bus_Histogram()
+        self.select = Maker_Bus_Histogram()
+        self.timeouts = 0
+        self.total = Maker_Bus_Histogram()
+
+    def copy(self):
+        """ {Maker_Bus_Latency}: Return a copy of {self}. """
+
+        latency = Maker_Bus_Latency()
+        latency.checksums = self.checksums
+        latency.header = self.header.copy()
+        latency.select = self.select.copy()
+        latency.timeouts = self.timeouts
+        latency.total = self.total.copy()
+        return latency
+
+## @class Maker_Bus_Latencies
+#
+# Latency histograms for every (address, command) pair on a bus.
+#
+# *Maker_Bus_Latencies* maps (address, command) pairs to
+# *Maker_Bus_Latency* objects in *table*; the transport fetches the
+# *Maker_Bus_Latency* with *latency_get*() and records into its
+# histograms directly.  The command of a request that carries several
+# commands is its first one.
+
+class Maker_Bus_Latencies:
+
+    def __init__(self):
+        """ {Maker_Bus_Latencies}: Initialize {self} to be empty. """
+
+        self.table = {}
+
+    @staticmethod
+    def load(file_name):
+        """ {Maker_Bus_Latencies}: Return the {Maker_Bus_Latencies} saved
+            in {file_name} by {save}(). """
+
+        in_stream = open(file_name, "r")
+        data = json.load(in_stream)
+        in_stream.close()
+        assert data.get("version") == latency_file_version, \
+          "'{0}' is not a MakerBus latency file".format(file_name)
+
+        latencies = Maker_Bus_Latencies()
+        for entry in data["latencies"]:
+            latency = latencies.latency_get(entry["address"],
+              entry["command"])
+            latency.checksums = entry["checksums"]
+            latency.timeouts = entry["timeouts"]
+            for kind in latency_kinds:
+                fields = entry[kind]
+                histogram = Maker_Bus_Histogram(fields["precision_bits"])
+                histogram.count = fields["count"]
+                histogram.counts = fields["counts"]
+                histogram.maximum = fields["maximum"]
+                histogram.minimum = fields["minimum"]
+                histogram.total = fields["total"]
+                setattr(latency, kind, histogram)
+        return latencies
+
+    def latency_get(self, address, command):
+        """ {Maker_Bus_Latencies}: Return the {Maker_Bus_Latency} for
+            {command} to {address}, creating it if needed. """
+
+        key = (address, command)
+        table = self.table
+        latency = table.get(key)
+        if latency == None:
+            latency = Maker_Bus_Latency()
+            table[key] = latency
+        return latency
+
+    def reset(self):
+        """ {Maker_Bus_Latencies}: Forget everything in {self}. """
+
+        self.table = {}
+
+    def save(self, file_name):
+        """ {Maker_Bus_Latencies}: Write {self} out to {file_name}. """
+
+        entries = []
+        for key in sorted(self.table.keys()):
+            latency = self.table[key]
+            entry = {"address": key[0], "command": key[1],
+              "checksums": latency.checksums, "timeouts": latency.timeouts}
+            for kind in latency_kinds:
+                histogram = getattr(latency, kind)
+                entry[kind] = {"precision_bits": histogram.precision_bits,
+                  "count": histogram.count, "counts": histogram.counts,
+                  "maximum": histogram.maximum, "minimum": histogram.minimum,
+                  "total": histogram.total}
+            entries.append(entry)
+
+        out_stream = open(file_name, "w")
+        json.dump({"version": latency_file_version, "latencies": entries},
+          out_stream, sort_keys = True)
+        out_stream.write("\n")
+        out_stream.close()
+
+    def snapshot(self, reset = False):
+        """ {Maker_Bus_Latencies}: Return a copy of {self} that does not
+            change as more latencies are recorded.  When {reset} is
+            {True}, {self} is reset as well. """
+
+        latencies = Maker_Bus_Latencies()
+        table = self.table
+        for key in table.keys():
+            latencies.table[key] = table[key].copy()
+        if reset:
+            self.reset()
+        return latencies
+
+    def text(self):
+        """ {Maker_Bus_Latencies}: Return {self} formatted as a table with
+            one line per (address, command, kind); times are in
+            microseconds.  The timeouts and checksums columns count
+            failures of the (address, command) pair, so they are only
+            filled in on its "total" line. """
+
+        lines = ["addr  cmd kind      count      p50      p90      p99" \
+          "      max timeouts checksums"]
+        for key in sorted(self.table.keys()):
+            address, command = key
+            latency = self.table[key]
+            for kind in latency_kinds:
+                histogram = getattr(latency, kind)
+                if histogram.count == 0 and kind != "total":
+                    continue
+                line = "0x{0:02x} {1:4d} {2:<6} {3:8d} {4:8d} {5:8d} " \
+                  "{6:8d} {7:8d}".format(address, command, kind,
+                  histogram.count, histogram.percentile(50.0),
+                  histogram.percentile(90.0), histogram.percentile(99.0),
+                  histogram.maximum)
+                if kind == "total":
+                    line += " {0:8d} {1:9d}".format(latency.timeouts,
+                      latency.checksums)
+                lines.append(line)
+        return "\n".join(lines)
+
+def main():
+    for file_name in sys.argv[1:]:
+        print("{0}:".format(file_name))
+        print(Maker_Bus_Latencies.load(file_name).text())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+## @package maker_bus_pool
+#
+# MakerBus multi-port pool
+#
+# This package drives several MakerBus serial ports at once.  Each port
+# gets its own *Maker_Bus_Base* and its own I/O thread, so that traffic
+# for slaves on different ports proceeds in parallel.  Which port a
+# module is on comes from the project tree: every *Module_Use* that
+# contains MakerBus slaves is a bus, and each bus is bound to one port.
+# For example:
+#
+#        pool = Maker_Bus_Pool(["/dev/ttyUSB0", "/dev/ttyUSB1"])
+#        modules = pool.project_route(project, modules_table)
+#        left = modules["Motor3_Left"]
+#        future = pool.call(left, lambda module: module.registers_get(...))
+#        ...
+#        values = future.result()
+#        pool.close()
+#
+# Each port is driven by a *Maker_Bus_Io_Thread*, so the transaction
+# based accessors of a *Maker_Bus_Module* in a pool can be called from
+# any thread.  Code that uses the *request_\**() routines should be
+# handed to *Maker_Bus_Pool.call*() so that it runs on the I/O thread.
+
+from maker_bus import *
+from data_structures import *
+
+## @class Maker_Bus_Port
+#
+# One serial port with its own I/O thread.
+#
+# *Maker_Bus_Port* owns a *Maker_Bus_Base* for one serial port and the
+# *Maker_Bus_Io_Thread* that runs queued jobs against it.  Each job
+# completes a *Maker_Bus_Future*.
+
+class Maker_Bus_Port:
+
+    def __init__(self, serial_name, depth = 4):
+        """ {Maker_Bus_Port}: Initialize {self} to talk to {serial_name}
+            (a device name or an already open *Serial* like object)
+            keeping up to {depth} transactions in flight. """
+
+        assert isinstance(depth, int) and depth >= 1
+
+        base = Maker_Bus_Base(serial_name)
+        assert base.serial != None, \
+          "Unable to open serial port '{0}'".format(serial_name)
+
+        self.base = base
+        self.depth = depth
+        self.io_thread = base.io_start(depth)
+        self.serial_name = serial_name
+
+    def call(self, function, *arguments):
+        """ {Maker_Bus_Port}: Queue up a call of {function}({arguments})
+            on the I/O thread of {self} and return a *Maker_Bus_Future*
+            for its result. """
+
+        return self.io_thread.call(function, *arguments)
+
+    def close(self):
+        """ {Maker_Bus_Port}: Finish the queued jobs, stop the I/O thread
+            and close the serial port of {self}. """
+
+        self.io_thread.close()
+        self.base.serial.close()
+
+    def submit(self, transactions):
+        """ {Maker_Bus_Port}: Queue up {transactions} to be sent by the
+            I/O thread of {self} and return a future that is done with
+            {transactions} once they have all completed. """
+
+        return self.io_thread.submit(transactions)
+
+## @class Maker_Bus_Pool
+#
+# A set of MakerBus serial ports.
+#
+# *Maker_Bus_Pool* opens several serial ports, one *Maker_Bus_Port*
+# each, and routes *Maker_Bus_Module* traffic to the port that the
+# module sits on.
+
+class Maker_Bus_Pool:
+
+    def __init__(self, serial_names = None, depth = 4):
+        """ {Maker_Bus_Pool}: Initialize {self} with a port for each
+            entry in {serial_names}.  When {serial_names} is {None},
+            every port found by {serial_names_find}() is opened. """
+
+        if serial_names == None:
+            serial_names = serial_names_find()
+        assert isinstance(serial_names, list) and len(serial_names) != 0, \
+          "There is no serial port to open"
+
+        self.ports = \
+          [Maker_Bus_Port(serial_name, depth) for serial_name in serial_names]
+
+    def call(self, module, function, *arguments):
+        """ {Maker_Bus_Pool}: Return a *Maker_Bus_Future* for the result of
+            {function}({module}, {arguments}) run on the I/O thread of the
+            port that {module} is on. """
+
+        return self.port_get(module).call(function, module, *arguments)
+
+    def close(self):
+        """ {Maker_Bus_Pool}: Close all of the ports in {self}. """
+
+        for port in self.ports:
+            port.close()
+
+    def module_create(self, address, offset, port_index):
+        """ {Maker_Bus_Pool}: Return a *Maker_Bus_Module* for the module
+            at {address} with register {offset} on port {port_index}. """
+
+        assert 0 <= port_index < len(self.ports), \
+          "There is no port {0}".format(port_index)
+
+        return Maker_Bus_Module(self.ports[port_index].base, address, offset)
+
+    def port_get(self, module):
+        """ {Maker_Bus_Pool}: Return the *Maker_Bus_Port* that {module}
+            is on. """
+
+        assert isinstance(module, Maker_Bus_Module)
+
+        base = module.maker_bus_base
+        for port in self.ports:
+            if port.base is base:
+                return port
+        assert False, "Module 0x{0:x} is not in this pool". \
+          format(module.address)
+
+    def project_route(self, project, modules_table, bus_ports = None):
+        """ {Maker_Bus_Pool}: Create a *Maker_Bus_Module* for each MakerBus
+            *Module_Use* in {project} and return them in a *dict* keyed by
+            *Module_Use* name.  Each *Module_Use* that contains MakerBus
+            modules is a bus; {bus_ports} maps bus names to port indices.
+            Buses not in {bus_ports} take the ports in project order.
+            Each module has the *Module_Use.offset* of its use built in,
+            like the modules of a generated *Project*, so it is not
+            stored in *Module_Use.maker_bus_module* (the configurator
+            caches offset 0 slave modules there and adds the offset
+            itself). """
+
+        assert isinstance(project, Project)
+        assert isinstance(modules_table, dict)
+
+        if bus_ports == None:
+            bus_ports = {}
+        buses = {}
+        modules = {}
+        for module_use in project.module_uses:
+            self.project_route_helper(module_use, None, None,
+              modules_table, bus_ports, buses, modules)
+        return modules
+
+    def project_route_helper(self, module_use, bus_module_use,
+      maker_bus_module, modules_table, bus_ports, buses, modules):
+        """ {Maker_Bus_Pool}: Recursive helper for {project_route}().
+            {bus_module_use} is the parent of {module_use}, {buses} maps
+            the bus names seen so far to port indices, and
+            {maker_bus_module} is the module that {module_use} is
+            part of (or {None}). """
+
+        module = module_use.module_lookup(modules_table)
+        if module != None and module.address_type == "MakerBus":
+            # Recursive MakerBus nodes are not allowed:
+            assert maker_bus_module == None
+            assert bus_module_use != None, \
+              "MakerBus module '{0}' is not on a bus".format(module_use.name)
+
+            # Bind the bus to a port the first time it is seen:
+            bus_name = bus_module_use.name
+            if bus_name not in buses:
+                port_index = len(buses)
+                if bus_name in bus_ports:
+                    port_index = bus_ports[bus_name]
+                buses[bus_name] = port_index
+
+            maker_bus_module = self.module_create(int(module_use.address),
+              int(module_use.offset), buses[bus_name])
+
+        if maker_bus_module != None:
+            # Module uses that share the slave have their own command
+            # offset (see *Module_Use.offset*):
+            use_module = maker_bus_module
+            offset = int(module_use.offset)
+            if offset != maker_bus_module.offset:
+                use_module = Maker_Bus_Module(maker_bus_module.maker_bus_base,
+                  maker_bus_module.address, offset)
+            modules[module_use.name] = use_module
+
+        for sub_module_use in module_use.module_uses:
+            self.project_route_helper(sub_module_use, module_use,
+              maker_bus_module, modules_table, bus_ports, buses, modules)
+
+    def submit(self, module, transactions):
+        """ {Maker_Bus_Pool}: Queue up {transactions} (see
+            {Maker_Bus_Module.transaction_create}()) for {module} on its
+            port and return a *Maker_Bus_Future* that is done with
+            {transactions} once they have all completed. """
+
+        return self.port_get(module).submit(transactions)
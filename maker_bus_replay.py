@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+## @package maker_bus_replay
+#
+# MakerBus session replay
+#
+# This package replays MakerBus sessions captured by a *Maker_Bus_Trace*
+# (frames out, frames in and their timestamps).  To capture a session,
+# give the *Maker_Bus_Base* a recorder that is large enough and dump it
+# afterwards:
+#
+#        maker_bus_base.recorder = Maker_Bus_Trace(1 << 20)
+#        ...
+#        maker_bus_base.recorder.dump("session.trace")
+#
+# A captured session can be replayed in two ways:
+#
+# * *Maker_Bus_Replay_Serial* is a serial port that plays the slave
+#   side of the session back, optionally with the original timing, so
+#   the same sequence of *flush*()/*request_begin*() calls can be
+#   measured deterministically without any hardware.
+#
+# * *trace_transactions*() turns the session back into the stream of
+#   requests that the master sent and *transactions_replay*() sends
+#   them to a live or simulated bus.  From the command line:
+#
+#        maker_bus_replay.py *trace_file* [*project*.xml | *serial_name*]
+#
+#   replays *trace_file* against a simulator of *project*.xml or the
+#   serial port *serial_name* (default the first one found) and prints
+#   the status and round trip time of each request next to the
+#   original.
+
+import sys
+import time
+from maker_bus import *
+
+## @brief Return the frames encoded in *data* by *frames_encode*().
+#  @param data *bytearray* of wire bytes
+#  @param pending *list* holding a partial two byte frame (or empty)
+#
+# Two byte frames that are split between calls are carried over in
+# *pending*.
+
+def frames_decode(data, pending):
+    """ Return the frames encoded in {data}. """
+
+    frames = []
+    for byte in bytearray(data):
+        if len(pending) != 0:
+            frames.append(((pending.pop() & 3) << 7) | (byte & 0x7f))
+        elif 0xc0 <= byte <= 0xc3:
+            pending.append(byte)
+        else:
+            frames.append(byte)
+    return frames
+
+## @class Maker_Bus_Replay_Serial
+#
+# A serial port that replays the slave side of a recorded session.
+#
+# *Maker_Bus_Replay_Serial* walks the (timestamp, category, address,
+# frame) records of a *Maker_Bus_Trace* in order.  Frames written by
+# the master are checked against the recorded ones (differences are
+# counted in *mismatches*); once every frame before a recorded read
+# has been written, that byte becomes available to *read*().  A
+# recorded timeout makes *read*() return nothing.  With *timing* on,
+# each byte only becomes available as long after the preceding write
+# as it did in the recording.  It provides the part of the *Serial*
+# interface that *Maker_Bus_Base* uses.
+
+class Maker_Bus_Replay_Serial:
+
+    def __init__(self, records, timing = False):
+        """ {Maker_Bus_Replay_Serial}: Initialize {self} to replay
+            {records} (see {Maker_Bus_Trace.records}()), keeping the
+            recorded timing when {timing} is {True}. """
+
+        assert isinstance(records, list)
+
+        self.index = 0
+        self.mismatches = 0
+        self.pending = []
+        self.records = [record for record in records
+          if record[1] != TRACE_CHECKSUM]
+        self.timeout = None
+        self.timing = timing
+        self.write_record_time = 0.0
+        self.write_time = 0.0
+
+    def close(self):
+        """ {Maker_Bus_Replay_Serial}: Close {self}. """
+
+        pass
+
+    def done(self):
+        """ {Maker_Bus_Replay_Serial}: Return {True} once every record
+            has been replayed. """
+
+        return self.index >= len(self.records)
+
+    def flush(self):
+        """ {Maker_Bus_Replay_Serial}: Flush output (nothing to do). """
+
+        pass
+
+    def flushInput(self):
+        """ {Maker_Bus_Replay_Serial}: Throw away any pending input.
+            Input that was thrown away was never read, so it is not in
+            the recording either; there is nothing to do. """
+
+        pass
+
+    def inWaiting(self):
+        """ {Maker_Bus_Replay_Serial}: Return the number of bytes that
+            can be read without waiting. """
+
+        records = self.records
+        index = self.index
+        now = time.time()
+        count = 0
+        while index < len(records) and records[index][1] == TRACE_READ and \
+          self.release_time(records[index]) <= now:
+            index += 1
+            count += 1
+        return count
+
+    def read(self, size = 1):
+        """ {Maker_Bus_Replay_Serial}: Return up to {size} recorded
+            bytes. """
+
+        records = self.records
+        data = bytearray()
+        while len(data) < size and self.index < len(records):
+            record = records[self.index]
+            category = record[1]
+            if category == TRACE_TIMEOUT:
+                # The recorded read timed out here; take the timeout
+                # unless some bytes have already been read:
+                if len(data) == 0:
+                    self.index += 1
+                    if self.timing and self.timeout != None:
+                        time.sleep(self.timeout)
+                break
+            if category != TRACE_READ:
+                break
+            if self.timing:
+                delay = self.release_time(record) - time.time()
+                if delay > 0.0:
+                    time.sleep(delay)
+            data.append(record[3] & 0xff)
+            self.index += 1
+        return bytes(data)
+
+    def release_time(self, record):
+        """ {Maker_Bus_Replay_Serial}: Return when the byte of the read
+            {record} becomes available. """
+
+        if not self.timing:
+            return 0.0
+        return self.write_time + (record[0] - self.write_record_time)
+
+    def setTimeout(self, timeout):
+        """ {Maker_Bus_Replay_Serial}: Set the read timeout of {self}. """
+
+        self.timeout = timeout
+
+    def write(self, data):
+        """ {Maker_Bus_Replay_Serial}: Check {data} against the recorded
+            master frames. """
+
+        records = self.records
+        for frame in frames_decode(data, self.pending):
+            # Skip over recorded input that was never read:
+            while self.index < len(records) and \
+              records[self.index][1] in (TRACE_READ, TRACE_TIMEOUT):
+                self.index += 1
+                self.mismatches += 1
+            if self.index >= len(records):
+                self.mismatches += 1
+                continue
+            record = records[self.index]
+            if record[3] != frame:
+                self.mismatches += 1
+            self.write_record_time = record[0]
+            self.index += 1
+        self.write_time = time.time()
+        return len(data)
+
+## @brief Return the requests recorded in *records* as transactions.
+#  @param records *list* of (timestamp, category, address, frame) records
+#
+# Each request (header frame followed by its bytes) becomes a
+# *Maker_Bus_Transaction* with *sent_time* set to when it was recorded,
+# *response* and *status* set to what came back and *rtt* set to the
+# recorded round trip time (*None* unless it completed).  The input
+# that is expected next (select acknowledges and responses) is kept in
+# a queue, since pipelined requests are all written before any of their
+# responses are read.  Requests recorded without a module address (by
+# older recorders after a select timeout) cannot be replayed and are
+# skipped.
+
+def trace_transactions(records):
+    """ Return the {Maker_Bus_Transaction} list recorded in {records}. """
+
+    transactions = []
+    expected = []
+    request = []
+    request_remaining = 0
+    request_time = 0.0
+    response_remaining = -1
+    for timestamp, category, address, frame in records:
+        if category == TRACE_SELECT:
+            if (address & 0x80) == 0:
+                expected.append(None)
+        elif category == TRACE_WRITE:
+            if request_remaining == 0:
+                # A request header:
+                request = []
+                request_remaining = frame >> 4
+                request_time = timestamp
+                continue
+            request.append(frame)
+            request_remaining -= 1
+            if request_remaining == 0 and address < 0:
+                # No module to send it to:
+                continue
+            if request_remaining == 0:
+                transaction = Maker_Bus_Transaction(address, request)
+                transaction.rtt = None
+                transaction.sent_time = request_time
+                transaction.status = "timeout"
+                transactions.append(transaction)
+                expected.append(transaction)
+        elif category == TRACE_READ and len(expected) != 0:
+            reading = expected[0]
+            if reading == None:
+                # A select acknowledge:
+                expected.pop(0)
+            elif response_remaining < 0:
+                # A response header:
+                reading.status = "ok"
+                response_remaining = frame >> 4
+            else:
+                reading.response.append(frame)
+                response_remaining -= 1
+            if reading != None and response_remaining == 0:
+                reading.rtt = timestamp - reading.sent_time
+                response_remaining = -1
+                expected.pop(0)
+        elif category == TRACE_TIMEOUT:
+            # Whatever was still expected is sent over again:
+            del expected[:]
+            response_remaining = -1
+        elif category == TRACE_CHECKSUM and len(transactions) != 0:
+            for candidate in reversed(transactions):
+                if candidate.address == address:
+                    candidate.status = "checksum"
+                    break
+    return transactions
+
+## @brief Send recorded transactions to a bus and return the outcomes.
+#  @param maker_bus_base *Maker_Bus_Base* of the bus to send them to
+#  @param transactions *list* of recorded transactions from
+#         *trace_transactions*()
+#  @param timing *bool* that keeps the recorded spacing when *True*
+#
+# Each recorded request is sent as a fresh *Maker_Bus_Transaction* and a
+# list of (recorded transaction, replayed transaction, round trip time)
+# tuples is returned.
+
+def transactions_replay(maker_bus_base, transactions, timing = False):
+    """ Send {transactions} over {maker_bus_base} and return the
+        outcomes. """
+
+    assert isinstance(maker_bus_base, Maker_Bus_Base)
+
+    outcomes = []
+    start_time = time.time()
+    record_start_time = 0.0
+    if len(transactions) != 0:
+        record_start_time = transactions[0].sent_time
+    for recorded in transactions:
+        if timing:
+            delay = start_time + (recorded.sent_time - record_start_time) - \
+              time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+        replayed = Maker_Bus_Transaction(recorded.address,
+          list(recorded.request))
+        before = time.time()
+        maker_bus_base.transactions_send([replayed])
+        outcomes.append((recorded, replayed, time.time() - before))
+    return outcomes
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: maker_bus_replay.py trace_file " \
+          "[project.xml | serial_name]")
+        return
+    transactions = trace_transactions(Maker_Bus_Trace.load(sys.argv[1]))
+
+    target = None
+    if len(sys.argv) > 2:
+        target = sys.argv[2]
+    if target != None and target.endswith(".xml"):
+        from maker_bus_simulator import Maker_Bus_Simulated_Serial, \
+          project_simulator_create
+        target = Maker_Bus_Simulated_Serial(project_simulator_create(target))
+    maker_bus_base = Maker_Bus_Base(target)
+    if maker_bus_base.serial == None:
+        return
+
+    for recorded, replayed, rtt in \
+      transactions_replay(maker_bus_base, transactions, True):
+        recorded_rtt = "-"
+        if recorded.rtt != None:
+            recorded_rtt = "{0:.0f}us".format(recorded.rtt * 1000000.0)
+        print("0x{0:02x} {1} {2} {3:.0f}us (recorded {4} {5})".format(
+          replayed.address, " ".join(["{0:02x}".format(byte)
+          for byte in replayed.request]), replayed.status,
+          rtt * 1000000.0, recorded.status, recorded_rtt))
+
+if __name__ == "__main__":
+    main()
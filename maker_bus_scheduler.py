@@ -0,0 +1,327 @@
+## @package maker_bus_scheduler
+#
+# MakerBus register polling scheduler
+#
+# This package polls a declared set of registers, each at its own rate,
+# instead of every script writing its own *sleep* loops.  For example:
+#
+#        scheduler = Maker_Bus_Scheduler(maker_bus_base)
+#        encoder = scheduler.poll_add(motor3, encoder_register, 200.0)
+#        slider = scheduler.poll_add(slider_module, value_register, 10.0,
+#          slider_changed)
+#        scheduler.run(5.0)
+#        print(encoder.samples.latest())
+#
+# Polls are served earliest deadline first.  Polls that fall due within
+# *coalesce* seconds of one another are read together, so registers on
+# the same module share transactions and the transactions for all of
+# the modules go out in one pipeline.  Deadlines advance by whole
+# periods so that the polls do not drift, and a bandwidth budget (a
+# token bucket in bytes per second) keeps the polls from using more
+# of the bus than they are allowed to.  The cost of each poll comes
+# from a *Maker_Bus_Wire_Model*; when a *utilization* target is given,
+# polls that would push the polling plan past it are slowed down to
+# their minimum rate or refused when they are added.
+
+import heapq
+import time
+from maker_bus import *
+from maker_bus_bandwidth import *
+
+## @class Maker_Bus_Samples
+#
+# Ring buffer of polled register values.
+#
+# *Maker_Bus_Samples* keeps the last *size* (timestamp, value) samples
+# in parallel preallocated lists.  A value of *None* means that the
+# read failed.
+
+class Maker_Bus_Samples:
+
+    def __init__(self, size = 256):
+        """ {Maker_Bus_Samples}: Initialize {self} to hold the last {size}
+            samples. """
+
+        assert isinstance(size, int) and size > 0
+
+        self.count = 0
+        self.index = 0
+        self.size = size
+        self.timestamps = [0.0] * size
+        self.values = [None] * size
+
+    def append(self, timestamp, value):
+        """ {Maker_Bus_Samples}: Append the sample {value} read at
+            {timestamp} to {self}. """
+
+        index = self.index
+        self.timestamps[index] = timestamp
+        self.values[index] = value
+        index += 1
+        if index >= self.size:
+            index = 0
+        self.index = index
+        self.count += 1
+
+    def latest(self):
+        """ {Maker_Bus_Samples}: Return the most recent (timestamp, value)
+            sample in {self} or {None} if there are none. """
+
+        if self.count == 0:
+            return None
+        index = (self.index - 1) % self.size
+        return (self.timestamps[index], self.values[index])
+
+    def samples(self):
+        """ {Maker_Bus_Samples}: Return the samples in {self} oldest first
+            as a list of (timestamp, value) tuples. """
+
+        size = self.size
+        count = min(self.count, size)
+        start = (self.index - count) % size
+        samples = []
+        for offset in range(count):
+            index = (start + offset) % size
+            samples.append((self.timestamps[index], self.values[index]))
+        return samples
+
+## @class Maker_Bus_Poll
+#
+# One register that is polled at a fixed rate.
+#
+# *Maker_Bus_Poll* records the *Maker_Bus_Module* and *Register* to
+# read, the polling *period* and the next *deadline*.  Each value that
+# is read goes into *samples* and, when present, is passed to
+# *callback*(*poll*, *timestamp*, *value*).
+
+class Maker_Bus_Poll:
+
+    def __init__(self, module, register, rate, callback, size, cost):
+        """ {Maker_Bus_Poll}: Initialize {self} to read {register} from
+            {module} {rate} times per second.  Each read takes {cost}
+            bytes on the wire. """
+
+        assert isinstance(module, Maker_Bus_Module)
+        assert rate > 0.0
+
+        self.callback = callback
+        self.cost = cost
+        self.deadline = 0.0
+        self.misses = 0
+        self.module = module
+        self.period = 1.0 / rate
+        self.register = register
+        self.samples = Maker_Bus_Samples(size)
+
+## @class Maker_Bus_Scheduler
+#
+# Earliest deadline first register poller.
+#
+# *Maker_Bus_Scheduler* keeps the *Maker_Bus_Poll* objects in a heap
+# ordered by deadline and serves them from *step*() (or *run*(), which
+# calls *step*() in a loop).  *bandwidth* is the number of bus bytes
+# per second that polling may use and *statistics* counts the polls,
+# the transactions, the polls held back by the bandwidth budget, the
+# deadlines that were missed entirely and the polls that admission
+# control slowed down or refused.
+
+class Maker_Bus_Scheduler:
+
+    def __init__(self, maker_bus_base, bandwidth = 11520.0,
+      coalesce = 0.002, depth = 1, model = None, utilization = None):
+        """ {Maker_Bus_Scheduler}: Initialize {self} to poll registers
+            over {maker_bus_base} using no more than {bandwidth} bytes
+            per second.  Polls due within {coalesce} seconds are read
+            together with up to {depth} transactions in flight.  Poll
+            costs come from the *Maker_Bus_Wire_Model* {model} (default
+            115200 baud) and, unless {utilization} is {None}, the
+            polling plan is kept under that fraction of its wire
+            rate. """
+
+        assert isinstance(maker_bus_base, Maker_Bus_Base)
+        assert bandwidth > 0.0 and coalesce >= 0.0
+        assert utilization == None or 0.0 < utilization <= 1.0
+
+        if model == None:
+            model = Maker_Bus_Wire_Model()
+        self.bandwidth = bandwidth
+        self.burst = max(64.0, bandwidth * 0.01)
+        self.coalesce = coalesce
+        self.depth = depth
+        self.heap = []
+        self.maker_bus_base = maker_bus_base
+        self.model = model
+        self.sequence = 0
+        self.statistics = {"polls": 0, "transactions": 0, "deferred": 0,
+          "misses": 0, "degraded": 0, "refused": 0}
+        self.tokens = self.burst
+        self.tokens_time = time.time()
+        self.utilization = utilization
+
+    def plan_utilization(self):
+        """ {Maker_Bus_Scheduler}: Return the fraction of the wire rate of
+            the model that the current polls use. """
+
+        bytes_per_second = 0.0
+        for deadline, sequence, poll in self.heap:
+            bytes_per_second += poll.cost / poll.period
+        return bytes_per_second / self.model.bytes_per_second
+
+    def poll_add(self, module, register, rate, callback = None,
+      size = 256, minimum_rate = None):
+        """ {Maker_Bus_Scheduler}: Start polling {register} on {module}
+            {rate} times per second and return the new *Maker_Bus_Poll*.
+            The last {size} values are kept in its samples and each
+            value is passed to {callback} as well (unless it is
+            {None}).  When the poll does not fit under the utilization
+            target, it is slowed down as far as {minimum_rate} or, when
+            that is not enough, refused with a "bandwidth"
+            *Maker_Bus_Error*. """
+
+        assert module.maker_bus_base is self.maker_bus_base, \
+          "Module 0x{0:x} is on another bus".format(module.address)
+
+        cost = self.model.register_get_bytes(module, register)
+        utilization = self.utilization
+        if utilization != None:
+            statistics = self.statistics
+            model = self.model
+            available = (utilization - self.plan_utilization()) * \
+              model.bytes_per_second
+            if cost * rate > available:
+                if minimum_rate == None or cost * minimum_rate > available:
+                    statistics["refused"] += 1
+                    raise Maker_Bus_Error(module.address, "bandwidth")
+                rate = available / cost
+                statistics["degraded"] += 1
+
+        poll = Maker_Bus_Poll(module, register, rate, callback, size, cost)
+        poll.deadline = time.time()
+        self.poll_push(poll)
+        return poll
+
+    def poll_push(self, poll):
+        """ {Maker_Bus_Scheduler}: Put {poll} on the deadline heap. """
+
+        # The sequence number keeps equal deadlines in FIFO order:
+        self.sequence += 1
+        heapq.heappush(self.heap, (poll.deadline, self.sequence, poll))
+
+    def poll_remove(self, poll):
+        """ {Maker_Bus_Scheduler}: Stop polling {poll}. """
+
+        heap = [entry for entry in self.heap if entry[2] is not poll]
+        heapq.heapify(heap)
+        self.heap = heap
+
+    def run(self, duration = None):
+        """ {Maker_Bus_Scheduler}: Poll for {duration} seconds ({None}
+            for ever). """
+
+        end_time = None
+        if duration != None:
+            end_time = time.time() + duration
+        while len(self.heap) != 0:
+            now = time.time()
+            if end_time != None and now >= end_time:
+                break
+            self.step(now)
+
+            # Sleep until the next poll is due or, when the bandwidth
+            # budget is what is holding it back, until there are enough
+            # tokens for it:
+            heap = self.heap
+            if len(heap) != 0:
+                wake_time = heap[0][0]
+                poll = heap[0][2]
+                if self.tokens < poll.cost:
+                    wake_time = max(wake_time,
+                      now + (poll.cost - self.tokens) / self.bandwidth)
+                if end_time != None:
+                    wake_time = min(wake_time, end_time)
+                delay = wake_time - time.time()
+                if delay > 0.0:
+                    time.sleep(delay)
+
+    def step(self, now = None):
+        """ {Maker_Bus_Scheduler}: Read every poll that is due at {now}
+            (default the current time) and fits in the bandwidth budget
+            and return the number of polls read. """
+
+        if now == None:
+            now = time.time()
+
+        # Refill the token bucket:
+        tokens = min(self.burst,
+          self.tokens + (now - self.tokens_time) * self.bandwidth)
+        self.tokens_time = now
+
+        # Take the due polls earliest deadline first and group them by
+        # module, reading each register only once:
+        heap = self.heap
+        statistics = self.statistics
+        due_time = now + self.coalesce
+        groups = []
+        group_table = {}
+        polls = []
+        while len(heap) != 0 and heap[0][0] <= due_time:
+            poll = heap[0][2]
+            if tokens < poll.cost:
+                for entry in heap:
+                    if entry[0] <= due_time:
+                        statistics["deferred"] += 1
+                break
+            heapq.heappop(heap)
+            tokens -= poll.cost
+            polls.append(poll)
+
+            module = poll.module
+            key = id(module)
+            if key not in group_table:
+                group_table[key] = (module, [], {})
+                groups.append(group_table[key])
+            module, registers, names = group_table[key]
+            if poll.register.name not in names:
+                names[poll.register.name] = poll.register
+                registers.append(poll.register)
+        self.tokens = tokens
+        if len(polls) == 0:
+            return 0
+
+        # Send the transactions for all of the modules in one pipeline:
+        group_batches = []
+        transactions = []
+        for module, registers, names in groups:
+            batches = module.registers_get_batches(registers)
+            group_batches.append(batches)
+            transactions.extend(
+              [transaction for transaction, indices in batches])
+        self.maker_bus_base.transactions_send(transactions, self.depth)
+        timestamp = time.time()
+        statistics["polls"] += len(polls)
+        statistics["transactions"] += len(transactions)
+
+        values_table = {}
+        for index in range(len(groups)):
+            module, registers, names = groups[index]
+            values_table[id(module)] = \
+              module.registers_get_values(registers, group_batches[index])
+
+        # Deliver the samples and move each deadline on by whole periods
+        # so that the polls keep their phase:
+        for poll in polls:
+            value = values_table[id(poll.module)][poll.register.name]
+            poll.samples.append(timestamp, value)
+            if poll.callback != None:
+                poll.callback(poll, timestamp, value)
+
+            period = poll.period
+            deadline = poll.deadline + period
+            if deadline <= now:
+                missed = int((now - deadline) / period) + 1
+                poll.misses += missed
+                statistics["misses"] += missed
+                deadline += missed * period
+            poll.deadline = deadline
+            self.poll_push(poll)
+        return len(polls)
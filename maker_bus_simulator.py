@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+
+## @package maker_bus_simulator
+#
+# Software MakerBus slave simulator
+#
+# This package simulates the slave side of the MakerBus so that the
+# control software can be exercised without any hardware attached.
+# The simulated slaves are built from the same module XML files
+# (*Register* and *Function* definitions) and project XML files
+# (*Module_Use* addresses and offsets) that the code generators use.
+#
+# The simulator can be used in two ways:
+#
+#  * In-process, by handing a *Maker_Bus_Simulated_Serial* object to
+#    *Maker_Bus_Base* in place of a serial port name.
+#
+#  * Across a pseudo terminal, by calling *Maker_Bus_Simulator.pty_open*()
+#    and opening the returned device name like a real serial port.
+#
+# Running this file directly serves a project over a pseudo terminal:
+#
+#        maker_bus_simulator.py *project*.xml
+
+import os
+import sys
+import threading
+import time
+import tty
+from data_structures import *
+from maker_bus import *
+
+## @class Maker_Bus_Simulated_Module
+#
+# One simulated *Module_Use*.
+#
+# This class holds the register values for one module and the Python
+# callables that implement its functions.  Functions that do not have
+# a handler return zero for every result.
+
+class Maker_Bus_Simulated_Module:
+
+    def __init__(self, name, module, offset):
+        """ {Maker_Bus_Simulated_Module}: Initialize {self} to simulate
+            {module} at command {offset} under {name}. """
+
+        assert isinstance(name, str)
+        assert isinstance(module, Module)
+        assert isinstance(offset, int)
+
+        registers = {}
+        for register in module.registers:
+            registers[register.name] = 0
+
+        self.function_handlers = {}
+        self.module = module
+        self.name = name
+        self.offset = offset
+        self.registers = registers
+
+    def function_handler_set(self, function_name, handler):
+        """ {Maker_Bus_Simulated_Module}: Make {handler} the implementation
+            of {function_name}.  {handler} is called with {self} followed
+            by the function parameters and returns a tuple of results. """
+
+        self.function_handlers[function_name] = handler
+
+## @class Maker_Bus_Simulated_Slave
+#
+# One simulated MakerBus address.
+#
+# A slave owns every simulated module that lives behind one MakerBus
+# address and dispatches request commands to them using the module
+# offsets.
+
+class Maker_Bus_Simulated_Slave:
+
+    def __init__(self, address, identifier):
+        """ {Maker_Bus_Simulated_Slave}: Initialize {self} to answer on
+            {address} and report {identifier} during discovery. """
+
+        assert isinstance(address, int)
+        assert isinstance(identifier, str)
+
+        self.address = address
+        self.commands = {}
+        self.identifier = identifier
+        self.modules = []
+        self.requests_count = 0
+
+    def module_add(self, simulated_module):
+        """ {Maker_Bus_Simulated_Slave}: Add {simulated_module} to {self}. """
+
+        assert isinstance(simulated_module, Maker_Bus_Simulated_Module)
+
+        self.modules.append(simulated_module)
+        commands = self.commands
+        offset = simulated_module.offset
+        module = simulated_module.module
+        for register in module.registers:
+            number = offset + register.number
+            commands[number & 0xff] = ("get", simulated_module, register)
+            commands[(number + 1) & 0xff] = \
+              ("set", simulated_module, register)
+        for function in module.functions:
+            if function.number >= 0:
+                commands[(offset + function.number) & 0xff] = \
+                  ("call", simulated_module, function)
+
+    def request_execute(self, request):
+        """ {Maker_Bus_Simulated_Slave}: Execute each command in {request}
+            and return the response bytes. """
+
+        self.requests_count += 1
+        response = bytearray()
+        commands = self.commands
+        index = 0
+        request_length = len(request)
+        while index < request_length:
+            command = request[index]
+            index += 1
+            if not command in commands:
+                # Unknown command; give up on the rest of the request:
+                break
+            kind, simulated_module, item = commands[command]
+            if kind == "get":
+                response += register_codec(item).pack(
+                  (simulated_module.registers[item.name],))
+            elif kind == "set":
+                codec = register_codec(item)
+                simulated_module.registers[item.name] = \
+                  codec.unpack(request, index)[0]
+                index += codec.size
+            else:
+                parameters_codec, results_codec = function_codecs(item)
+                arguments = parameters_codec.unpack(request, index)
+                index += parameters_codec.size
+                results = [0] * len(item.results)
+                handlers = simulated_module.function_handlers
+                if item.name in handlers:
+                    results = handlers[item.name](simulated_module, *arguments)
+                response += results_codec.pack(results)
+        return response
+
+## @class Maker_Bus_Simulator
+#
+# A simulated MakerBus full of slaves.
+#
+# *Maker_Bus_Simulator* consumes the bytes a master writes, decodes the
+# 9-bit framing produced by *frame_put*()/*frames_encode*(), and queues
+# up the bytes the selected slave sends back in *output*:
+#
+#  * an address select frame (address | 0x100) selects a slave, which
+#    acknowledges unless the 0x80 address bit is set,
+#  * a request header (length << 4 | checksum) followed by the request
+#    is executed by the selected slave, which sends back a response
+#    header followed by the response,
+#  * a raw 0xc4 byte starts discovery and every slave reports its
+#    identifier on a line of its own, followed by a "!" line,
+#  * a raw 0xc5 byte resets the bus, which answers with 0xa5.
+#
+# Requests with a bad checksum are ignored, so the master times out.
+
+class Maker_Bus_Simulator:
+
+    def __init__(self):
+        """ {Maker_Bus_Simulator}: Initialize {self} to be an empty bus. """
+
+        self.escape = -1
+        self.lock = threading.Lock()
+        self.output = bytearray()
+        self.request = None
+        self.request_header = -1
+        self.selected = None
+        self.slaves = {}
+        self.statistics = {"bytes_in": 0, "bytes_out": 0, "selects": 0,
+          "requests": 0, "checksum_errors": 0, "discoveries": 0, "resets": 0}
+
+    def byte_process(self, byte):
+        """ {Maker_Bus_Simulator}: Process one {byte} written by the
+            master. """
+
+        escape = self.escape
+        if escape >= 0:
+            self.escape = -1
+            self.frame_process(((escape & 3) << 7) | (byte & 0x7f))
+        elif 0xc0 <= byte and byte <= 0xc3:
+            self.escape = byte
+        elif byte == 0xc4:
+            self.discovery()
+        elif byte == 0xc5:
+            self.statistics["resets"] += 1
+            self.selected = None
+            self.request = None
+            self.output.append(0xa5)
+        else:
+            self.frame_process(byte)
+
+    def discovery(self):
+        """ {Maker_Bus_Simulator}: Have every slave report its address and
+            identifier. """
+
+        self.statistics["discoveries"] += 1
+        self.selected = None
+        self.request = None
+        output = self.output
+        for address in sorted(self.slaves.keys()):
+            slave = self.slaves[address]
+            output += bytearray(
+              " {0} {1}\n".format(address, slave.identifier))
+        output += bytearray("!\n")
+
+    def frame_process(self, frame):
+        """ {Maker_Bus_Simulator}: Process one 9-bit {frame}. """
+
+        statistics = self.statistics
+        if frame > 0xff:
+            # Address select:
+            statistics["selects"] += 1
+            address = frame & 0xff
+            self.request = None
+            self.selected = self.slaves.get(address)
+            if self.selected != None and (address & 0x80) == 0:
+                self.output.append(address)
+        elif self.selected == None:
+            # Nobody is listening:
+            pass
+        elif self.request == None:
+            # Request header:
+            self.request_header = frame
+            self.request = bytearray()
+            if (frame >> 4) == 0:
+                self.request_process()
+        else:
+            request = self.request
+            request.append(frame)
+            if len(request) == self.request_header >> 4:
+                self.request_process()
+
+    def module_add(self, address, name, module, offset):
+        """ {Maker_Bus_Simulator}: Add a simulated {module} called {name}
+            at {address} and {offset}, creating the slave for {address}
+            if needed.  The new {Maker_Bus_Simulated_Module} is returned. """
+
+        assert isinstance(address, int) and 0 <= address <= 0xff
+
+        slaves = self.slaves
+        if not address in slaves:
+            slaves[address] = Maker_Bus_Simulated_Slave(address,
+              "{0}/{1}".format(module.vendor, module.name).replace(" ", "_"))
+        simulated_module = Maker_Bus_Simulated_Module(name, module, offset)
+        slaves[address].module_add(simulated_module)
+        return simulated_module
+
+    def project_load(self, project, modules_table):
+        """ {Maker_Bus_Simulator}: Add a simulated module for every MakerBus
+            accessible module use in {project}. """
+
+        assert isinstance(project, Project)
+        assert isinstance(modules_table, dict)
+
+        accessible_modules = {}
+        accessible_module_uses = {}
+        for module_use in project.module_uses:
+            module_use.accessible_modules_find(modules_table,
+              accessible_modules, accessible_module_uses, -1, -1000)
+
+        for name in sorted(accessible_module_uses.keys()):
+            module_use = accessible_module_uses[name]
+            try:
+                address = int(module_use.maker_bus_address)
+            except ValueError:
+                continue
+            if address >= 0:
+                self.module_add(address, name,
+                  module_use.module_lookup(modules_table), module_use.offset)
+
+    def pty_open(self):
+        """ {Maker_Bus_Simulator}: Serve {self} on a new pseudo terminal
+            from a background thread and return the device name that the
+            master should open. """
+
+        master_fd, slave_fd = os.openpty()
+        tty.setraw(master_fd)
+        tty.setraw(slave_fd)
+
+        def serve():
+            while True:
+                data = os.read(master_fd, 256)
+                if len(data) == 0:
+                    break
+                output = self.write(data)
+                if len(output) != 0:
+                    os.write(master_fd, bytes(output))
+        thread = threading.Thread(target = serve)
+        thread.daemon = True
+        thread.start()
+
+        self.pty_fds = (master_fd, slave_fd)
+        return os.ttyname(slave_fd)
+
+    def request_process(self):
+        """ {Maker_Bus_Simulator}: Execute the request that was just
+            received by the selected slave. """
+
+        statistics = self.statistics
+        request = self.request
+        self.request = None
+        statistics["requests"] += 1
+        if checksum_compute(request) != self.request_header & 0xf:
+            statistics["checksum_errors"] += 1
+            return
+
+        response = self.selected.request_execute(request)
+        assert len(response) < 16, "Response is {0} bytes >= 16". \
+          format(len(response))
+        output = self.output
+        output.append((len(response) << 4) | checksum_compute(response))
+        output += response
+
+    def slave_find(self, address):
+        """ {Maker_Bus_Simulator}: Return the slave at {address} or *None*."""
+
+        return self.slaves.get(address)
+
+    def write(self, data):
+        """ {Maker_Bus_Simulator}: Feed the bytes in {data} from the master
+            into {self} and return (and forget) everything the slaves
+            sent back. """
+
+        self.lock.acquire()
+        try:
+            data = bytearray(data)
+            self.statistics["bytes_in"] += len(data)
+            for byte in data:
+                self.byte_process(byte)
+            output = self.output
+            self.output = bytearray()
+            self.statistics["bytes_out"] += len(output)
+        finally:
+            self.lock.release()
+        return output
+
+## @class Maker_Bus_Simulated_Serial
+#
+# An in-process serial port connected to a *Maker_Bus_Simulator*.
+#
+# This class provides the part of the *Serial* interface that
+# *Maker_Bus_Base* uses.  Whatever is written is fed straight into the
+# simulator; reads return the slave bytes and time out immediately
+# when there are none.
+
+class Maker_Bus_Simulated_Serial:
+
+    def __init__(self, simulator):
+        """ {Maker_Bus_Simulated_Serial}: Initialize {self} to talk to
+            {simulator}. """
+
+        assert isinstance(simulator, Maker_Bus_Simulator)
+
+        self.input = bytearray()
+        self.simulator = simulator
+        self.timeout = None
+
+    def close(self):
+        """ {Maker_Bus_Simulated_Serial}: Close {self}. """
+
+        pass
+
+    def flush(self):
+        """ {Maker_Bus_Simulated_Serial}: Flush output (nothing to do). """
+
+        pass
+
+    def flushInput(self):
+        """ {Maker_Bus_Simulated_Serial}: Throw away any pending input. """
+
+        del self.input[:]
+
+    def inWaiting(self):
+        """ {Maker_Bus_Simulated_Serial}: Return the number of bytes that
+            can be read without waiting. """
+
+        return len(self.input)
+
+    def read(self, size = 1):
+        """ {Maker_Bus_Simulated_Serial}: Return up to {size} bytes. """
+
+        input = self.input
+        data = bytes(input[0: size])
+        del input[0: size]
+        return data
+
+    def setTimeout(self, timeout):
+        """ {Maker_Bus_Simulated_Serial}: Set the read timeout of {self}. """
+
+        self.timeout = timeout
+
+    def write(self, data):
+        """ {Maker_Bus_Simulated_Serial}: Send {data} to the simulator. """
+
+        self.input += self.simulator.write(data)
+        return len(data)
+
+## @brief Return a *Maker_Bus_Simulator* for the project in *file_name*.
+#  @param file_name *str* name of the project XML file
+#  @param modules_pattern *str* glob pattern for the module XML files
+
+def project_simulator_create(file_name,
+  modules_pattern = "Vendors/*/*/*/*.xml"):
+    """ Return a {Maker_Bus_Simulator} loaded with the project in
+        {file_name}. """
+
+    style = Style(None)
+    modules_table = modules_table_read(modules_pattern, style)
+    project_element = XML(style).read(file_name, "Project")
+    assert project_element != None, "Unable to open '{0}'".format(file_name)
+    XML_Check.element_check(project_element, XML_Check.tags_initialize())
+    project = Project(project_element, modules_table, style)
+
+    simulator = Maker_Bus_Simulator()
+    simulator.project_load(project, modules_table)
+    return simulator
+
+def main():
+    simulator = project_simulator_create(sys.argv[1])
+    for address in sorted(simulator.slaves.keys()):
+        slave = simulator.slaves[address]
+        print("0x{0:02x} {1}: {2}".format(address, slave.identifier,
+          ", ".join([module.name for module in slave.modules])))
+    print("Serving on {0}".format(simulator.pty_open()))
+    while True:
+        time.sleep(1.0)
+
+if __name__ == "__main__":
+    main()
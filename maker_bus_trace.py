@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+## @package maker_bus_trace
+#
+# MakerBus binary trace recorder
+#
+# This package provides a fixed size ring buffer of MakerBus frame
+# records that is cheap enough to leave on all the time.  Each record
+# is a (timestamp, category, address, frame) tuple.  The ring buffer
+# can be dumped to a compact binary file at any time and the file can
+# be decoded back into text with:
+#
+#        maker_bus_trace.py *trace_file* ...
+
+import struct
+import sys
+import time
+
+# Record categories:
+TRACE_WRITE = 0                 # Frame written to the bus
+TRACE_READ = 1                  # Frame read from the bus
+TRACE_SELECT = 2                # Address select frame written to the bus
+TRACE_TIMEOUT = 3               # Read timed out (frame is -1)
+TRACE_CHECKSUM = 4              # Bad response checksum (frame is checksum)
+trace_category_names = ["write", "read", "select", "timeout", "checksum"]
+
+# Per-category levels:
+TRACE_OFF = 0                   # Do not record
+TRACE_RECORD = 1                # Record into the ring buffer
+TRACE_PRINT = 2                 # Record and print as well
+
+# Binary file layout:
+trace_file_magic = "MBTR"
+trace_header_struct = struct.Struct("<4sHI")
+trace_record_struct = struct.Struct("<dBhh")
+trace_file_version = 1
+
+## @class Maker_Bus_Trace
+#
+# Ring buffer of MakerBus frame records.
+#
+# *Maker_Bus_Trace* keeps the last *size* frame records in parallel
+# preallocated lists so that recording a frame is a few list stores.
+# Each category has its own level (*TRACE_OFF*, *TRACE_RECORD* or
+# *TRACE_PRINT*) in *levels*.
+
+class Maker_Bus_Trace:
+
+    def __init__(self, size = 4096):
+        """ {Maker_Bus_Trace}: Initialize {self} to hold the last {size}
+            frame records. """
+
+        assert isinstance(size, int) and size > 0
+
+        self.addresses = [0] * size
+        self.categories = [0] * size
+        self.count = 0
+        self.frames = [0] * size
+        self.index = 0
+        self.levels = [TRACE_RECORD] * len(trace_category_names)
+        self.size = size
+        self.timestamps = [0.0] * size
+
+    def clear(self):
+        """ {Maker_Bus_Trace}: Forget all of the records in {self}. """
+
+        self.count = 0
+        self.index = 0
+
+    def dump(self, file_name):
+        """ {Maker_Bus_Trace}: Write the records in {self} out to
+            {file_name} oldest first. """
+
+        assert isinstance(file_name, str)
+
+        records = self.records()
+        out_stream = open(file_name, "wb")
+        out_stream.write(trace_header_struct.pack(trace_file_magic,
+          trace_file_version, len(records)))
+        pack = trace_record_struct.pack
+        out_stream.write(b"".join([pack(*record) for record in records]))
+        out_stream.close()
+
+    @staticmethod
+    def load(file_name):
+        """ {Maker_Bus_Trace}: Return the list of (timestamp, category,
+            address, frame) records in {file_name}. """
+
+        in_stream = open(file_name, "rb")
+        data = in_stream.read()
+        in_stream.close()
+
+        header_size = trace_header_struct.size
+        magic, version, count = \
+          trace_header_struct.unpack_from(data, 0)
+        assert magic == trace_file_magic, \
+          "'{0}' is not a MakerBus trace file".format(file_name)
+        assert version == trace_file_version, \
+          "'{0}' has unknown version {1}".format(file_name, version)
+
+        records = []
+        record_size = trace_record_struct.size
+        unpack_from = trace_record_struct.unpack_from
+        for index in range(count):
+            records.append(
+              unpack_from(data, header_size + index * record_size))
+        return records
+
+    def record(self, category, address, frame):
+        """ {Maker_Bus_Trace}: Record {frame} for {address} under
+            {category}. """
+
+        level = self.levels[category]
+        if level != TRACE_OFF:
+            index = self.index
+            timestamp = time.time()
+            self.timestamps[index] = timestamp
+            self.categories[index] = category
+            self.addresses[index] = address
+            self.frames[index] = frame
+            index += 1
+            if index >= self.size:
+                index = 0
+            self.index = index
+            self.count += 1
+            if level == TRACE_PRINT:
+                print(record_format((timestamp, category, address, frame)))
+
+    def records(self):
+        """ {Maker_Bus_Trace}: Return the records in {self} oldest first
+            as a list of (timestamp, category, address, frame) tuples. """
+
+        size = self.size
+        count = min(self.count, size)
+        start = (self.index - count) % size
+        records = []
+        for offset in range(count):
+            index = (start + offset) % size
+            records.append((self.timestamps[index], self.categories[index],
+              self.addresses[index], self.frames[index]))
+        return records
+
+    def records_put(self, category, address, frames):
+        """ {Maker_Bus_Trace}: Record each frame in {frames} for {address}
+            under {category}. """
+
+        if self.levels[category] != TRACE_OFF:
+            record = self.record
+            for frame in frames:
+                record(category, address, frame)
+
+## @brief Return *record* formatted as one line of text.
+#  @param record *tuple* of (timestamp, category, address, frame)
+
+def record_format(record):
+    """ Return {record} formatted as a line of text. """
+
+    timestamp, category, address, frame = record
+    category_name = "?"
+    if 0 <= category < len(trace_category_names):
+        category_name = trace_category_names[category]
+    address_text = "--"
+    if address >= 0:
+        address_text = "{0:02x}".format(address)
+    return "{0:.6f} {1:<8} {2} 0x{3:03x}".format(timestamp, category_name,
+      address_text, frame & 0xfff)
+
+def main():
+    for file_name in sys.argv[1:]:
+        records = Maker_Bus_Trace.load(file_name)
+        print("{0}: {1} records".format(file_name, len(records)))
+        start = 0.0
+        if len(records) != 0:
+            start = records[0][0]
+        for record in records:
+            timestamp, category, address, frame = record
+            print(record_format((timestamp - start, category, address, frame)))
+
+if __name__ == "__main__":
+    main()
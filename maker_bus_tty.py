@@ -0,0 +1,185 @@
+## @package maker_bus_tty
+#
+# MakerBus raw tty transport
+#
+# This package provides *Maker_Bus_Tty*, a serial port that talks to
+# the tty device directly with *os.open*(), *termios*, *os.read*() and
+# *os.write*() instead of going through pyserial.  MakerBus frames are
+# only 1 to 3 bytes long, so on small machines (e.g. a Raspberry Pi)
+# the per call overhead of pyserial is a measurable part of each
+# frame.  *Maker_Bus_Tty* provides the same part of the *Serial*
+# interface that *Maker_Bus_Base* uses, so it is simply handed to
+# *Maker_Bus_Base* in place of a device name:
+#
+#        maker_bus_base = Maker_Bus_Base(Maker_Bus_Tty("/dev/ttyAMA0"))
+#
+# It only works on POSIX systems.
+
+import errno
+import fcntl
+import os
+import select
+import struct
+import termios
+import time
+
+## @class Maker_Bus_Tty
+#
+# A tty opened and configured without pyserial.
+#
+# *Maker_Bus_Tty* puts the tty into raw 8N1 mode at *baud_rate* and
+# reads it in non-blocking mode, waiting with *poll*() (or *select*()
+# where *poll*() is missing).  Whatever bytes are available are read in
+# one call and kept in *input*, so that the one byte reads done by
+# *Maker_Bus_Base.frame_get*() are usually served without a system
+# call.  *timeout* is the read timeout in seconds (*None* waits for
+# ever), just like the *Serial* attribute of the same name.
+
+class Maker_Bus_Tty:
+
+    def __init__(self, device_name, baud_rate = 115200):
+        """ {Maker_Bus_Tty}: Initialize {self} to talk to the tty
+            {device_name} at {baud_rate} bits per second. """
+
+        assert isinstance(device_name, str)
+        speed_name = "B{0}".format(baud_rate)
+        assert hasattr(termios, speed_name), \
+          "Baud rate {0} is not supported".format(baud_rate)
+        speed = getattr(termios, speed_name)
+
+        fd = os.open(device_name, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+
+        # Raw mode, 8 data bits, no parity, 1 stop bit, no flow control:
+        try:
+            attributes = termios.tcgetattr(fd)
+            iflag, oflag, cflag, lflag, ispeed, ospeed, cc = attributes
+            iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK |
+              termios.ISTRIP | termios.INLCR | termios.IGNCR |
+              termios.ICRNL | termios.IXON | termios.IXOFF | termios.IXANY |
+              termios.INPCK)
+            oflag &= ~termios.OPOST
+            lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON |
+              termios.ISIG | termios.IEXTEN)
+            cflag &= ~(termios.CSIZE | termios.PARENB | termios.CSTOPB)
+            cflag |= termios.CS8 | termios.CREAD | termios.CLOCAL
+            if hasattr(termios, "CRTSCTS"):
+                cflag &= ~termios.CRTSCTS
+            cc = list(cc)
+            cc[termios.VMIN] = 0
+            cc[termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW,
+              [iflag, oflag, cflag, lflag, speed, speed, cc])
+            termios.tcflush(fd, termios.TCIOFLUSH)
+        except termios.error:
+            os.close(fd)
+            raise
+
+        self.device_name = device_name
+        self.fd = fd
+        self.input = bytearray()
+        self.poller = None
+        if hasattr(select, "poll"):
+            self.poller = select.poll()
+            self.poller.register(fd, select.POLLIN)
+        self.timeout = None
+
+    def close(self):
+        """ {Maker_Bus_Tty}: Close {self}. """
+
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def flush(self):
+        """ {Maker_Bus_Tty}: Wait until all of the output has been
+            transmitted, like the *Serial* method of the same name, so
+            that a read timeout does not start while a long request is
+            still going out at a low baud rate. """
+
+        termios.tcdrain(self.fd)
+
+    def flushInput(self):
+        """ {Maker_Bus_Tty}: Throw away any pending input. """
+
+        del self.input[:]
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    def inWaiting(self):
+        """ {Maker_Bus_Tty}: Return the number of bytes that can be read
+            without waiting. """
+
+        data = fcntl.ioctl(self.fd, termios.FIONREAD, struct.pack("I", 0))
+        return len(self.input) + struct.unpack("I", data)[0]
+
+    def input_wait(self, timeout):
+        """ {Maker_Bus_Tty}: Wait up to {timeout} seconds ({None} for
+            ever) for input and return {True} if there is some. """
+
+        poller = self.poller
+        try:
+            if poller != None:
+                if timeout != None:
+                    timeout = int(timeout * 1000.0 + 0.5)
+                return len(poller.poll(timeout)) != 0
+            readable, writable, exceptional = \
+              select.select([self.fd], [], [], timeout)
+            return len(readable) != 0
+        except (select.error, OSError) as error:
+            if error.args[0] != errno.EINTR:
+                raise
+        return False
+
+    def read(self, size = 1):
+        """ {Maker_Bus_Tty}: Return up to {size} bytes, waiting no more
+            than {timeout} seconds for them. """
+
+        input = self.input
+        timeout = self.timeout
+        end_time = None
+        if timeout != None:
+            end_time = time.time() + timeout
+        while len(input) < size:
+            # Grab everything that is available in one system call:
+            try:
+                data = os.read(self.fd, max(size, 256))
+            except OSError as error:
+                if error.errno != errno.EAGAIN:
+                    raise
+                data = ""
+            if len(data) != 0:
+                input += data
+                continue
+
+            # Nothing yet; wait for more:
+            remaining = None
+            if end_time != None:
+                remaining = end_time - time.time()
+                if remaining <= 0.0:
+                    break
+            self.input_wait(remaining)
+
+        data = bytes(input[0: size])
+        del input[0: size]
+        return data
+
+    def setTimeout(self, timeout):
+        """ {Maker_Bus_Tty}: Set the read timeout of {self}. """
+
+        self.timeout = timeout
+
+    def write(self, data):
+        """ {Maker_Bus_Tty}: Send {data} and return the number of bytes
+            sent. """
+
+        data = bytes(data)
+        fd = self.fd
+        offset = 0
+        size = len(data)
+        while offset < size:
+            try:
+                offset += os.write(fd, data[offset:])
+            except OSError as error:
+                if error.errno != errno.EAGAIN:
+                    raise
+                select.select([], [fd], [])
+        return size